@@ -0,0 +1,52 @@
+"""
+Benchmark DataCompressor on a synthetic image dataset.
+
+Compares compressing every file with storing the files that are already
+compressed (JPEGs here, simulated with random bytes) in the gzip archive.
+
+    python benchmarks/compression_policy_bench.py [number_of_images] [workers]
+"""
+from __future__ import print_function
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from floyd.client.files import DataCompressor
+
+IMAGE_SIZE = 256 * 1024
+
+
+def make_dataset(root, count):
+    os.makedirs(os.path.join(root, 'images'))
+    with open(os.path.join(root, 'labels.csv'), 'w') as labels:
+        for i in range(count):
+            with open(os.path.join(root, 'images', 'image_%d.jpg' % i), 'wb') as f:
+                f.write(os.urandom(IMAGE_SIZE))
+            labels.write('images/image_%d.jpg,%d\n' % (i, i % 10))
+
+
+def timed(label, source_dir, filename, workers, store_incompressible):
+    start = time.time()
+    DataCompressor(source_dir=source_dir, filename=filename, compress_workers=workers,
+                   store_incompressible=store_incompressible).create_tarfile()
+    elapsed = time.time() - start
+    print("%-16s %8.2fs %10d bytes" % (label, elapsed, os.path.getsize(filename)))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    temp_dir = tempfile.mkdtemp()
+    try:
+        source_dir = os.path.join(temp_dir, 'dataset')
+        make_dataset(source_dir, count)
+        timed('compress all', source_dir, os.path.join(temp_dir, 'all.tar.gz'), workers, False)
+        timed('store jpegs', source_dir, os.path.join(temp_dir, 'policy.tar.gz'), workers, True)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark DataCompressor on a synthetic tree of small files.
+
+Compares the single pass DataCompressor with the previous approach of
+counting the files with a full scandir crawl before tarfile.add walks the
+tree again. The scan only costs real time when directory metadata is not
+in the page cache, so run it on a cold cache (e.g. after
+`sync; echo 3 > /proc/sys/vm/drop_caches`) or on a network filesystem.
+
+    python benchmarks/data_compressor_bench.py [number_of_files]
+"""
+from __future__ import print_function
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+
+from floyd.client.files import DataCompressor, scandir
+
+FILES_PER_DIR = 1000
+
+
+def make_tree(root, count):
+    for i in range(count):
+        dir_path = os.path.join(root, 'shard_%d' % (i // FILES_PER_DIR))
+        if i % FILES_PER_DIR == 0:
+            os.makedirs(dir_path)
+        with open(os.path.join(dir_path, 'file_%d.txt' % i), 'w') as f:
+            f.write('sample %d\n' % i)
+
+
+def precount_then_tar(source_dir, filename):
+    files_to_compress = 0
+    paths = [source_dir]
+    while paths:
+        for item in scandir(paths.pop()):
+            if item.is_dir():
+                paths.append(item.path)
+            files_to_compress += 1
+    with tarfile.open(filename, "w:gz") as tar:
+        tar.add(source_dir, arcname=os.path.basename(source_dir))
+    return files_to_compress
+
+
+def single_pass(source_dir, filename):
+    DataCompressor(source_dir=source_dir, filename=filename).create_tarfile()
+
+
+def timed(label, func, *args):
+    start = time.time()
+    func(*args)
+    elapsed = time.time() - start
+    print("%-32s %8.2fs" % (label, elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    temp_dir = tempfile.mkdtemp()
+    try:
+        source_dir = os.path.join(temp_dir, 'dataset')
+        print("Creating %d files in %s ..." % (count, source_dir))
+        make_tree(source_dir, count)
+
+        timed("pre-count scan + tarfile.add", precount_then_tar, source_dir, os.path.join(temp_dir, 'a.tar.gz'))
+        # Keep the progress bar output out of the results
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            start = time.time()
+            single_pass(source_dir, os.path.join(temp_dir, 'b.tar.gz'))
+            elapsed = time.time() - start
+        finally:
+            sys.stdout = stdout
+        print("%-32s %8.2fs" % ("single pass DataCompressor", elapsed))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark single-stream downloads from a local HTTP server.
+
+Compares FloydHttpClient.download, reading adaptive chunks into a buffered
+writer with progress shown from a timer, with the previous loop over 1 KiB
+chunks that wrote and updated the progress bar for every chunk. The server
+doesn't advertise byte ranges, so both read one stream.
+
+    python benchmarks/download_bench.py [size_in_mib ...]
+"""
+from __future__ import print_function
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import requests
+from clint.textui import progress
+from mock import patch
+
+# The stand-in server lives with the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from floyd.client.base import FloydHttpClient  # noqa: E402
+from tests.client.stand_in_server import StandInServer  # noqa: E402
+
+
+class PayloadBody(object):
+    """
+    size bytes repeating a random block, generated as they are sent
+    """
+
+    def __init__(self, size, block=os.urandom(1024 * 1024)):
+        self.remaining = size
+        self.block = block
+
+    def read(self, size):
+        size = min(size, self.remaining, len(self.block))
+        self.remaining -= size
+        return self.block[:size]
+
+
+class PayloadStandIn(StandInServer):
+    def __init__(self, size):
+        super(PayloadStandIn, self).__init__()
+        self.size = size
+
+    def handle(self, request):
+        return 200, {'Content-Length': str(self.size)}, PayloadBody(self.size)
+
+
+def download_before(url, filename):
+    response = requests.get(url, timeout=5, stream=True)
+    content_length = response.headers.get('content-length')
+    with open(filename, 'wb') as f:
+        for chunk in progress.bar(response.iter_content(chunk_size=1024),
+                                  expected_size=(int(content_length) / 1024) + 1):
+            if chunk:
+                f.write(chunk)
+
+
+def download_after(url, filename):
+    FloydHttpClient().download(url, filename=filename)
+
+
+def timed(label, download, size, filename):
+    with PayloadStandIn(size) as stand_in:
+        start = time.time()
+        download(stand_in.url + '/output.tar', filename)
+        elapsed = time.time() - start
+    assert os.path.getsize(filename) == size
+    os.remove(filename)
+    print("%-8s %6d MiB %8.2fs %8.1f MB/s" % (label, size // 1024 // 1024, elapsed, size / elapsed / 1000 / 1000))
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [1024, 10240]
+    temp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(temp_dir, 'output.tar')
+        with patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'):
+            for size in sizes:
+                timed('before', download_before, size * 1024 * 1024, filename)
+                timed('after', download_after, size * 1024 * 1024, filename)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
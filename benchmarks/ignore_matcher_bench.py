@@ -0,0 +1,49 @@
+"""
+Benchmark .floydignore matching on synthetic paths.
+
+Compares the per-path PurePath.match loop (matches_glob_list) with the
+compiled FloydIgnoreMatcher.
+
+    python benchmarks/ignore_matcher_bench.py [number_of_paths]
+"""
+from __future__ import print_function
+import sys
+import time
+
+from floyd.client.files import ignore_path
+from floyd.constants import DEFAULT_FLOYD_IGNORE_LIST
+from floyd.manager.floyd_ignore import FloydIgnoreMatcher
+
+IGNORE_LIST = [line for line in DEFAULT_FLOYD_IGNORE_LIST.splitlines()
+               if line and not line.startswith('#')] + ['checkpoints/*.ckpt', 'data', '*.[oa]']
+WHITELIST = ['keep.pyc', 'lib/vendor.py']
+EXTENSIONS = ['py', 'pyc', 'txt', 'ckpt', 'json', 'o', 'swp', 'md']
+
+
+def synthetic_paths(count):
+    for i in range(count):
+        yield './src/module_%d/sub_%d/%s/file_%d.%s' % (
+            i % 97, i % 13, 'checkpoints' if i % 7 == 0 else 'pkg', i, EXTENSIONS[i % len(EXTENSIONS)])
+
+
+def timed(label, func, paths):
+    start = time.time()
+    ignored = sum(1 for path in paths if func(path))
+    elapsed = time.time() - start
+    print("%-28s %8.2fs  %10.0f paths/s  (%d ignored)" % (label, elapsed, len(paths) / elapsed, ignored))
+    return ignored
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    paths = list(synthetic_paths(count))
+    print("%d paths, %d ignore globs, %d whitelist globs" % (count, len(IGNORE_LIST), len(WHITELIST)))
+
+    matcher = FloydIgnoreMatcher(IGNORE_LIST, WHITELIST)
+    compiled = timed("FloydIgnoreMatcher", matcher.ignores, paths)
+    loop = timed("PurePath.match loop", lambda path: ignore_path(path, IGNORE_LIST, WHITELIST), paths)
+    assert compiled == loop
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark TUS uploads from a slow disk against a local TUS stand-in server.
+
+Both the disk and the network are throttled, the network with some noise.
+Compares resume_upload with read-ahead, where the next block is read while
+chunks of the current one are sent, with reading every chunk right before
+its PATCH. Both are run with a fixed chunk size and with the default
+adaptive chunk size, whose size changes after every chunk. The bytes read
+from disk per byte uploaded show any read ahead that is thrown away.
+
+    python benchmarks/read_ahead_bench.py [size_in_mib] [disk_mib_per_s] [network_mib_per_s]
+"""
+from __future__ import print_function
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from mock import patch
+
+# The TUS stand-in lives with the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from floyd.client.files import ReadAheadReader  # noqa: E402
+from floyd.client.tus_data import TusDataClient  # noqa: E402
+from tests.client.tus_stand_in import TusStandIn  # noqa: E402
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class SlowDiskReader(ReadAheadReader):
+    disk_speed = None
+    bytes_read = 0
+
+    def _read_into(self, index, offset):
+        count = ReadAheadReader._read_into(self, index, offset)
+        SlowDiskReader.bytes_read += count
+        time.sleep(float(count) / self.disk_speed)
+        return count
+
+
+class SerialSlowDiskReader(SlowDiskReader):
+    """
+    Reads each chunk only when it is requested, like the previous
+    f.seek(offset); f.read(chunk_size)
+    """
+    def read(self, offset, size):
+        self._file.seek(offset)
+        data = self._file.read(size)
+        SlowDiskReader.bytes_read += len(data)
+        time.sleep(float(len(data)) / self.disk_speed)
+        return memoryview(data)
+
+
+class SlowTusStandIn(TusStandIn):
+    network_speed = None
+
+    def handle(self, request):
+        if request.method == 'PATCH':
+            # Within 50% of the network speed, like a busy link
+            time.sleep(float(len(request.body)) / self.network_speed * random.uniform(0.5, 1.5))
+        return TusStandIn.handle(self, request)
+
+
+def timed(label, reader_class, file_path, chunk_size=None):
+    SlowDiskReader.bytes_read = 0
+    with patch('floyd.client.tus_data.ReadAheadReader', reader_class), SlowTusStandIn() as tus_stand_in:
+        client = TusDataClient(base_url=tus_stand_in.url + '/files/')
+        endpoint = client.initialize_upload(file_path)
+        start = time.time()
+        client.resume_upload(file_path, endpoint, chunk_size=chunk_size)
+        elapsed = time.time() - start
+    size = os.path.getsize(file_path)
+    print("%-12s %-9s %8.2fs %8.1f MiB/s %6.2f read/sent" % (
+        label, 'fixed' if chunk_size else 'adaptive', elapsed, size / elapsed / 1024 / 1024,
+        float(SlowDiskReader.bytes_read) / size))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    SlowDiskReader.disk_speed = (float(sys.argv[2]) if len(sys.argv) > 2 else 100) * 1024 * 1024
+    SlowTusStandIn.network_speed = (float(sys.argv[3]) if len(sys.argv) > 3 else 100) * 1024 * 1024
+    temp_dir = tempfile.mkdtemp()
+    try:
+        file_path = os.path.join(temp_dir, 'floydhub_data.tar.gz')
+        with open(file_path, 'wb') as f:
+            for _ in range(size):
+                f.write(os.urandom(1024 * 1024))
+
+        with patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'):
+            for chunk_size in [CHUNK_SIZE, None]:
+                timed('serial', SerialSlowDiskReader, file_path, chunk_size)
+                timed('read-ahead', SlowDiskReader, file_path, chunk_size)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark TUS uploads against a local TUS stand-in server.
+
+Compares TusDataClient on its pooled keep-alive session with the previous
+per-request requests.post/head/patch calls, and reports the throughput and
+the number of connections the server accepted. On a real upload server
+every new connection also pays a TLS handshake.
+
+    python benchmarks/tus_upload_bench.py [size_in_mib] [chunk_size_in_kib]
+"""
+from __future__ import print_function
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import requests
+from mock import patch
+
+# The TUS stand-in lives with the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from floyd.client.tus_data import TusDataClient  # noqa: E402
+from tests.client.tus_stand_in import TusStandIn  # noqa: E402
+
+
+class PerRequestTusDataClient(TusDataClient):
+    # Module level functions open a new connection for every request
+    session = requests
+
+
+def timed(label, client_class, file_path, chunk_size):
+    with TusStandIn() as tus_stand_in:
+        client = client_class(chunk_size=chunk_size, base_url=tus_stand_in.url + '/files/')
+        start = time.time()
+        endpoint = client.initialize_upload(file_path)
+        client.resume_upload(file_path, endpoint)
+        elapsed = time.time() - start
+    size = os.path.getsize(file_path)
+    print("%-12s %8.2fs %8.1f MiB/s %6d requests %6d connections" % (
+        label, elapsed, size / elapsed / 1024 / 1024, len(tus_stand_in.requests), tus_stand_in.connections))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    chunk_size = (int(sys.argv[2]) if len(sys.argv) > 2 else 1024) * 1024
+    temp_dir = tempfile.mkdtemp()
+    try:
+        file_path = os.path.join(temp_dir, 'floydhub_data.tar.gz')
+        with open(file_path, 'wb') as f:
+            for _ in range(size):
+                f.write(os.urandom(1024 * 1024))
+
+        with patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'):
+            timed('per-request', PerRequestTusDataClient, file_path, chunk_size)
+            timed('session', TusDataClient, file_path, chunk_size)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
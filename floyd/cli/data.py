@@ -9,8 +9,10 @@ import floyd
 from floyd.client.experiment import ExperimentClient
 from floyd.client.data import DataClient
 from floyd.client.dataset import DatasetClient
+from floyd.client.files import ARCHIVE_CODECS, sizeof_fmt
 from floyd.exceptions import FloydException
 from floyd.manager.auth_config import AuthConfigManager
+from floyd.manager.clone_cache import CloneCacheManager
 from floyd.manager.data_config import DataConfig, DataConfigManager
 from floyd.log import logger as floyd_logger
 from floyd.cli.data_upload_utils import (
@@ -18,6 +20,8 @@ from floyd.cli.data_upload_utils import (
     initialize_new_upload, complete_upload
 )
 from floyd.cli.utils import (
+    clone_resource,
+    parse_size,
     normalize_data_name,
     normalize_job_name,
     get_namespace_from_name
@@ -79,16 +83,67 @@ def init(dataset_name):
               is_flag=True, default=False, help='Resume previous upload')
 @click.option('--message', '-m', default='',
               help='Job commit message')
-def upload(resume, message):
+@click.option('--compress-workers', type=click.IntRange(min=1), default=None,
+              help='Number of threads compressing the data (default: number of CPUs)')
+@click.option('--stream', is_flag=True, default=False,
+              help='Upload the data while it is compressed, without a temporary tarball '
+                   '(cannot be resumed)')
+@click.option('--upload-parts', type=click.IntRange(min=1), default=1,
+              help='Split the upload in this many parts sent concurrently')
+@click.option('--codec', type=click.Choice(['auto'] + list(ARCHIVE_CODECS)), default='gzip',
+              help='Compression of the uploaded archive. auto samples the data and picks '
+                   'the fastest codec for your upload bandwidth')
+@click.option('--include', multiple=True,
+              help='Only upload the files matching this glob (can be repeated)')
+@click.option('--exclude', multiple=True,
+              help='Do not upload the paths matching this glob, in addition to '
+                   'the ones of .floydignore (can be repeated)')
+@click.option('--delta', is_flag=True, default=False,
+              help='Only upload the files changed since the last upload of the dataset, '
+                   'the new version is built from the previous one')
+@click.option('--shards', type=click.IntRange(min=1), default=1,
+              help='Split the data in this many archives of about the same size, uploaded '
+                   'concurrently and unpacked concurrently by the server')
+@click.option('--archive', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Upload this tar, tar.gz, tar.zst or tar.lz4 archive as is, instead of '
+                   'the files in the current dir')
+@click.option('--stdin', is_flag=True, default=False,
+              help='Upload the archive piped to the standard input as is (cannot be resumed)')
+def upload(resume, message, compress_workers, stream, upload_parts, codec, include, exclude, delta, shards,
+           archive, stdin):
     """
     Upload files in the current dir to FloydHub.
+
+    Paths matching the globs of a .floydignore file in the current dir are
+    left out, like for the code of a run.
+
+    An existing archive can be uploaded without compressing it again, e.g.
+
+        tar -cz images | floyd data upload --stdin
     """
+    if stream and upload_parts > 1:
+        sys.exit("--stream and --upload-parts cannot be used together.")
+    if stream and delta:
+        sys.exit("--stream and --delta cannot be used together.")
+    if shards > 1 and (stream or upload_parts > 1):
+        sys.exit("--shards cannot be used with --stream or --upload-parts.")
+    if (archive or stdin) and (stream or delta or shards > 1 or include or exclude):
+        sys.exit("--archive and --stdin cannot be used with --stream, --delta, --shards, "
+                 "--include or --exclude.")
+    if stdin and (archive or upload_parts > 1 or resume):
+        sys.exit("--stdin cannot be used with --archive, --upload-parts or --resume.")
+
     data_config = DataConfigManager.get_config()
 
-    if not upload_is_resumable(data_config) or not opt_to_resume(resume):
+    # The resume prompt can't read its answer from a piped archive
+    if stdin or not upload_is_resumable(data_config) or not opt_to_resume(resume):
         abort_previous_upload(data_config)
         access_token = AuthConfigManager.get_access_token()
-        initialize_new_upload(data_config, access_token, message)
+        initialize_new_upload(data_config, access_token, message,
+                              compress_workers=compress_workers, stream=stream,
+                              upload_parts=upload_parts, codec=codec,
+                              include=list(include), exclude=list(exclude), delta=delta,
+                              shards=shards, archive=archive, stdin=stdin)
 
     complete_upload(data_config)
 
@@ -145,7 +200,11 @@ def print_data(data_sources):
 @click.argument('id', nargs=1)
 @click.option('--path', '-p',
               help='Download files in a specific path from job output or a dataset')
-def clone(id, path):
+@click.option('--no-cache', is_flag=True, default=False,
+              help='Download the files even if they are in the local clone cache')
+@click.option('--resumable', is_flag=True, default=False,
+              help='Save large downloads to disk before extracting them, so an interrupted clone can be resumed')
+def clone(id, path, no_cache, resumable):
     """
     - Download all files in a dataset or from a Job output
 
@@ -161,6 +220,8 @@ def clone(id, path):
     Specify the path to a directory and download all its files and subdirectories.
 
     Eg: --path models/checkpoint1
+
+    Full clones are kept in a local cache, see "floyd data cache".
     """
     data_source = get_data_object(id, use_data_config=False)
 
@@ -191,6 +252,9 @@ def clone(id, path):
         # Download the full Dataset
         data_url = "{}/api/v1/resources/{}?content=true&download=true".format(floyd.floyd_host,
                                                                               data_source.resource_id)
+        clone_resource(DataClient(), data_source.resource_id, data_url, use_cache=not no_cache,
+                       size=parse_size(data_source.size), resumable=resumable)
+        return
     DataClient().download_tar(url=data_url,
                               untar=True,
                               delete_after_untar=True)
@@ -331,6 +395,39 @@ def add(source):
     print_data([DataClient().get(new_data['data_id'])])
 
 
+@click.command()
+@click.option('--max-size', type=float, default=None,
+              help='Maximum size of the cache in GiB, 0 disables it')
+@click.option('--clear', is_flag=True, default=False,
+              help='Remove everything from the cache')
+def cache(max_size, clear):
+    """
+    Manage the local cache of cloned datasets, job outputs and job code.
+
+    Cloning a cached dataset version or job links or copies its files from
+    ~/.floyd/cache instead of downloading them again. The least recently
+    cloned ones are removed when the cache is full.
+
+    Files hardlinked from the cache share their content with it, so they
+    are read-only: copy a file before changing it, or clone with --no-cache
+    to get files of your own.
+    """
+    if max_size is not None:
+        if max_size < 0:
+            sys.exit("The cache size cannot be negative.")
+        CloneCacheManager.set_max_size(int(max_size * 1024 * 1024 * 1024))
+    if clear:
+        CloneCacheManager.clear()
+
+    entries = sorted(CloneCacheManager.entries(), key=lambda entry: entry[2], reverse=True)
+    floyd_logger.info("Cache: %s of %s in %s", sizeof_fmt(sum(size for _, size, _ in entries)),
+                      sizeof_fmt(CloneCacheManager.get_max_size()), CloneCacheManager.CACHE_DIR)
+    if entries:
+        floyd_logger.info(tabulate([[resource_id, sizeof_fmt(size)] for resource_id, size, _ in entries],
+                                   headers=["RESOURCE ID", "SIZE"]))
+
+
+data.add_command(cache)
 data.add_command(clone)
 data.add_command(delete)
 data.add_command(init)
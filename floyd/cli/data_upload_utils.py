@@ -3,21 +3,32 @@ import os
 import sys
 from tabulate import tabulate
 import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
 from shutil import rmtree
-from clint.textui.progress import dots, STREAM as clint_STREAM
+from clint.textui.progress import dots, Bar as ProgressBar, STREAM as clint_STREAM
 
-from floyd.exceptions import WaitTimeoutException
+from floyd.exceptions import FloydException, WaitTimeoutException
 from floyd.client.data import DataClient
 from floyd.client.resource import ResourceClient
-from floyd.client.files import sizeof_fmt, DataCompressor
+from floyd.client.files import (
+    sizeof_fmt, build_file_manifest, DataCompressor, RingBuffer, choose_archive_codec, get_archive_codec,
+    detect_archive_codec, PrefixedReader, ARCHIVE_HEADER_SIZE
+)
 from floyd.client.tus_data import TusDataClient
 from floyd.log import logger as floyd_logger
 from floyd.manager.data_config import DataConfigManager
+from floyd.manager.data_manifest import DataManifestManager
+from floyd.manager.floyd_ignore import FloydIgnoreManager, FloydIgnoreMatcher
 from floyd.model.data import DataRequest
 from floyd.cli.utils import normalize_data_name
 
 
 MAX_UPLOAD_SIZE = 1024 * 1024 * 1024 * 100  # bytes = 100 GiB
+# Size of the streaming ring buffer, in upload chunks
+STREAM_BUFFER_CHUNKS = 2
+# Number of shards of a sharded upload sent at the same time
+SHARD_UPLOAD_WORKERS = 4
 
 
 class ResourceWaitIter(object):
@@ -45,44 +56,175 @@ def upload_is_resumable(data_config):
     return (
         (data_config.resource_id or "") or  # noqa: W504
         (os.path.isfile(data_config.tarball_path or "") and  # noqa: W504
-         data_config.data_endpoint)
+         (data_config.data_endpoint or data_config.upload_parts or data_config.upload_shards))
     )
 
 
-def initialize_new_upload(data_config, access_token, description=None, source_dir='.'):
+def get_codec(codec_name, data_config, source_dir='.', compress_workers=None, pipelined=False):
+    """
+    Returns the ArchiveCodec called codec_name. "auto" picks the one that
+    should be the fastest for the data and the last measured bandwidth.
+    """
+    if codec_name == 'auto':
+        codec = choose_archive_codec(source_dir,
+                                     bandwidth=data_config.upload_bandwidth,
+                                     workers=compress_workers,
+                                     pipelined=pipelined)
+        floyd_logger.info("Compressing data with %s", codec.name)
+        return codec
+
+    try:
+        return get_archive_codec(codec_name)
+    except FloydException as e:
+        sys.exit(e.message)
+
+
+def get_ignore_matcher(source_dir='.', exclude=None):
+    """
+    Returns the FloydIgnoreMatcher of the .floydignore file in source_dir
+    with the exclude globs added to its ignore list
+    """
+    matcher = FloydIgnoreManager.get_lists(os.path.join(source_dir, '.floydignore'))
+    if exclude:
+        matcher = FloydIgnoreMatcher(matcher.ignore_list + list(exclude), matcher.whitelist)
+    return matcher
+
+
+def prepare_delta(data_config, data_compressor):
+    """
+    Restrict data_compressor to the files added or modified since the last
+    uploaded version of the dataset, and save the manifest of the new
+    version as pending.
+
+    Returns the (resource id of the last version, deleted paths), or
+    (None, None) if there is no known version to build on.
+    """
+    base_resource_id, previous_files = DataManifestManager.get_manifest(data_config.family_id)
+
+    floyd_logger.info("Hashing data...")
+    files = build_file_manifest(data_compressor.list_files(), previous_files,
+                                root=data_compressor.source_dir)
+    DataManifestManager.set_pending_manifest(data_config.family_id, files)
+
+    if not base_resource_id:
+        floyd_logger.info("No previous upload of this dataset found, uploading all the files.")
+        return None, None
+
+    changed = set(path for path, entry in files.items()
+                  if previous_files.get(path, {}).get('sha256') != entry['sha256'])
+    deleted = sorted(set(previous_files) - set(files))
+    floyd_logger.info("Uploading %s added or modified files, %s deleted, %s unchanged.",
+                      len(changed), len(deleted), len(files) - len(changed))
+    data_compressor.only_files = changed
+    return base_resource_id, deleted
+
+
+def get_archive_file_codec(archive_path):
+    """
+    Returns the ArchiveCodec of the archive at archive_path, after checking
+    its header
+    """
+    try:
+        with open(archive_path, 'rb') as archive:
+            return detect_archive_codec(archive.read(ARCHIVE_HEADER_SIZE))
+    except (IOError, OSError) as e:
+        sys.exit("Cannot read %s: %s" % (archive_path, e.strerror))
+    except FloydException as e:
+        sys.exit("%s: %s" % (archive_path, e.message))
+
+
+def remove_tarball(data_config):
+    """
+    Remove the temporary directory of the tarball, unless the tarball is an
+    archive given by the user
+    """
+    if not data_config.tarball_path or data_config.keep_tarball:
+        return
+    try:
+        floyd_logger.info("Removing compressed data...")
+        rmtree(os.path.dirname(data_config.tarball_path))
+    except (OSError, TypeError):
+        pass
+
+
+def tarball_changed(data_config):
+    """
+    Whether the tarball was removed, or its size or modification time
+    changed, since the upload started
+    """
+    if data_config.tarball_size is None:
+        return False
+    try:
+        tarball_stat = os.stat(data_config.tarball_path)
+    except OSError:
+        return True
+    return (tarball_stat.st_size, tarball_stat.st_mtime) != (data_config.tarball_size, data_config.tarball_mtime)
+
+
+def initialize_new_upload(data_config, access_token, description=None, source_dir='.', compress_workers=None,
+                          stream=False, upload_parts=1, codec='gzip', include=None, exclude=None,
+                          delta=False, shards=1, archive=None, stdin=False):
+    """
+    Start a new upload of the data in source_dir. With archive, the tar
+    archive at this path is uploaded as is instead, and with stdin, the one
+    read from the standard input.
+    """
     # TODO: hit upload server to check for liveness before moving on
     data_config.set_tarball_path(None)
     data_config.set_data_endpoint(None)
     data_config.set_resource_id(None)
+    data_config.set_upload_parts(None)
+    data_config.set_tarball_sha256(None)
+    data_config.set_tarball_stat(None, None)
+    data_config.set_upload_shards(None)
+    data_config.set_keep_tarball(None)
+    DataManifestManager.discard_pending_manifest(data_config.family_id)
 
     namespace = data_config.namespace or access_token.username
     data_name = "{}/{}".format(namespace, data_config.name)
 
-    # Create tarball of the data using the ID returned from the API
-    # TODO: allow to the users to change directory for the compression
-    temp_dir = tempfile.mkdtemp()
-    tarball_path = os.path.join(temp_dir, "floydhub_data.tar.gz")
-
-    floyd_logger.debug("Creating tarfile with contents of current directory: %s",
-                       tarball_path)
+    if stdin:
+        # Python 3 reads bytes from the buffer of the text stream
+        stream_archive_upload(data_config, data_name, description, getattr(sys.stdin, 'buffer', sys.stdin))
+        return
+
+    if archive:
+        codec = get_archive_file_codec(archive)
+        tarball_path = os.path.abspath(archive)
+        upload_shards, base_resource_id, deleted_paths = [], None, None
+        data_config.set_keep_tarball(True)
+    else:
+        codec = get_codec(codec, data_config, source_dir, compress_workers, pipelined=stream)
+        ignore_matcher = get_ignore_matcher(source_dir, exclude)
+
+        if stream:
+            stream_new_upload(data_config, data_name, description, source_dir, compress_workers, codec,
+                              ignore_matcher=ignore_matcher, include=include)
+            return
 
-    data_compressor = DataCompressor(source_dir=source_dir, filename=tarball_path)
-    # TODO: purge tarball on Ctrl-C
-    data_compressor.create_tarfile()
+        tarball_path, upload_shards, base_resource_id, deleted_paths = compress_new_upload(
+            data_config, source_dir, compress_workers, codec, ignore_matcher, include, delta, shards)
 
     # If starting a new upload fails for some reason down the line, we don't
     # want to re-tar, so save off the tarball path now
     data_config.set_tarball_path(tarball_path)
+    data_config.set_upload_shards(upload_shards or None)
+    if not upload_shards:
+        # Shards are compressed later, and each one is checked on its own
+        tarball_stat = os.stat(tarball_path)
+        data_config.set_tarball_stat(tarball_stat.st_size, tarball_stat.st_mtime)
     DataConfigManager.set_config(data_config)
 
     # Create data object using API
     data = DataRequest(name=data_name,
                        description=description,
                        family_id=data_config.family_id,
-                       data_type='gzip')
+                       data_type=codec.data_type,
+                       base_resource_id=base_resource_id,
+                       deleted_paths=deleted_paths)
     data_info = DataClient().create(data)
     if not data_info:
-        rmtree(temp_dir)
+        remove_tarball(data_config)
         sys.exit(1)
 
     data_config.set_data_id(data_info['id'])
@@ -93,9 +235,25 @@ def initialize_new_upload(data_config, access_token, description=None, source_di
     creds = DataClient().new_tus_credentials(data_info['id'])
     if not creds:
         # TODO: delete module from server?
-        rmtree(temp_dir)
+        remove_tarball(data_config)
         sys.exit(1)
 
+    if upload_shards:
+        # Compressed and sent by complete_upload
+        return
+
+    if upload_parts > 1:
+        # The final upload is created from the parts once they are all sent
+        parts = TusDataClient().initialize_parallel_upload(tarball_path, upload_parts, auth=creds)
+        if not parts:
+            floyd_logger.error("Failed to get upload URLs from Floydhub!")
+            remove_tarball(data_config)
+            sys.exit(1)
+
+        data_config.set_upload_parts(parts)
+        DataConfigManager.set_config(data_config)
+        return
+
     data_resource_id = creds[0]
     data_endpoint = TusDataClient().initialize_upload(
         tarball_path,
@@ -104,13 +262,305 @@ def initialize_new_upload(data_config, access_token, description=None, source_di
     if not data_endpoint:
         # TODO: delete module from server?
         floyd_logger.error("Failed to get upload URL from Floydhub!")
-        rmtree(temp_dir)
+        remove_tarball(data_config)
         sys.exit(1)
 
     data_config.set_data_endpoint(data_endpoint)
     DataConfigManager.set_config(data_config)
 
 
+def compress_new_upload(data_config, source_dir, compress_workers, codec, ignore_matcher, include,
+                        delta=False, shards=1):
+    """
+    Compress the data in a temporary directory. Returns the path of the
+    tarball, the shards of a sharded upload, and the (resource id of the
+    last version, deleted paths) of a delta upload.
+
+    The shards are only planned, each with its own list of files, and
+    compressed later by compress_and_upload_shards. The path returned is
+    the one of the first shard.
+    """
+    # Create tarball of the data using the ID returned from the API
+    # TODO: allow to the users to change directory for the compression
+    temp_dir = tempfile.mkdtemp()
+    tarball_path = os.path.join(temp_dir, "floydhub_data" + codec.extension)
+
+    floyd_logger.debug("Creating tarfile with contents of current directory: %s",
+                       tarball_path)
+
+    data_compressor = DataCompressor(source_dir=source_dir,
+                                     filename=tarball_path,
+                                     compress_workers=compress_workers,
+                                     codec=codec,
+                                     ignore_matcher=ignore_matcher,
+                                     include=include)
+    base_resource_id, deleted_paths = None, None
+    if delta:
+        base_resource_id, deleted_paths = prepare_delta(data_config, data_compressor)
+
+    upload_shards = []
+    if shards > 1:
+        # Reuses the walk of prepare_delta, if any
+        shard_files = data_compressor.plan_shards(shards)
+        # The first shard also holds the directories, so empty ones are kept,
+        # and the symlinks and other entries that aren't regular files
+        shard_files[0] = shard_files[0] | set(data_compressor.list_dirs()) | set(
+            data_compressor.list_other_entries())
+        for index, files in enumerate(shard_files):
+            upload_shards.append({"file_path": os.path.join(temp_dir, "floydhub_data_%s%s" % (index, codec.extension)),
+                                  "files": sorted(files),
+                                  "source_dir": os.path.abspath(source_dir),
+                                  "codec": codec.name,
+                                  "compress_workers": compress_workers})
+        # All the shards are in temp_dir, which is removed along the tarball
+        tarball_path = upload_shards[0]["file_path"]
+    else:
+        # TODO: purge tarball on Ctrl-C
+        data_compressor.create_tarfile()
+        data_config.set_tarball_sha256(data_compressor.sha256)
+
+    return tarball_path, upload_shards, base_resource_id, deleted_paths
+
+
+def compress_and_upload_shards(data_config, creds):
+    """
+    Compress the shards of a sharded upload that aren't yet, one after
+    another, each one starting to upload on a pool of SHARD_UPLOAD_WORKERS
+    threads as soon as it is compressed.
+
+    Every shard is saved as soon as its upload is created, so an
+    interrupted upload resumes from the first shard not compressed, and
+    sharded_upload resends the unfinished ones.
+    """
+    tus_client = TusDataClient()
+    lock = threading.Lock()
+    upload_shards = data_config.upload_shards
+    # Shown once every shard is compressed
+    progress_bars = []
+
+    def save_offset(index, offset):
+        with lock:
+            upload_shards[index]["offset"] = offset
+            DataConfigManager.set_config(data_config)
+            if progress_bars:
+                progress_bars[0].show(sum(shard["offset"] for shard in upload_shards))
+
+    pool = ThreadPool(SHARD_UPLOAD_WORKERS)
+    try:
+        results = []
+        for index, pending_shard in enumerate(upload_shards):
+            if "endpoint" in pending_shard:
+                continue
+            floyd_logger.info("Shard %s of %s", index + 1, len(upload_shards))
+            shard_compressor = DataCompressor(source_dir=pending_shard["source_dir"],
+                                              filename=pending_shard["file_path"],
+                                              compress_workers=pending_shard["compress_workers"],
+                                              codec=get_archive_codec(pending_shard["codec"]),
+                                              files=set(pending_shard["files"]),
+                                              keep_dir=True)
+            shard_compressor.create_tarfile()
+            if os.path.getsize(shard_compressor.filename) > MAX_UPLOAD_SIZE:
+                remove_tarball(data_config)
+                sys.exit(("Data size too large to upload, please keep it under %s.\n") %
+                         (sizeof_fmt(MAX_UPLOAD_SIZE)))
+
+            shard = tus_client.initialize_shard(shard_compressor.filename, index, len(upload_shards),
+                                                metadata={"filename": creds[0]}, auth=creds)
+            if not shard:
+                floyd_logger.error("Failed to get upload URLs from Floydhub!")
+                remove_tarball(data_config)
+                sys.exit(1)
+
+            shard["sha256"] = shard_compressor.sha256
+            with lock:
+                upload_shards[index] = shard
+                DataConfigManager.set_config(data_config)
+            results.append(pool.apply_async(tus_client.upload_part, (shard, index),
+                                            dict(auth=creds, on_progress=save_offset)))
+
+        if results:
+            floyd_logger.info("Uploading compressed data...")
+            with lock:
+                progress_bars.append(ProgressBar(filled_char="=", expected_size=max(
+                    sum(shard["length"] for shard in upload_shards), 1)))
+                progress_bars[0].show(sum(shard["offset"] for shard in upload_shards))
+            # Failed shards are resent by sharded_upload
+            for result in results:
+                result.get()
+            progress_bars[0].done()
+    except BaseException:
+        # Stop sending the shards of an abandoned upload
+        pool.terminate()
+        raise
+    finally:
+        pool.close()
+        pool.join()
+
+
+def parallel_upload(data_config, creds):
+    """
+    Send the parts of a parallel upload and concatenate them. The offset of
+    every part is saved as it progresses, so "floyd data upload -r" only
+    resends the unfinished parts.
+    """
+    tus_client = TusDataClient()
+    upload_parts = data_config.upload_parts
+
+    def save_offset(index, offset):
+        upload_parts[index]["offset"] = offset
+        DataConfigManager.set_config(data_config)
+
+    if not tus_client.parallel_upload(data_config.tarball_path, upload_parts,
+                                      auth=creds, on_progress=save_offset):
+        return False
+
+    data_endpoint = tus_client.concatenate_uploads([part["endpoint"] for part in upload_parts],
+                                                   metadata={"filename": creds[0]},
+                                                   auth=creds)
+    return bool(data_endpoint)
+
+
+def sharded_upload(data_config, creds):
+    """
+    Send the shards of a sharded upload concurrently, then the shard
+    manifest so the server unpacks them concurrently. The offset of every
+    shard is saved as it progresses, so "floyd data upload -r" only resends
+    the unfinished shards.
+    """
+    tus_client = TusDataClient()
+    upload_shards = data_config.upload_shards
+
+    def save_offset(index, offset):
+        upload_shards[index]["offset"] = offset
+        DataConfigManager.set_config(data_config)
+
+    if not tus_client.parallel_upload(None, upload_shards, auth=creds, on_progress=save_offset,
+                                      workers=SHARD_UPLOAD_WORKERS):
+        return False
+
+    return DataClient().create_shard_manifest(data_config.data_id, [
+        {"index": index, "endpoint": shard["endpoint"], "size": shard["length"], "sha256": shard["sha256"]}
+        for index, shard in enumerate(upload_shards)])
+
+
+def stream_new_upload(data_config, data_name, description=None, source_dir='.', compress_workers=None,
+                      codec=None, ignore_matcher=None, include=None):
+    """
+    Compress the data straight into a deferred-length upload, without
+    writing a temporary tarball. Memory use is bounded by the ring buffer
+    between the compressor and the uploader plus the uploader's spill window.
+    """
+    tus_client, data_id, creds, data_endpoint = start_stream_upload(
+        data_config, data_name, description, codec.data_type if codec else 'gzip')
+
+    ring_buffer = RingBuffer(STREAM_BUFFER_CHUNKS * tus_client.chunk_size)
+    upload_result = []
+
+    def upload():
+        try:
+            upload_result.append(tus_client.stream_upload(ring_buffer, data_endpoint,
+                                                          auth=creds, max_size=MAX_UPLOAD_SIZE))
+        except FloydException:
+            # The compressor aborted the stream and reports its own error
+            upload_result.append(False)
+        if not upload_result[0]:
+            # Unblock the compressor if it is waiting on a full buffer
+            ring_buffer.abort(FloydException("Data upload failed."))
+
+    uploader = threading.Thread(target=upload)
+    uploader.daemon = True
+    uploader.start()
+
+    floyd_logger.info("Compressing and uploading data...")
+    data_compressor = DataCompressor(source_dir=source_dir,
+                                     fileobj=ring_buffer,
+                                     compress_workers=compress_workers,
+                                     codec=codec,
+                                     ignore_matcher=ignore_matcher,
+                                     include=include)
+    try:
+        data_compressor.create_tarfile()
+    except FloydException:
+        uploader.join()
+        floyd_logger.error("Failed to finish upload!")
+        sys.exit(1)
+    except BaseException:
+        ring_buffer.abort(FloydException("Data compression failed."))
+        raise
+    else:
+        ring_buffer.close()
+    uploader.join()
+
+    if not upload_result[0]:
+        floyd_logger.error("Failed to finish upload!")
+        sys.exit(1)
+
+    finish_stream_upload(data_config, data_id)
+
+
+def stream_archive_upload(data_config, data_name, description, stream):
+    """
+    Upload the tar archive read from stream as is, into a deferred-length
+    upload, after checking its header
+    """
+    header = stream.read(ARCHIVE_HEADER_SIZE)
+    try:
+        codec = detect_archive_codec(header)
+    except FloydException as e:
+        sys.exit(e.message)
+
+    tus_client, data_id, creds, data_endpoint = start_stream_upload(
+        data_config, data_name, description, codec.data_type)
+
+    floyd_logger.info("Uploading %s archive...", codec.name)
+    if not tus_client.stream_upload(PrefixedReader(header, stream), data_endpoint,
+                                    auth=creds, max_size=MAX_UPLOAD_SIZE):
+        floyd_logger.error("Failed to finish upload!")
+        sys.exit(1)
+
+    finish_stream_upload(data_config, data_id)
+
+
+def start_stream_upload(data_config, data_name, description, data_type):
+    """
+    Create the data and its deferred-length upload. Returns the
+    (TusDataClient, data id, upload credentials, upload endpoint).
+    """
+    data = DataRequest(name=data_name,
+                       description=description,
+                       family_id=data_config.family_id,
+                       data_type=data_type)
+    data_info = DataClient().create(data)
+    if not data_info:
+        sys.exit(1)
+
+    data_config.set_data_id(data_info['id'])
+    data_config.set_data_name(data_info['name'])
+    DataConfigManager.set_config(data_config)
+
+    creds = DataClient().new_tus_credentials(data_info['id'])
+    if not creds:
+        sys.exit(1)
+
+    tus_client = TusDataClient()
+    data_endpoint = tus_client.initialize_upload(metadata={"filename": creds[0]},
+                                                 auth=creds)
+    if not data_endpoint:
+        floyd_logger.error("Failed to get upload URL from Floydhub!")
+        sys.exit(1)
+
+    return tus_client, data_info['id'], creds, data_endpoint
+
+
+def finish_stream_upload(data_config, data_id):
+    floyd_logger.debug("Created data with id : %s", data_id)
+    floyd_logger.info("Upload finished.")
+
+    data_source = DataClient().get(data_id)
+    data_config.set_resource_id(data_source.resource_id)
+    DataConfigManager.set_config(data_config)
+
+
 def complete_upload(data_config):
     data_endpoint = data_config.data_endpoint
     data_id = data_config.data_id
@@ -121,36 +571,54 @@ def complete_upload(data_config):
         sys.exit(1)
 
     # check for tarball upload, upload to server if not done
-    if not data_config.resource_id and (tarball_path and data_endpoint):
+    uploads = data_endpoint or data_config.upload_parts or data_config.upload_shards
+    if not data_config.resource_id and (tarball_path and uploads):
         floyd_logger.debug("Getting fresh upload credentials")
         creds = DataClient().new_tus_credentials(data_id)
         if not creds:
             sys.exit(1)
 
-        file_size = os.path.getsize(tarball_path)
+        if tarball_changed(data_config):
+            # Checked before sending anything, the SHA-256 of the tarball is
+            # only known once it is all read
+            floyd_logger.error("The compressed data changed since the upload started. "
+                               "Please start a new upload.")
+            return
+
+        if data_config.upload_shards:
+            compress_and_upload_shards(data_config, creds)
+
+        if data_config.upload_shards:
+            # Shards are unpacked separately, so the limit applies to each one
+            archive_sizes = [shard["length"] for shard in data_config.upload_shards]
+        else:
+            archive_sizes = [os.path.getsize(tarball_path)]
+        file_size = sum(archive_sizes)
         # check for upload limit dimension
-        if file_size > MAX_UPLOAD_SIZE:
-            try:
-                floyd_logger.info("Removing compressed data...")
-                rmtree(os.path.dirname(tarball_path))
-            except (OSError, TypeError):
-                pass
+        if max(archive_sizes) > MAX_UPLOAD_SIZE:
+            remove_tarball(data_config)
 
             sys.exit(("Data size too large to upload, please keep it under %s.\n") %
                      (sizeof_fmt(MAX_UPLOAD_SIZE)))
 
         floyd_logger.info("Uploading compressed data. Total upload size: %s",
                           sizeof_fmt(file_size))
-        tus_client = TusDataClient()
-        if not tus_client.resume_upload(tarball_path, data_endpoint, auth=creds):
+        if data_config.upload_shards:
+            uploaded = sharded_upload(data_config, creds)
+        elif data_config.upload_parts:
+            uploaded = parallel_upload(data_config, creds)
+        else:
+            tus_client = TusDataClient()
+            uploaded = tus_client.resume_upload(tarball_path, data_endpoint, auth=creds,
+                                                sha256=data_config.tarball_sha256)
+            if tus_client.chunk_sizer.throughput:
+                # Used by --codec auto on the next upload
+                data_config.set_upload_bandwidth(tus_client.chunk_sizer.throughput)
+        if not uploaded:
             floyd_logger.error("Failed to finish upload!")
             return
 
-        try:
-            floyd_logger.info("Removing compressed data...")
-            rmtree(os.path.dirname(tarball_path))
-        except (OSError, TypeError):
-            pass
+        remove_tarball(data_config)
 
         floyd_logger.debug("Created data with id : %s", data_id)
         floyd_logger.info("Upload finished.")
@@ -158,6 +626,11 @@ def complete_upload(data_config):
         # Update data config
         data_config.set_tarball_path(None)
         data_config.set_data_endpoint(None)
+        data_config.set_upload_parts(None)
+        data_config.set_tarball_sha256(None)
+        data_config.set_tarball_stat(None, None)
+        data_config.set_upload_shards(None)
+        data_config.set_keep_tarball(None)
         data_source = DataClient().get(data_id)
         data_config.set_resource_id(data_source.resource_id)
         DataConfigManager.set_config(data_config)
@@ -180,6 +653,8 @@ def complete_upload(data_config):
                 "your data. Please check back later.")
             sys.exit(1)
         else:
+            # The unpacked version is the base of the next delta upload
+            DataManifestManager.commit_manifest(data_config.family_id, data_config.resource_id)
             data_config.set_resource_id(None)
             data_config.set_tarball_path(None)
             data_config.set_data_endpoint(None)
@@ -196,8 +671,14 @@ def complete_upload(data_config):
 
 def abort_previous_upload(data_config):
     if data_config.tarball_path and os.path.exists(data_config.tarball_path):
-        rmtree(os.path.dirname(data_config.tarball_path))
+        remove_tarball(data_config)
 
     data_config.set_tarball_path("")
     data_config.set_data_endpoint("")
+    data_config.set_upload_parts(None)
+    data_config.set_tarball_sha256(None)
+    data_config.set_tarball_stat(None, None)
+    data_config.set_upload_shards(None)
+    data_config.set_keep_tarball(None)
+    DataManifestManager.discard_pending_manifest(data_config.family_id)
     DataConfigManager.set_config(data_config)
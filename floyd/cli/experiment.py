@@ -8,6 +8,7 @@ import os
 
 import floyd
 from floyd.cli.utils import (
+    clone_resource,
     get_module_task_instance_id,
     normalize_job_name,
     get_namespace_from_name
@@ -121,7 +122,11 @@ def format_metrics(latest_metrics):
 @click.argument('id', nargs=1)
 @click.option('--path', '-p',
               help='Download files in a specific path from a job')
-def clone(id, path):
+@click.option('--no-cache', is_flag=True, default=False,
+              help='Download the files even if they are in the local clone cache')
+@click.option('--resumable', is_flag=True, default=False,
+              help='Save large downloads to disk before extracting them, so an interrupted clone can be resumed')
+def clone(id, path, no_cache, resumable):
     """
     - Download all files from a job
 
@@ -135,6 +140,8 @@ def clone(id, path):
     Specify the path to a directory and download all its files and subdirectories.
 
     Eg: --path models/checkpoint1
+
+    Full clones are kept in a local cache, see "floyd data cache".
     """
     try:
         experiment = ExperimentClient().get(normalize_job_name(id, use_config=False))
@@ -156,6 +163,9 @@ def clone(id, path):
         # Download the full Code
         code_url = "{}/api/v1/resources/{}?content=true&download=true".format(floyd.floyd_host,
                                                                               module.resource_id)
+        clone_resource(ExperimentClient(), module.resource_id, code_url, use_cache=not no_cache,
+                       resumable=resumable)
+        return
     ExperimentClient().download_tar(url=code_url,
                                     untar=True,
                                     delete_after_untar=True)
@@ -23,6 +23,7 @@ from floyd.cli.utils import (
 )
 from floyd.client.experiment import ExperimentClient
 from floyd.client.module import ModuleClient
+from floyd.client.files import CODE_BUNDLE_CODECS
 from floyd.client.env import EnvClient
 from floyd.exceptions import FloydException
 from floyd.manager.auth_config import AuthConfigManager
@@ -222,9 +223,14 @@ def show_new_job_info(expt_client, job_name, expt_info, mode, open_notebook=True
 @click.option('--open/--no-open', 'open_notebook',
               help='Automatically open the notebook url',
               default=True)
+@click.option('--code-bundle',
+              help='Upload the code as a single compressed archive',
+              default=None,
+              type=click.Choice(sorted(CODE_BUNDLE_CODECS)))
 @click.argument('command', nargs=-1)
 @click.pass_context
-def run(ctx, cpu, gpu, env, message, data, mode, open_notebook, follow, tensorboard, gpu2, cpu2, max_runtime, task, command):
+def run(ctx, cpu, gpu, env, message, data, mode, open_notebook, follow, tensorboard, gpu2, cpu2, max_runtime, task,
+        code_bundle, command):
     """
     Start a new job on FloydHub.
 
@@ -310,7 +316,7 @@ def run(ctx, cpu, gpu, env, message, data, mode, open_notebook, follow, tensorbo
                     task=task)
 
     try:
-        module_id = ModuleClient().create(module, cli_default)
+        module_id = ModuleClient().create(module, cli_default, bundle=code_bundle)
     except BadRequestException as e:
         if 'Project not found, ID' in e.message:
             floyd_logger.error(
@@ -2,9 +2,13 @@ import pkg_resources
 import sys
 import os
 import re
+import shutil
 
+from floyd.client.download import DownloadState
 from floyd.exceptions import FloydException
+from floyd.log import logger as floyd_logger
 from floyd.manager.auth_config import AuthConfigManager
+from floyd.manager.clone_cache import CloneCacheManager
 from floyd.manager.experiment_config import ExperimentConfigManager
 from floyd.manager.data_config import DataConfigManager
 
@@ -167,6 +171,70 @@ def normalize_job_name(raw_job_name, default_username='', default_project_name='
     return '/'.join([namespace, 'projects', project_name, number])
 
 
+def parse_size(size):
+    """
+    Returns the number of bytes of a size like "1234", "12 MB" or "1.5GiB",
+    or None if it isn't one
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*(?:([kmgtp])(i)?)?b?\s*$', str(size or ''), re.IGNORECASE)
+    if not match:
+        return None
+    number, prefix, binary = match.groups()
+    exponent = 'kmgtp'.index(prefix.lower()) + 1 if prefix else 0
+    return int(float(number) * (1024 if binary else 1000) ** exponent)
+
+
+def clone_resource(client, resource_id, url, use_cache=True, size=None, resumable=False):
+    """
+    Download and extract the content of the finished resource resource_id,
+    at url, in the current directory. Resources are cloned from the local
+    clone cache when they're in it, and added to it otherwise.
+
+    Resources larger than the whole cache, going by their size in bytes
+    when it is known, or cloned to another filesystem than the cache's,
+    where the cached files can't be hardlinked, are extracted in the
+    current directory without being cached.
+
+    Archives are extracted as they are downloaded. With resumable, large
+    archives are downloaded to a hidden file of the current directory
+    before they are extracted instead, so an interrupted clone resumes, at
+    the cost of keeping the archive on disk next to its files. A clone
+    interrupted that way resumes even without resumable.
+    """
+    download_path = ".floyd_clone_%s.tar" % resource_id
+    if not resumable and DownloadState.load(download_path) is None:
+        download_path = None
+    if not use_cache:
+        return client.download_tar(url=url, untar=True, delete_after_untar=True, filename=download_path)
+
+    if CloneCacheManager.materialize(resource_id):
+        floyd_logger.info("Cloned from the local cache.")
+        return True
+
+    if size is not None and size > CloneCacheManager.get_max_size():
+        floyd_logger.debug("%s is larger than the clone cache, not caching it", resource_id)
+        return client.download_tar(url=url, untar=True, delete_after_untar=True, filename=download_path)
+
+    try:
+        if not CloneCacheManager.on_filesystem_of('.'):
+            floyd_logger.debug("The clone cache is on another filesystem, not caching %s", resource_id)
+            return client.download_tar(url=url, untar=True, delete_after_untar=True, filename=download_path)
+        staging_dir = CloneCacheManager.create_staging_dir()
+    except OSError as e:
+        floyd_logger.debug("Clone cache unavailable: %s", e)
+        return client.download_tar(url=url, untar=True, delete_after_untar=True, filename=download_path)
+    try:
+        if not client.download_tar(url=url, untar=True, delete_after_untar=True, destination_dir=staging_dir,
+                                   filename=download_path):
+            return False
+        CloneCacheManager.add(resource_id, staging_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    CloneCacheManager.materialize(resource_id)
+    CloneCacheManager.evict()
+    return True
+
+
 def get_cli_version():
     return pkg_resources.require("floyd-cli")[0].version
 
@@ -1,11 +1,18 @@
 from clint.textui import progress
+from clint.textui.progress import Bar as ProgressBar
 import requests
+from requests.compat import urlparse
 import os
 import sys
 import tarfile
 
 import floyd
 from floyd.cli.utils import get_cli_version
+from floyd.client.download import (
+    BufferedFileWriter, DownloadState, ProgressTimer, RangeDownloader, iter_response,
+    parse_sha256_digest, supports_ranges
+)
+from floyd.client.files import IterReader
 from floyd.manager.auth_config import AuthConfigManager
 from floyd.exceptions import (AuthenticationException, AuthorizationException,
                               BadGatewayException, BadRequestException,
@@ -20,6 +27,17 @@ class FloydHttpClient(object):
     """
     Base client for all HTTP operations
     """
+
+    # Bytes read from the response at a time by download_untar
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    # Downloads of at least this size are fetched as segments in parallel
+    # when the server supports byte ranges
+    SEGMENTED_DOWNLOAD_MIN_SIZE = 32 * 1024 * 1024
+    DOWNLOAD_SEGMENT_SIZE = 8 * 1024 * 1024
+    DOWNLOAD_WORKERS = 4
+    # Bytes streamed by download between two saves of its resumable state
+    DOWNLOAD_STATE_INTERVAL = 8 * 1024 * 1024
+
     def __init__(self, skip_auth=False):
         self.base_url = "{}/api/v1".format(floyd.floyd_host)
         if skip_auth:
@@ -36,9 +54,12 @@ class FloydHttpClient(object):
                 json=None,
                 timeout=5,
                 headers=None,
-                skip_auth=False):
+                skip_auth=False,
+                exit_on_connection_error=True):
         """
-        Execute the request using requests library
+        Execute the request using requests library. Connection errors and
+        timeouts exit with a message, unless exit_on_connection_error is
+        False and they are raised instead.
         """
         request_url = self.base_url + url
         floyd_logger.debug("Starting request to url: %s with params: %s, data: %s", request_url, params, data)
@@ -61,9 +82,13 @@ class FloydHttpClient(object):
                                         files=files,
                                         timeout=timeout)
         except requests.exceptions.ConnectionError as exception:
+            if not exit_on_connection_error:
+                raise
             floyd_logger.debug("Exception: %s", exception, exc_info=True)
             sys.exit("Cannot connect to the Floyd server. Check your internet connection.")
         except requests.exceptions.Timeout as exception:
+            if not exit_on_connection_error:
+                raise
             floyd_logger.debug("Exception: %s", exception, exc_info=True)
             sys.exit("Connection to FloydHub server timed out. Please retry or check your internet connection.")
 
@@ -71,9 +96,12 @@ class FloydHttpClient(object):
         self.check_response_status(response)
         return response
 
-    def download(self, url, filename, relative=False, headers=None, timeout=5):
+    def _get_download(self, url, relative=False, headers=None, timeout=5):
         """
-        Download the file from the given url at the current path
+        Start a streamed download of the given url. Returns the response,
+        its content length if known, and a RangeDownloader of its content
+        if the server supports byte ranges. Callers close the response if
+        they use the RangeDownloader instead.
         """
         request_url = self.base_url + url if relative else url
         floyd_logger.debug("Downloading file from url: {}".format(request_url))
@@ -86,37 +114,180 @@ class FloydHttpClient(object):
         if headers:
             request_headers.update(headers)
 
+        response = requests.get(request_url,
+                                headers=request_headers,
+                                timeout=timeout,
+                                stream=True)
+        self.check_response_status(response)
+        # chunk mode response doesn't have content-length so we are
+        # using a custom header here
+        content_length = response.headers.get('x-floydhub-content-length')
+        if not content_length:
+            content_length = response.headers.get('content-length')
+
+        if not supports_ranges(response):
+            return response, content_length, None
+
+        content_length = response.headers['Content-Length']
+        # Downloads can be redirected to storage that doesn't take our credentials
+        if urlparse(response.url).netloc != urlparse(request_url).netloc:
+            request_headers.pop("Authorization", None)
+        # Ranges of content changed since this response are refused
+        if response.headers.get('ETag'):
+            request_headers["If-Range"] = response.headers['ETag']
+        downloader = RangeDownloader(response.url, int(content_length),
+                                     headers=request_headers,
+                                     workers=self.DOWNLOAD_WORKERS,
+                                     segment_size=self.DOWNLOAD_SEGMENT_SIZE)
+        return response, content_length, downloader
+
+    def download(self, url, filename, relative=False, headers=None, timeout=5):
+        """
+        Download the file from the given url at the current path.
+
+        The content is written to filename.part and only renamed to filename
+        once its size, and SHA-256 when the server sends a Digest, are
+        checked. An interrupted download keeps its DownloadState and resumes
+        from the missing byte ranges on the next call, as long as the server
+        still sends the same content.
+        """
         try:
-            response = requests.get(request_url,
-                                    headers=request_headers,
-                                    timeout=timeout,
-                                    stream=True)
-            self.check_response_status(response)
-            with open(filename, 'wb') as f:
-                # chunk mode response doesn't have content-length so we are
-                # using a custom header here
-                content_length = response.headers.get('x-floydhub-content-length')
-                if not content_length:
-                    content_length = response.headers.get('content-length')
+            response, content_length, downloader = self._get_download(url, relative=relative, headers=headers,
+                                                                      timeout=timeout)
+            return self._download(url, filename, response, content_length, downloader)
+        except requests.exceptions.ConnectionError as exception:
+            floyd_logger.debug("Exception: {}".format(exception))
+            sys.exit("Cannot connect to the Floyd server. Check your internet connection.")
+
+    def _download(self, url, filename, response, content_length, downloader):
+        """
+        Download to filename from the response started by _get_download,
+        see download
+        """
+        etag = response.headers.get('ETag')
+        size = int(content_length) if content_length else None
+        state = DownloadState.load(filename)
+        if downloader and state and state.matches(url, etag, size):
+            floyd_logger.info("Resuming the download of %s ...", filename)
+        else:
+            if state:
+                state.discard()
+            state = DownloadState(filename, url, etag, size)
+            if downloader and size < self.SEGMENTED_DOWNLOAD_MIN_SIZE:
+                downloader = None
+
+        if downloader:
+            response.close()
+            self._download_segments(downloader, state)
+        else:
+            self._download_stream(response, state)
+        state.complete(sha256=parse_sha256_digest(response))
+        return filename
+
+    def _download_segments(self, downloader, state):
+        """
+        Fetch the byte ranges missing from state as segments in parallel
+        """
+        missing = state.missing()
+        done = [state.size - sum(end - start for start, end in missing)]
+        floyd_logger.debug("Downloading %s bytes in parallel segments", state.size - done[0])
+        bar = ProgressBar(expected_size=state.size // 1024 + 1, filled_char='=')
+
+        def on_progress(start, end):
+            state.add(start, end)
+            done[0] += end - start
+            bar.show(done[0] // 1024)
+
+        try:
+            downloader.download_to(state.part_path, ranges=missing, on_progress=on_progress)
+        finally:
+            bar.done()
+
+    def _download_stream(self, response, state):
+        """
+        Write the content of response to the part file of state, saving the
+        state every DOWNLOAD_STATE_INTERVAL bytes
+        """
+        state.save()
+        bar = ProgressBar(expected_size=state.size // 1024 + 1, filled_char='=') if state.size else None
+        saved = 0
+        with open(state.part_path, 'wb') as f, ProgressTimer(bar) as progress_timer:
+            writer = BufferedFileWriter(f)
+            try:
+                for chunk in iter_response(response):
+                    writer.write(chunk)
+                    progress_timer.done += len(chunk)
+                    if writer.flushed - saved >= self.DOWNLOAD_STATE_INTERVAL:
+                        # Only bytes already in the file are recorded as done
+                        writer.flush()
+                        state.add(saved, writer.flushed)
+                        saved = writer.flushed
+            finally:
+                writer.flush()
+                if writer.flushed > saved:
+                    state.add(saved, writer.flushed)
+
+    def download_untar(self, url, destination_dir='.', relative=False, headers=None, timeout=5, filename=None):
+        """
+        Download the tar file from the given url and extract its members as
+        they arrive, without writing the archive to disk. Returns False if
+        the archive is invalid or the download is interrupted.
+
+        With filename, archives large enough to be fetched in segments, or
+        whose download was interrupted, are downloaded to filename with
+        download instead, then extracted and removed. The archive then
+        takes disk space next to its members while they are extracted, but
+        an interrupted download resumes from where it stopped.
+        """
+        try:
+            response, content_length, downloader = self._get_download(url, relative=relative, headers=headers,
+                                                                      timeout=timeout)
+            resumable = bool(filename and downloader)
+            if resumable and downloader.size < self.SEGMENTED_DOWNLOAD_MIN_SIZE:
+                # Small archives are only saved when an earlier download was
+                # interrupted
+                resumable = DownloadState.load(filename) is not None
+            if resumable:
+                self._download(url, filename, response, content_length, downloader)
+                with tarfile.open(filename) as tar:
+                    tar.extractall(path=destination_dir)
+                os.remove(filename)
+                return True
+
+            if downloader and downloader.size >= self.SEGMENTED_DOWNLOAD_MIN_SIZE:
+                response.close()
+                # Segments are fetched ahead in parallel but extracted in order
+                chunks = progress.bar(downloader.iter_content(), expected_size=len(downloader.segments()))
+            else:
+                chunks = response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE)
                 if content_length:
-                    for chunk in progress.bar(response.iter_content(chunk_size=1024),
-                                              expected_size=(int(content_length) / 1024) + 1):
-                        if chunk:
-                            f.write(chunk)
-                else:
-                    for chunk in response.iter_content(chunk_size=1024):
-                        if chunk:
-                            f.write(chunk)
-            return filename
+                    chunks = progress.bar(chunks,
+                                          expected_size=(int(content_length) // self.DOWNLOAD_CHUNK_SIZE) + 1)
+            # "r|*" reads the archive sequentially, whatever its compression
+            with tarfile.open(fileobj=IterReader(chunks), mode='r|*') as tar:
+                tar.extractall(path=destination_dir)
+            return True
         except requests.exceptions.ConnectionError as exception:
             floyd_logger.debug("Exception: {}".format(exception))
             sys.exit("Cannot connect to the Floyd server. Check your internet connection.")
+        except (tarfile.TarError, requests.exceptions.ChunkedEncodingError) as exception:
+            floyd_logger.debug("Exception: {}".format(exception))
+            floyd_logger.error("Download interrupted or invalid archive, please retry.")
+            return False
 
-    def download_tar(self, url, untar=True, delete_after_untar=False, destination_dir='.'):
+    def download_tar(self, url, untar=True, delete_after_untar=False, destination_dir='.', filename=None):
         """
-        Download and optionally untar the tar file from the given url
+        Download and optionally untar the tar file from the given url.
+
+        When the tar file isn't kept, its members are extracted while it
+        downloads, or from filename if given and the download can resume,
+        see download_untar.
         """
         try:
+            if untar and delete_after_untar:
+                floyd_logger.info("Downloading and untarring the contents of the file ...")
+                return self.download_untar(url=url, destination_dir=destination_dir, filename=filename)
+
             floyd_logger.info("Downloading the tar file to the current directory ...")
             filename = self.download(url=url, filename='output.tar')
             if filename and untar:
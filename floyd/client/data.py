@@ -59,6 +59,20 @@ class DataClient(FloydHttpClient):
                 data_id, e.message)
             return ()
 
+    def create_shard_manifest(self, data_id, shards):
+        """
+        Send the list of uploaded shards of the data, so the server unpacks
+        them concurrently
+        """
+        try:
+            self.request("POST",
+                         "%s%s/shard_manifest" % (self.url, data_id),
+                         json={"shards": shards})
+            return True
+        except FloydException as e:
+            floyd_logger.error("Data %s: ERROR! %s", data_id, e.message)
+            return False
+
     def get(self, id):
         try:
             response = self.request("GET", self.url + id)
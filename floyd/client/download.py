@@ -0,0 +1,346 @@
+import base64
+import binascii
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.packages.urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+
+from floyd.exceptions import FloydException
+from floyd.log import logger as floyd_logger
+
+
+def supports_ranges(response):
+    """
+    Whether the server of response can send byte ranges of its content
+    """
+    if response.headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return False
+    # The ranges of an encoded response are ranges of the encoded bytes
+    return bool(response.headers.get('Content-Length')) and not response.headers.get('Content-Encoding')
+
+
+def parse_sha256_digest(response):
+    """
+    Returns the SHA-256 of the content given in the RFC 3230 Digest header
+    of response, as a hex string, or None
+    """
+    for digest in response.headers.get('Digest', '').split(','):
+        algorithm, _, value = digest.strip().partition('=')
+        if algorithm.lower() == 'sha-256' and value:
+            try:
+                return binascii.hexlify(base64.b64decode(value)).decode('ascii')
+            except (TypeError, ValueError, binascii.Error):
+                return None
+    return None
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def iter_response(response, min_chunk_size=64 * 1024, max_chunk_size=4 * 1024 * 1024):
+    """
+    Yield the content of a streamed response in chunks starting at
+    min_chunk_size bytes and doubling up to max_chunk_size as long as the
+    connection fills them, so fast downloads take few Python iterations.
+    """
+    chunk_size = min_chunk_size
+    while True:
+        # Same error mapping as requests' iter_content
+        try:
+            chunk = response.raw.read(chunk_size, decode_content=True)
+        except ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e)
+        except ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e)
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) >= chunk_size:
+            chunk_size = min(chunk_size * 2, max_chunk_size)
+
+
+class BufferedFileWriter(object):
+    """
+    Write small chunks to f through a reusable bytearray of buffer_size
+    bytes, so the file only sees large writes. Chunks at least as large as
+    the buffer are written directly. flushed is the number of bytes written
+    to f so far.
+    """
+
+    def __init__(self, f, buffer_size=4 * 1024 * 1024):
+        self.f = f
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.buffered = 0
+        self.flushed = 0
+
+    def write(self, chunk):
+        size = len(chunk)
+        if self.buffered + size > len(self.buffer):
+            self.flush()
+        if size >= len(self.buffer):
+            self.f.write(chunk)
+            self.flushed += size
+            return
+        self.view[self.buffered:self.buffered + size] = chunk
+        self.buffered += size
+
+    def flush(self):
+        if self.buffered:
+            self.f.write(self.view[:self.buffered])
+            self.flushed += self.buffered
+            self.buffered = 0
+        self.f.flush()
+
+
+class ProgressTimer(object):
+    """
+    Show the progress of a download on bar, if any, every interval seconds
+    from a background thread, so the download loop only updates a counter.
+    Used as a context manager.
+    """
+
+    def __init__(self, bar, interval=0.2):
+        self.bar = bar
+        self.interval = interval
+        self.done = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.bar:
+                self.bar.show(self.done // 1024)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        if self.bar:
+            self.bar.show(self.done // 1024)
+            self.bar.done()
+
+
+class DownloadState(object):
+    """
+    Progress of a download into filename.part, saved in the filename.part.json
+    sidecar so an interrupted download can be resumed: the url, the ETag and
+    size of its content, and the (start, end) byte ranges already written.
+    """
+
+    def __init__(self, filename, url, etag=None, size=None, done=None):
+        self.filename = filename
+        self.url = url
+        self.etag = etag
+        self.size = size
+        self.done = [tuple(done_range) for done_range in done or []]
+        self._lock = threading.Lock()
+
+    @property
+    def part_path(self):
+        return self.filename + '.part'
+
+    @property
+    def state_path(self):
+        return self.filename + '.part.json'
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Returns the saved DownloadState of filename, or None
+        """
+        try:
+            with open(filename + '.part.json', 'r') as state_file:
+                state = json.loads(state_file.read())
+            return cls(filename, state['url'], state.get('etag'), state.get('size'), state.get('done'))
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def matches(self, url, etag, size):
+        """
+        Whether the part file holds the start of this content
+        """
+        if not etag or (self.url, self.etag, self.size) != (url, etag, size):
+            return False
+        return os.path.isfile(self.part_path)
+
+    def save(self):
+        with open(self.state_path, 'w') as state_file:
+            state_file.write(json.dumps({'url': self.url, 'etag': self.etag, 'size': self.size,
+                                         'done': self.done}))
+
+    def add(self, start, end):
+        """
+        Record the bytes from start to end as written, and save the state
+        """
+        with self._lock:
+            merged = []
+            for done_start, done_end in sorted(self.done + [(start, end)]):
+                if merged and done_start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], done_end))
+                else:
+                    merged.append((done_start, done_end))
+            self.done = merged
+            self.save()
+
+    def missing(self):
+        """
+        Returns the (start, end) byte ranges not written yet
+        """
+        missing, offset = [], 0
+        for start, end in self.done:
+            if start > offset:
+                missing.append((offset, start))
+            offset = max(offset, end)
+        if self.size is None or offset < self.size:
+            missing.append((offset, self.size))
+        return missing
+
+    def discard(self):
+        for path in [self.part_path, self.state_path]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def complete(self, sha256=None):
+        """
+        Check the part file and rename it to filename. Raises FloydException
+        if its size or SHA-256 isn't the expected one; an incomplete part
+        file is kept to be resumed.
+        """
+        if self.size is not None and (self.missing() or os.path.getsize(self.part_path) != self.size):
+            raise FloydException("Incomplete download of %s, please retry." % self.filename)
+        if sha256 and file_sha256(self.part_path) != sha256:
+            self.discard()
+            raise FloydException("Corrupted download of %s, please retry." % self.filename)
+        # os.rename doesn't overwrite files on Windows
+        getattr(os, 'replace', os.rename)(self.part_path, self.filename)
+        self.discard()
+
+
+class RangeDownloader(object):
+    """
+    Download a file of size bytes from url as segments of segment_size
+    bytes, fetched concurrently with HTTP Range requests on workers threads
+    sharing a pool of connections.
+    """
+
+    MAX_RETRIES = 3
+    MAX_RETRY_DELAY = 10
+
+    def __init__(self, url, size, headers=None, workers=4, segment_size=8 * 1024 * 1024, timeout=60):
+        self.url = url
+        self.size = size
+        self.headers = headers or {}
+        self.workers = workers
+        self.segment_size = segment_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def segments(self, ranges=None):
+        """
+        Returns the (start, end) byte offsets of the segments of ranges, the
+        whole file by default, end excluded
+        """
+        if ranges is None:
+            ranges = [(0, self.size)]
+        return [(start, min(start + self.segment_size, range_end))
+                for range_start, range_end in ranges
+                for start in range(range_start, range_end, self.segment_size)]
+
+    def fetch(self, start, end):
+        """
+        Returns the bytes from start to end, retrying failed requests
+        """
+        headers = dict(self.headers, Range='bytes=%d-%d' % (start, end - 1))
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+                content_range = response.headers.get('Content-Range', '')
+                if response.status_code != 206 or not content_range.startswith('bytes %d-' % start):
+                    raise FloydException("Invalid response to a range request: %s" % response.status_code)
+                if len(response.content) != end - start:
+                    raise FloydException("Incomplete range: %s of %s bytes" % (len(response.content), end - start))
+                return response.content
+            except (requests.exceptions.RequestException, FloydException) as e:
+                if attempt >= self.MAX_RETRIES:
+                    raise
+                attempt += 1
+                floyd_logger.debug("Retrying bytes %s-%s: %s", start, end - 1, e)
+                time.sleep(min(2 ** attempt, self.MAX_RETRY_DELAY))
+
+    def download_to(self, filename, ranges=None, on_progress=None):
+        """
+        Download ranges, the whole file by default, into filename,
+        preallocated as a sparse file where every segment is written in
+        place as soon as it arrives. on_progress(start, end) is called after
+        every segment written.
+        """
+        lock = threading.Lock()
+        # An existing file keeps the segments already downloaded
+        with open(filename, 'r+b' if os.path.isfile(filename) else 'wb') as f:
+            f.truncate(self.size)
+
+            def fetch_segment(segment):
+                data = self.fetch(*segment)
+                with lock:
+                    f.seek(segment[0])
+                    f.write(data)
+                    # The state saved by on_progress must not run ahead of the file
+                    f.flush()
+                    if on_progress:
+                        on_progress(*segment)
+
+            pool = ThreadPool(self.workers)
+            try:
+                for _ in pool.imap_unordered(fetch_segment, self.segments(ranges)):
+                    pass
+            finally:
+                pool.close()
+                pool.join()
+                self.session.close()
+
+    def iter_content(self):
+        """
+        Yield the segments in order, fetching up to workers of them ahead
+        """
+        segments = iter(self.segments())
+        pool = ThreadPool(self.workers)
+        try:
+            pending = collections.deque()
+            for segment in segments:
+                pending.append(pool.apply_async(self.fetch, segment))
+                if len(pending) == self.workers:
+                    break
+            while pending:
+                data = pending.popleft().get()
+                segment = next(segments, None)
+                if segment is not None:
+                    pending.append(pool.apply_async(self.fetch, segment))
+                yield data
+        finally:
+            pool.close()
+            pool.join()
+            self.session.close()
@@ -3,6 +3,17 @@ import sys
 import tarfile
 import signal
 import errno
+import collections
+import math
+import time
+import contextlib
+import hashlib
+import heapq
+import io
+import threading
+import zlib
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from pathlib2 import PurePath
 from shutil import rmtree
@@ -13,27 +24,47 @@ try:
     from os import scandir
 except ImportError:
     from scandir import scandir  # noqa: F401
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+# zstd and lz4 compression are optional: pip install floyd-cli[zstd,lz4]
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 from clint.textui.progress import Bar as ProgressBar
 
-from floyd.manager.floyd_ignore import FloydIgnoreManager
+from floyd.exceptions import FloydException, SizeLimitExceededException
+from floyd.manager.floyd_ignore import FloydIgnoreManager, FloydIgnoreMatcher, GlobSet
 from floyd.log import logger as floyd_logger
 
+# Directory scans are I/O bound, so use more threads than cores
+DEFAULT_WALK_WORKERS = min(32, cpu_count() + 4)
+
 
 def get_unignored_file_paths(ignore_list=None, whitelist=None):
     """
     Given an ignore_list and a whitelist of glob patterns, returns the list of
     unignored file paths in the current directory and its subdirectories
+
+    ignore_list can also be a compiled FloydIgnoreMatcher, as returned by
+    FloydIgnoreManager.get_lists().
     """
     unignored_files = []
-    if ignore_list is None:
-        ignore_list = []
-    if whitelist is None:
-        whitelist = []
+    if isinstance(ignore_list, FloydIgnoreMatcher):
+        matcher = ignore_list
+    else:
+        matcher = FloydIgnoreMatcher(ignore_list, whitelist)
 
     for root, dirs, files in os.walk("."):
         floyd_logger.debug("Root:%s, Dirs:%s", root, dirs)
 
-        if ignore_path(unix_style_path(root), ignore_list, whitelist):
+        if matcher.ignores(unix_style_path(root)):
             # Reset dirs to avoid going further down this directory.
             # Then continue to the next iteration of os.walk, which causes
             # everything in this directory to be ignored.
@@ -50,7 +81,7 @@ def get_unignored_file_paths(ignore_list=None, whitelist=None):
 
         for file_name in files:
             file_path = unix_style_path(os.path.join(root, file_name))
-            if ignore_path(file_path, ignore_list, whitelist):
+            if matcher.ignores(file_path):
                 floyd_logger.debug("Ignoring file : %s", file_name)
                 continue
 
@@ -88,26 +119,300 @@ def matches_glob_list(path, glob_list):
     return False
 
 
-def get_files_in_current_directory(file_type):
+class ProjectWalker(object):
+    """
+    Walks a directory tree on a pool of threads and collects the unignored
+    files with their stat data.
+
+    Ignored directories are pruned before being scanned, and the walk aborts
+    as soon as the total size of the files found goes over max_size.
+    """
+    def __init__(self, matcher, max_size=None, workers=None):
+        self.matcher = matcher
+        self.max_size = max_size
+        self.workers = workers or DEFAULT_WALK_WORKERS
+        self.total_size = 0
+
+        self._files = []
+        self._error = None
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._dirs = queue.Queue()
+
+    def walk(self, root='.'):
+        """
+        Returns the sorted list of (path, stat_result) of unignored files
+        """
+        if self.matcher.ignores(unix_style_path(root)):
+            return []
+
+        self._dirs.put(root)
+        threads = [threading.Thread(target=self._work) for _ in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # Wait for every queued directory to be scanned, then stop the workers
+        self._dirs.join()
+        for _ in threads:
+            self._dirs.put(None)
+        for thread in threads:
+            thread.join()
+
+        if self._error:
+            raise self._error
+        return sorted(self._files)
+
+    def _work(self):
+        while True:
+            dir_path = self._dirs.get()
+            try:
+                if dir_path is None:
+                    return
+                if not self._abort.is_set():
+                    self._scan(dir_path)
+            except Exception as e:
+                # Surface the first error in the walking thread
+                with self._lock:
+                    self._error = self._error or e
+                self._abort.set()
+            finally:
+                self._dirs.task_done()
+
+    def _scan(self, dir_path):
+        floyd_logger.debug("Scanning directory : %s", dir_path)
+        try:
+            entries = list(scandir(dir_path))
+        except OSError as e:
+            # Like os.walk, skip directories that can't be listed
+            floyd_logger.debug("Cannot list directory %s: %s", dir_path, e)
+            return
+
+        for entry in entries:
+            if self._abort.is_set():
+                return
+
+            ignored = self.matcher.ignores(unix_style_path(entry.path))
+            if entry.is_dir():
+                # Like os.walk, symlinks to directories are not followed.
+                # Directories are pruned here so their content is never read.
+                if ignored:
+                    floyd_logger.debug("Ignoring directory : %s", entry.path)
+                elif not entry.is_symlink():
+                    self._dirs.put(entry.path)
+                continue
+
+            if ignored:
+                floyd_logger.debug("Ignoring file : %s", entry.name)
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError as e:
+                floyd_logger.debug("Skipping unreadable file %s: %s", entry.path, e)
+                continue
+
+            with self._lock:
+                self._files.append((entry.path, stat))
+                self.total_size += stat.st_size
+                over_limit = self.max_size is not None and self.total_size > self.max_size
+            if over_limit:
+                raise SizeLimitExceededException()
+
+
+def walk_unignored_files(matcher, root='.', max_size=None, workers=None):
+    """
+    Returns the sorted list of (path, stat_result) of the files under root
+    that are not ignored by matcher.
+
+    Raises SizeLimitExceededException as soon as the files found add up to
+    more than max_size bytes.
+    """
+    return ProjectWalker(matcher, max_size=max_size, workers=workers).walk(root)
+
+
+def list_files_in_current_directory(max_size=None):
+    """
+    Gets the list of (path, stat_result) of files in the current directory
+    and subdirectories.
+    Respects .floydignore file if present
+    """
+    matcher = FloydIgnoreManager.get_lists()
+
+    floyd_logger.debug("Ignoring: %s", matcher.ignore_list)
+    floyd_logger.debug("Whitelisting: %s", matcher.whitelist)
+
+    return walk_unignored_files(matcher, max_size=max_size)
+
+
+def get_files_in_current_directory(file_type, files=None):
     """
     Gets the list of files in the current directory and subdirectories.
     Respects .floydignore file if present
+
+    If files, a list of (path, stat_result), is given, only those files are
+    opened instead. Their sizes come from the stat results.
     """
     local_files = []
     total_file_size = 0
 
-    ignore_list, whitelist = FloydIgnoreManager.get_lists()
+    if files is None:
+        files = list_files_in_current_directory()
 
-    floyd_logger.debug("Ignoring: %s", ignore_list)
-    floyd_logger.debug("Whitelisting: %s", whitelist)
+    for file_path, stat in files:
+        lazy_file = LazyFile(file_path, size=stat.st_size)
+        local_files.append((file_type, (unix_style_path(file_path), lazy_file, 'text/plain')))
+        total_file_size += lazy_file.size
 
-    file_paths = get_unignored_file_paths(ignore_list, whitelist)
+    return (local_files, total_file_size)
 
-    for file_path in file_paths:
-        local_files.append((file_type, (unix_style_path(file_path), open(file_path, 'rb'), 'text/plain')))
-        total_file_size += os.path.getsize(file_path)
 
-    return (local_files, total_file_size)
+class LazyFile(object):
+    """
+    Read only file that is opened on its first read and closed as soon as
+    its content has been read.
+
+    Its length comes from stat, so a multipart encoder can compute the
+    Content-Length of thousands of files while keeping at most one of them
+    open at a time.
+    """
+    def __init__(self, path, size=None):
+        self.path = path
+        self.size = os.path.getsize(path) if size is None else size
+        self.bytes_read = 0
+        self._file = None
+
+    @property
+    def len(self):
+        """
+        Number of bytes left to read
+        """
+        return self.size - self.bytes_read
+
+    def read(self, size=-1):
+        remaining = self.len
+        if remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        data = self._file.read(size)
+        self.bytes_read += len(data)
+
+        if not data:
+            self.close()
+            raise FloydException("File %s changed while it was being uploaded" % self.path)
+        if self.bytes_read >= self.size:
+            self.close()
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Archive name and content type of each code bundle codec
+CODE_BUNDLE_CODECS = {
+    'gzip': ('code.tar.gz', 'application/gzip'),
+    'zstd': ('code.tar.zst', 'application/zstd'),
+}
+
+
+class ChunkSink(object):
+    """
+    Write only file object that keeps the written bytes until drained
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_code_bundle(file_paths, codec='gzip', progress_callback=None):
+    """
+    Yields a compressed tarball of file_paths chunk by chunk.
+
+    The archive is built as it is consumed, so no temporary file is written.
+    progress_callback is called with the number of files added so far.
+    """
+    if codec not in CODE_BUNDLE_CODECS:
+        raise FloydException("Unknown code bundle codec: %s" % codec)
+    if codec == 'zstd' and zstandard is None:
+        raise FloydException("zstd code bundles require the zstandard package: pip install zstandard")
+
+    sink = ChunkSink()
+    compressor = None
+    if codec == 'gzip':
+        tar = tarfile.open(fileobj=sink, mode='w|gz', dereference=True)
+    else:
+        compressor = zstandard.ZstdCompressor().stream_writer(sink)
+        tar = tarfile.open(fileobj=compressor, mode='w|', dereference=True)
+
+    for files_added, file_path in enumerate(file_paths, 1):
+        tar.add(file_path, arcname=unix_style_path(os.path.normpath(file_path)), recursive=False)
+        for chunk in sink.drain():
+            yield chunk
+        if progress_callback:
+            progress_callback(files_added)
+
+    tar.close()
+    if compressor is not None:
+        compressor.flush(zstandard.FLUSH_FRAME)
+    for chunk in sink.drain():
+        yield chunk
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """
+    Returns the hex sha256 digest of the file content
+    """
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def build_file_manifest(files, previous_manifest=None, root=None):
+    """
+    Given a list of (path, stat_result), returns a manifest mapping each file
+    path, relative to root if given, to its size, mtime and sha256 content
+    hash.
+
+    Hashes are reused from previous_manifest for files whose size and mtime
+    are unchanged, so only new or modified files are read.
+    """
+    if previous_manifest is None:
+        previous_manifest = {}
+
+    manifest = {}
+    for file_path, stat in files:
+        path = unix_style_path(os.path.relpath(file_path, root) if root else file_path)
+        entry = previous_manifest.get(path)
+        if not entry or entry.get('size') != stat.st_size or entry.get('mtime') != stat.st_mtime:
+            try:
+                sha256 = hash_file(file_path)
+            except (IOError, OSError) as e:
+                # e.g. IOError: [Errno 13] Permission denied
+                sys.exit("Cannot read %s: %s. Make sure to have read permission for all the files to upload."
+                         % (file_path, e.strerror or e))
+            entry = {'size': stat.st_size,
+                     'mtime': stat.st_mtime,
+                     'sha256': sha256}
+        manifest[path] = entry
+    return manifest
 
 
 def unix_style_path(path):
@@ -127,71 +432,1015 @@ def sizeof_fmt(num, suffix='B'):
     return "%.1f%s%s" % (num, 'Yi', suffix)
 
 
+class ParallelGzipWriter(object):
+    """
+    Write only file object compressing its input to a multi-member gzip
+    stream on a pool of threads, in the style of pigz.
+
+    The input is cut into blocks of block_size bytes that are compressed
+    independently, each as its own gzip member, and written to fileobj in
+    order. Decompressing the output gives back the input, like any
+    standard multi-member gzip file. zlib releases the GIL while it
+    compresses, so the blocks are compressed in parallel.
+    """
+    def __init__(self, fileobj, workers=None, block_size=1024 * 1024, compresslevel=9):
+        self.fileobj = fileobj
+        self.workers = workers or cpu_count()
+        self.block_size = block_size
+        self.compresslevel = compresslevel
+        # Level of the blocks being buffered, 0 while storing incompressible data
+        self._level = compresslevel
+        # Uncompressed bytes written so far
+        self._position = 0
+
+        self._buffer = []
+        self._buffered = 0
+        # Compressed blocks not written yet, bounded to keep memory flat
+        self._pending = collections.deque()
+        self._max_pending = self.workers * 2
+        self._pool = ThreadPool(self.workers)
+
+    def _compress_block(self, data, level):
+        # wbits 16 + MAX_WBITS writes a gzip header and trailer
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def _submit(self, data):
+        self._pending.append(self._pool.apply_async(self._compress_block, (data, self._level)))
+        while len(self._pending) >= self._max_pending:
+            self.fileobj.write(self._pending.popleft().get())
+
+    def write(self, data):
+        self._buffer.append(bytes(data))
+        self._buffered += len(data)
+        self._position += len(data)
+        if self._buffered >= self.block_size:
+            buffered = b''.join(self._buffer)
+            full_blocks_size = len(buffered) - len(buffered) % self.block_size
+            for start in range(0, full_blocks_size, self.block_size):
+                self._submit(buffered[start:start + self.block_size])
+            self._buffer = [buffered[full_blocks_size:]]
+            self._buffered = len(self._buffer[0])
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def tell(self):
+        return self._position
+
+    def set_compressible(self, compressible):
+        """
+        Store the data written next without compressing it, or go back to
+        compressing it. Blocks only have one level, so this ends the block
+        being buffered.
+        """
+        level = self.compresslevel if compressible else 0
+        if level == self._level:
+            return
+        if self._buffered:
+            self._submit(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+        self._level = level
+
+    def close(self):
+        """
+        Compress the buffered data and write all pending blocks
+        """
+        if self._pool is None:
+            return
+        try:
+            if self._buffered or not self._pending:
+                # An empty input still needs one valid gzip member
+                self._submit(b''.join(self._buffer))
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().get())
+        finally:
+            self.terminate()
+
+    def terminate(self):
+        """
+        Stop the compression threads without writing pending blocks
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+            self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+# Formats that are already compressed, so compressing them again is wasted
+INCOMPRESSIBLE_EXTENSIONS = frozenset([
+    '.7z', '.avi', '.bz2', '.flac', '.gif', '.gz', '.heic', '.jp2', '.jpeg', '.jpg', '.lz4',
+    '.m4a', '.mkv', '.mov', '.mp3', '.mp4', '.npz', '.ogg', '.parquet', '.png', '.rar', '.tgz',
+    '.webm', '.webp', '.xz', '.zip', '.zst',
+])
+# Files smaller than this are always compressed, probing them isn't worth it
+MIN_PROBE_FILE_SIZE = 64 * 1024
+ENTROPY_PROBE_SIZE = 4096
+# Bits per byte above which a probe looks like compressed or random data
+INCOMPRESSIBLE_ENTROPY = 7.5
+
+
+def byte_entropy(data):
+    """
+    Shannon entropy of data in bits per byte
+    """
+    counts = collections.Counter(bytearray(data))
+    total = float(len(data))
+    return -sum(count / total * math.log(count / total, 2) for count in counts.values())
+
+
+def is_incompressible(path):
+    """
+    Guess from its extension, or the entropy of its first bytes, whether a
+    file is already compressed
+    """
+    try:
+        if os.path.getsize(path) < MIN_PROBE_FILE_SIZE:
+            return False
+        if os.path.splitext(path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+            return True
+        with open(path, 'rb') as f:
+            probe = f.read(ENTROPY_PROBE_SIZE)
+    except (IOError, OSError):
+        return False
+    return byte_entropy(probe) >= INCOMPRESSIBLE_ENTROPY
+
+
+class OnFirstRead(object):
+    """
+    File object wrapper calling callback right before the first read
+    """
+    def __init__(self, fileobj, callback):
+        self.fileobj = fileobj
+        self.callback = callback
+
+    def read(self, size=-1):
+        if self.callback is not None:
+            self.callback()
+            self.callback = None
+        return self.fileobj.read(size)
+
+
+class CompressObjWriter(object):
+    """
+    Write only file object compressing into fileobj with a compressobj-like
+    object: compress(data) returns the compressed bytes available so far and
+    flush() the rest when the stream ends.
+    """
+    def __init__(self, fileobj, compressobj):
+        self.fileobj = fileobj
+        self.compressobj = compressobj
+        self._position = 0
+
+    def write(self, data):
+        compressed = self.compressobj.compress(data)
+        if compressed:
+            self.fileobj.write(compressed)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.fileobj.write(self.compressobj.flush())
+
+
+class ArchiveCodec(object):
+    """
+    Compression of the data tarball. writer(fileobj, workers) returns a
+    context manager yielding the file object the tar stream is written to,
+    which tells how many bytes were written to it.
+    """
+    name = None
+    # data_type of the DataRequest, telling the server how to unpack it
+    data_type = None
+    extension = None
+    # Python package needed by the codec, if any
+    requires = None
+    # Whether compression is spread across the workers
+    parallel = False
+    # First bytes of the compressed stream
+    magic = None
+
+    def available(self):
+        return True
+
+    def writer(self, fileobj, workers):
+        raise NotImplementedError
+
+    def decompress_header(self, header, size):
+        """
+        Returns up to the first size bytes of the tar stream, given the
+        first bytes of the archive
+        """
+        raise NotImplementedError
+
+
+class GzipCodec(ArchiveCodec):
+    name = data_type = 'gzip'
+    extension = '.tar.gz'
+    parallel = True
+    magic = b'\x1f\x8b'
+
+    def writer(self, fileobj, workers):
+        # Even with one worker, so incompressible files can be stored
+        return ParallelGzipWriter(fileobj, workers=workers)
+
+    def compressobj(self):
+        return zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def decompress_header(self, header, size):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(header, size)
+
+
+class ZstdCodec(ArchiveCodec):
+    name = data_type = 'zstd'
+    extension = '.tar.zst'
+    requires = 'zstandard'
+    parallel = True
+    magic = b'\x28\xb5\x2f\xfd'
+
+    def available(self):
+        return zstandard is not None
+
+    def writer(self, fileobj, workers):
+        return CompressObjWriter(fileobj, self.compressobj(workers))
+
+    def compressobj(self, workers=1):
+        return zstandard.ZstdCompressor(threads=workers if workers > 1 else 0).compressobj()
+
+    def decompress_header(self, header, size):
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(header)).read(size)
+
+
+class Lz4FrameCompressObj(object):
+    def __init__(self):
+        self.compressor = lz4.frame.LZ4FrameCompressor()
+        self.header = self.compressor.begin()
+
+    def compress(self, data):
+        compressed = self.header + self.compressor.compress(bytes(data))
+        self.header = b''
+        return compressed
+
+    def flush(self):
+        return self.header + self.compressor.flush()
+
+
+class Lz4Codec(ArchiveCodec):
+    name = data_type = 'lz4'
+    extension = '.tar.lz4'
+    requires = 'lz4'
+    magic = b'\x04\x22\x4d\x18'
+
+    def available(self):
+        return lz4 is not None
+
+    def writer(self, fileobj, workers):
+        return CompressObjWriter(fileobj, self.compressobj())
+
+    def compressobj(self):
+        return Lz4FrameCompressObj()
+
+    def decompress_header(self, header, size):
+        return lz4.frame.LZ4FrameDecompressor().decompress(header, max_length=size)
+
+
+class StoreCodec(ArchiveCodec):
+    name = 'store'
+    data_type = 'tar'
+    extension = '.tar'
+
+    @contextlib.contextmanager
+    def writer(self, fileobj, workers):
+        yield fileobj
+
+    def compressobj(self):
+        return None
+
+    def decompress_header(self, header, size):
+        return header[:size]
+
+
+ARCHIVE_CODECS = collections.OrderedDict(
+    (codec.name, codec) for codec in [GzipCodec(), ZstdCodec(), Lz4Codec(), StoreCodec()])
+
+# Assumed upload bandwidth, in bytes per second, until one is measured
+DEFAULT_UPLOAD_BANDWIDTH = 5 * 1024 * 1024
+# Data sampled to pick a codec: at most SAMPLE_FILE_SIZE from each file
+SAMPLE_SIZE = 8 * 1024 * 1024
+SAMPLE_FILE_SIZE = 1024 * 1024
+
+
+def get_archive_codec(name):
+    """
+    Returns the ArchiveCodec called name, or raises FloydException if it
+    is unknown or its package is not installed
+    """
+    codec = ARCHIVE_CODECS.get(name)
+    if codec is None:
+        raise FloydException("Unknown codec: %s" % name)
+    if not codec.available():
+        raise FloydException("The %s codec requires the %s package: pip install %s" % (
+            codec.name, codec.requires, codec.requires))
+    return codec
+
+
+# Bytes read from the start of an archive to check it, enough for the
+# first block of any codec
+ARCHIVE_HEADER_SIZE = 256 * 1024
+
+
+def detect_archive_codec(header):
+    """
+    Returns the ArchiveCodec of an archive given its first bytes, after
+    checking that they start a tar stream. Raises FloydException if they
+    don't.
+    """
+    codec = ARCHIVE_CODECS['store']
+    for archive_codec in ARCHIVE_CODECS.values():
+        if archive_codec.magic and header.startswith(archive_codec.magic):
+            codec = archive_codec
+            break
+
+    if not codec.available():
+        # The archive is uploaded as is, only its check needs the package
+        floyd_logger.debug("Not checking the %s archive, %s is not installed", codec.name, codec.requires)
+        return codec
+
+    try:
+        block = codec.decompress_header(header, tarfile.BLOCKSIZE)
+        tarfile.TarInfo.frombuf(block, tarfile.ENCODING, 'replace')
+    except tarfile.EOFHeaderError:
+        raise FloydException("The archive is empty.")
+    except Exception:
+        # Each compression package raises its own errors on corrupted data
+        raise FloydException("The archive is not a tar, tar.gz, tar.zst or tar.lz4 file.")
+    return codec
+
+
+class IterReader(object):
+    """
+    Read only file object over an iterator of bytes chunks, e.g. the
+    iter_content of a streamed response
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        # Chunk being read, and the offset of its unread bytes. Reads only
+        # copy the bytes they return, however large the chunks are.
+        self.chunk = b''
+        self.offset = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self.chunk[self.offset:] + b''.join(self.chunks)
+            self.chunk, self.offset = b'', 0
+            return data
+        parts = []
+        while size > 0:
+            if self.offset >= len(self.chunk):
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    break
+                self.chunk, self.offset = chunk, 0
+                continue
+            part = self.chunk[self.offset:self.offset + size]
+            self.offset += len(part)
+            size -= len(part)
+            parts.append(part)
+        return b''.join(parts)
+
+
+class PrefixedReader(object):
+    """
+    Read only file object returning prefix, then the rest of fileobj.
+    Used to read a stream again from the start once its header is checked.
+    """
+    def __init__(self, prefix, fileobj):
+        self.prefix = prefix
+        self.fileobj = fileobj
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.fileobj.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.fileobj.read(), b''
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.fileobj.read(size - len(data))
+        return data
+
+
+def sample_data(source_dir, sample_size=SAMPLE_SIZE, file_sample_size=SAMPLE_FILE_SIZE):
+    """
+    Returns up to sample_size bytes read from the start of the files under
+    source_dir
+    """
+    sample = []
+    size = 0
+    for dir_path, dir_names, file_names in os.walk(source_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if size >= sample_size:
+                return b''.join(sample)
+            try:
+                with open(os.path.join(dir_path, file_name), 'rb') as f:
+                    block = f.read(min(file_sample_size, sample_size - size))
+            except (IOError, OSError):
+                continue
+            sample.append(block)
+            size += len(block)
+    return b''.join(sample)
+
+
+def choose_archive_codec(source_dir, bandwidth=None, workers=None, pipelined=False):
+    """
+    Pick the available codec that should compress and upload the data in
+    source_dir the fastest, from the ratio and speed of each codec on a
+    sample of the data and the upload bandwidth in bytes per second.
+
+    With pipelined, compression overlaps with the upload so the slower of
+    the two sets the pace; otherwise the upload starts after compression.
+    """
+    bandwidth = bandwidth or DEFAULT_UPLOAD_BANDWIDTH
+    workers = workers or cpu_count()
+    sample = sample_data(source_dir)
+    if not sample:
+        return ARCHIVE_CODECS['gzip']
+
+    best_codec, best_seconds = None, None
+    for codec in ARCHIVE_CODECS.values():
+        if not codec.available():
+            continue
+        compressobj = codec.compressobj()
+        if compressobj is None:
+            compressed_size, compress_seconds = len(sample), 0.0
+        else:
+            start = time.time()
+            compressed_size = len(compressobj.compress(sample)) + len(compressobj.flush())
+            compress_seconds = (time.time() - start) / (workers if codec.parallel else 1)
+        upload_seconds = float(compressed_size) / bandwidth
+        if pipelined:
+            seconds = max(compress_seconds, upload_seconds)
+        else:
+            seconds = compress_seconds + upload_seconds
+        floyd_logger.debug("Codec %s: ratio %.2f, %.2fs to compress and %.2fs to upload %s",
+                           codec.name, float(compressed_size) / len(sample), compress_seconds,
+                           upload_seconds, sizeof_fmt(len(sample)))
+        if best_seconds is None or seconds < best_seconds:
+            best_codec, best_seconds = codec, seconds
+    return best_codec
+
+
+class RingBuffer(object):
+    """
+    Bounded in-memory byte pipe between a writing and a reading thread.
+
+    write() blocks while the buffer is full and read() blocks until enough
+    bytes are available, so a producer never gets more than capacity bytes
+    ahead of its consumer. The writer calls close() at the end of the
+    stream; either side can abort() it with an exception that is raised in
+    the other one.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    def write(self, data):
+        view = memoryview(data)
+        while len(view):
+            with self._condition:
+                while self._size == self.capacity and not self._error:
+                    self._condition.wait()
+                if self._error:
+                    raise self._error
+
+                count = min(len(view), self.capacity - self._size)
+                end = (self._start + self._size) % self.capacity
+                head = min(count, self.capacity - end)
+                self._buffer[end:end + head] = view[:head]
+                self._buffer[:count - head] = view[head:count]
+                self._size += count
+                self._condition.notify_all()
+            view = view[count:]
+        return len(data)
+
+    def read(self, size):
+        """
+        Read size bytes, or less only at the end of the stream
+        """
+        data = bytearray()
+        with self._condition:
+            while len(data) < size:
+                while not self._size and not self._closed and not self._error:
+                    self._condition.wait()
+                if self._error:
+                    raise self._error
+                if not self._size:
+                    break
+
+                count = min(size - len(data), self._size)
+                head = min(count, self.capacity - self._start)
+                data += self._buffer[self._start:self._start + head]
+                data += self._buffer[:count - head]
+                self._start = (self._start + count) % self.capacity
+                self._size -= count
+                self._condition.notify_all()
+        return bytes(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def abort(self, error):
+        with self._condition:
+            self._error = error
+            self._condition.notify_all()
+
+
+class HashingWriter(object):
+    """
+    File object wrapper hashing everything written through it
+    """
+    def __init__(self, fileobj, algorithm='sha256'):
+        self.fileobj = fileobj
+        self._hash = hashlib.new(algorithm)
+        self._position = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self._position += len(data)
+        return self.fileobj.write(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+class IncrementalFileHash(object):
+    """
+    Hash of a file computed from the chunks read to upload it, so the file
+    isn't read an extra time. Chunks may come out of order after a failure
+    or a resume: bytes already hashed are skipped, and skipped over bytes
+    are read from the file.
+    """
+    def __init__(self, path, algorithm='sha256'):
+        self.path = path
+        self._hash = hashlib.new(algorithm)
+        # Bytes [0, offset) of the file are hashed
+        self.offset = 0
+
+    def _update_from_file(self, end, block_size=1024 * 1024):
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            while self.offset < end:
+                block = f.read(min(block_size, end - self.offset))
+                if not block:
+                    break
+                self._hash.update(block)
+                self.offset += len(block)
+
+    def update(self, offset, data):
+        if offset > self.offset:
+            self._update_from_file(offset)
+        if offset <= self.offset < offset + len(data):
+            self._hash.update(data[self.offset - offset:])
+            self.offset = offset + len(data)
+
+    def hexdigest(self, size):
+        """
+        Hex digest of the first size bytes of the file
+        """
+        self._update_from_file(size)
+        return self._hash.hexdigest()
+
+
+class ReadAheadReader(object):
+    """
+    Reads a file in blocks of block_size bytes, the next block being read
+    on a background thread while chunks of the current one are sent.
+
+    Every read() returns a memoryview of the block holding the chunk, in
+    one of two preallocated buffers, so chunks of any size are served from
+    the block read ahead, e.g. as the adaptive chunk size changes. Only a
+    chunk spanning two blocks is copied. The view is only valid until the
+    next read(). Reads outside of the current and next blocks, e.g. after a
+    failed upload, read a new block synchronously.
+    """
+    DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, path, block_size=None):
+        self.path = path
+        # Blocks are never larger than the file
+        self.size = os.path.getsize(path)
+        self.block_size = max(min(block_size or self.DEFAULT_BLOCK_SIZE, self.size), 1)
+        self._file = open(path, 'rb')
+        self._buffers = [None, None]
+        # (buffer index, offset, size) of the block chunks are read from
+        self._current = None
+        # (buffer index, offset, AsyncResult) of the block being read ahead
+        self._pending = None
+        self._pool = ThreadPool(1)
+
+    def _read_into(self, index, offset):
+        if self._buffers[index] is None:
+            self._buffers[index] = bytearray(self.block_size)
+        self._file.seek(offset)
+        view = memoryview(self._buffers[index])
+        read = 0
+        while read < self.block_size:
+            count = self._file.readinto(view[read:])
+            if not count:
+                break
+            read += count
+        return read
+
+    def _set_current(self, index, offset, size):
+        self._current = (index, offset, size)
+        if size == self.block_size:
+            self._pending = (1 - index, offset + size,
+                             self._pool.apply_async(self._read_into, (1 - index, offset + size)))
+        return self._current
+
+    def _block(self, offset):
+        """
+        Returns the block starting at or holding offset
+        """
+        current = self._current
+        if current is not None and current[1] <= offset < current[1] + current[2]:
+            return current
+
+        if self._pending is not None:
+            index, pending_offset, result = self._pending
+            self._pending = None
+            size = result.get()
+            if pending_offset == offset:
+                return self._set_current(index, offset, size)
+
+        index = 0 if current is None else 1 - current[0]
+        return self._set_current(index, offset, self._read_into(index, offset))
+
+    def read(self, offset, size):
+        index, block_offset, block_size = self._block(offset)
+        start = offset - block_offset
+        if start + size <= block_size or block_offset + block_size >= self.size:
+            # Within the block, or up to the end of the file
+            return memoryview(self._buffers[index])[start:min(start + size, block_size)]
+
+        # The chunk goes on in the next blocks
+        data = bytearray()
+        while len(data) < size:
+            index, block_offset, block_size = self._block(offset + len(data))
+            start = offset + len(data) - block_offset
+            if start >= block_size:
+                break
+            data += memoryview(self._buffers[index])[start:min(start + size - len(data), block_size)]
+        return memoryview(data)
+
+    def close(self):
+        if self._pending is not None:
+            self._pending[2].wait()
+        self._pool.close()
+        self._pool.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class DataCompressor(object):
     """
     Local Data Compression with progress bar.
+
+    The source directory is walked once, while it is being compressed. The
+    progress bar tracks the bytes compressed against an estimate of the
+    total that firms up as more directories are listed.
     """
     def __init__(self,
                  source_dir,
-                 filename):
+                 filename=None,
+                 compress_workers=None,
+                 fileobj=None,
+                 codec=None,
+                 store_incompressible=True,
+                 ignore_matcher=None,
+                 include=None,
+                 only_files=None,
+                 files=None,
+                 keep_dir=False):
         # Data directory to compress
         self.source_dir = source_dir
+        # FloydIgnoreMatcher of the paths, relative to source_dir, left out
+        self.ignore_matcher = ignore_matcher or FloydIgnoreMatcher()
+        # If given, only the files matching one of these globs are added
+        self.include = GlobSet(include) if include else None
+        # If given, the set of relative paths of the only regular files added,
+        # e.g. the files changed since the last upload
+        self.only_files = only_files
+        # If given, the relative paths of the only entries added, instead of
+        # walking source_dir, e.g. the files of a shard
+        self.files = files
         # Archive (Tar file) name
         # e.g. "/tmp/contents.tar.gz"
         self.filename = filename
+        # Only remove the archive, not its whole directory, when compression
+        # fails, e.g. for a shard next to the other shards
+        self.keep_dir = keep_dir
+        # Or file object the archive is streamed to, e.g. a RingBuffer
+        self.fileobj = fileobj
+        # ArchiveCodec compressing the tar stream, gzip by default
+        self.codec = codec or ARCHIVE_CODECS['gzip']
+        # Store files that are already compressed instead of compressing them
+        # again, with the codecs whose writer supports it
+        self.store_incompressible = store_incompressible
+        # Number of threads compressing the archive, for the codecs that
+        # compress in parallel
+        self.compress_workers = compress_workers or cpu_count()
+
+        # Hex SHA-256 of the archive, computed while it is written
+        self.sha256 = None
 
         # Prgress Bar for tracking data compression
         self.__compression_bar = None
 
-        # Number of files to compress
-        self.__files_to_compress = 0
-        self.__get_nfiles_to_compress()
-
-        # Number of files already compressed
+        # Number of files and bytes already compressed
         self.__files_compressed = 0
+        self.__bytes_compressed = 0
+
+        # Walk state used to estimate the total: directories waiting to be
+        # listed, and the number of directories and entries listed so far
+        self.__pending_dirs = []
+        self.__dirs_listed = 0
+        self.__entries_listed = 0
+        # Entries of files not yielded yet
+        self.__files_pending = 0
+
+        # (files, dirs, others) found by the first walk of the list methods
+        self.__listing = None
 
-    def __get_nfiles_to_compress(self):
+    def estimated_total(self):
         """
-        Return the number of files to compress
+        Return the estimated (number of files, bytes) to compress
 
-        Note: it should take about 0.1s for counting 100k files on a dual core machine
+        Unlisted directories are assumed to hold as many entries as the
+        average directory listed so far, and every entry as many bytes as
+        the average entry compressed so far.
         """
-        floyd_logger.info("Get number of files to compress... (this could take a few seconds)")
-        paths = [self.source_dir]
-        try:
-            # Traverse each subdirs of source_dir and count files/dirs
-            while paths:
-                path = paths.pop()
-                for item in scandir(path):
-                    if item.is_dir():
-                        paths.append(item.path)
-                        self.__files_to_compress += 1
-                    elif item.is_file():
-                        self.__files_to_compress += 1
-        except OSError as e:
-            # OSError: [Errno 13] Permission denied
-            if e.errno == errno.EACCES:
-                self.source_dir = os.getcwd() if self.source_dir == '.' else self.source_dir  # Expand cwd
-                sys.exit(("Permission denied. Make sure to have read permission "
-                          "for all the files and directories in the path: %s")
-                         % (self.source_dir))
-        floyd_logger.info("Compressing %d files", self.__files_to_compress)
+        files_total = self.__files_compressed + self.__files_pending
+        if self.__dirs_listed:
+            files_total += len(self.__pending_dirs) * self.__entries_listed // self.__dirs_listed
+        if not self.__files_compressed:
+            return files_total, self.__bytes_compressed
+        bytes_total = self.__bytes_compressed * files_total // self.__files_compressed
+        return files_total, bytes_total
+
+    def __iter_source(self):
+        """
+        Yield the (path, arcname, is_file) of every entry of source_dir,
+        depth first, where is_file tells regular files from directories,
+        symlinks and others
+        """
+        root_arcname = os.path.basename(self.source_dir)
+        yield self.source_dir, root_arcname, False
+
+        if self.files is not None:
+            for entry in self.__iter_files(root_arcname):
+                yield entry
+            return
+
+        self.__pending_dirs = [(self.source_dir, root_arcname)]
+        self.__dirs_listed = 0
+        self.__entries_listed = 0
+        while self.__pending_dirs:
+            dir_path, dir_arcname = self.__pending_dirs.pop()
+            entries = sorted(scandir(dir_path), key=lambda entry: entry.name)
+            self.__dirs_listed += 1
+            self.__entries_listed += len(entries)
+
+            for entry in entries:
+                arcname = os.path.join(dir_arcname, entry.name)
+                # Like tarfile.add, don't follow symlinks to directories
+                if entry.is_dir(follow_symlinks=False) and not self.__excluded(arcname, True):
+                    self.__pending_dirs.append((entry.path, arcname))
+                yield entry.path, arcname, entry.is_file(follow_symlinks=False)
+
+    def __iter_files(self, root_arcname):
+        """
+        Yield the (path, arcname, is_file) of the entries in files and of
+        their parent directories, without listing any directory
+        """
+        entries = set()
+        for relative_path in self.files:
+            parts = relative_path.split('/')
+            entries.update('/'.join(parts[:depth]) for depth in range(1, len(parts) + 1))
+
+        self.__files_pending = len(entries)
+        for relative_path in sorted(entries):
+            self.__files_pending -= 1
+            path = os.path.join(self.source_dir, relative_path)
+            is_file = os.path.isfile(path) and not os.path.islink(path)
+            yield path, os.path.join(root_arcname, relative_path), is_file
+
+    def __relative_path(self, arcname):
+        """
+        Path, relative to source_dir, of the entry with this name in the
+        archive
+        """
+        root_depth = len([part for part in unix_style_path(os.path.basename(self.source_dir)).split('/') if part])
+        return '/'.join([part for part in unix_style_path(arcname).split('/') if part][root_depth:])
+
+    def __excluded(self, arcname, is_dir):
+        """
+        Whether the entry with this name in the archive is left out
+        """
+        path = self.__relative_path(arcname)
+        if not path:
+            # The root directory
+            return False
+        if self.ignore_matcher.ignores(path):
+            return True
+        if is_dir or self.include is None:
+            return False
+        return not self.include.match_parts(FloydIgnoreMatcher.split_path(path))
+
+    def __skipped_file(self, arcname):
+        """
+        Whether the regular file with this name in the archive is left out
+        """
+        if self.__excluded(arcname, False):
+            return True
+        return self.only_files is not None and self.__relative_path(arcname) not in self.only_files
+
+    def __list(self):
+        """
+        Returns the (path, stat_result) of the regular files to compress,
+        ignoring only_files, and the relative paths of the directories and
+        of the other entries, e.g. symlinks. The source is only walked the
+        first time.
+        """
+        if self.__listing is None:
+            files, dirs, others = [], [], []
+            for path, arcname, is_file in self.__iter_source():
+                # Like tarfile.add, symlinks are not followed
+                is_dir = not is_file and os.path.isdir(path) and not os.path.islink(path)
+                relative_path = self.__relative_path(arcname)
+                if not relative_path or self.__excluded(arcname, is_dir):
+                    continue
+                if is_file:
+                    files.append((path, os.stat(path)))
+                elif is_dir:
+                    dirs.append(relative_path)
+                else:
+                    others.append(relative_path)
+            self.__listing = files, dirs, others
+        return self.__listing
+
+    def list_files(self):
+        """
+        Returns the (path, stat_result) of the regular files to compress,
+        ignoring only_files
+        """
+        return self.__list()[0]
+
+    def list_dirs(self):
+        """
+        Returns the relative paths of the directories to compress
+        """
+        return self.__list()[1]
+
+    def list_other_entries(self):
+        """
+        Returns the relative paths of the entries to compress that are
+        neither regular files nor directories, e.g. symlinks
+        """
+        return self.__list()[2]
+
+    def plan_shards(self, shards):
+        """
+        Split the regular files to compress, restricted to only_files if
+        set, into up to shards sets of relative paths of about the same
+        total size. Each set can be passed as files to the compressor of a
+        shard.
+        """
+        files = []
+        for path, file_stat in self.list_files():
+            relative_path = unix_style_path(os.path.relpath(path, self.source_dir))
+            if self.only_files is None or relative_path in self.only_files:
+                files.append((file_stat.st_size, relative_path))
+
+        # Largest files first, each to the shard with the fewest bytes
+        shard_sizes = [(0, index) for index in range(shards)]
+        shard_files = [set() for _ in range(shards)]
+        for size, relative_path in sorted(files, key=lambda f: (-f[0], f[1])):
+            shard_size, index = heapq.heappop(shard_sizes)
+            shard_files[index].add(relative_path)
+            heapq.heappush(shard_sizes, (shard_size + size, index))
+        return [paths for paths in shard_files if paths] or [set()]
+
+    def __add_stored(self, tar, path, arcname, tar_filter, set_compressible):
+        """
+        Add a file like tarfile.add, compressing its header but storing its
+        content
+        """
+        set_compressible(True)
+        tarinfo = tar_filter(tar.gettarinfo(path, arcname))
+        if tarinfo is None:
+            return
+        if not tarinfo.isreg():
+            tar.addfile(tarinfo)
+            return
+        with open(path, 'rb') as f:
+            tar.addfile(tarinfo, OnFirstRead(f, lambda: set_compressible(False)))
+
+    @contextlib.contextmanager
+    def __open_archive(self):
+        if self.fileobj is not None:
+            archive = HashingWriter(self.fileobj)
+            yield archive
+        else:
+            with open(self.filename, "wb") as archive_file:
+                archive = HashingWriter(archive_file)
+                yield archive
+        self.sha256 = archive.hexdigest()
+
+    def __add_source(self, tar, tar_filter, compressed):
+        set_compressible = getattr(compressed, 'set_compressible', None) if self.store_incompressible else None
+        for path, arcname, is_file in self.__iter_source():
+            if is_file and self.__skipped_file(arcname):
+                # Left out before it is ever opened or probed
+                continue
+            if set_compressible is not None and is_file and is_incompressible(path):
+                self.__add_stored(tar, path, arcname, tar_filter, set_compressible)
+            else:
+                tar.add(path, arcname=arcname, recursive=False, filter=tar_filter)
+        if set_compressible is not None:
+            # The end of archive blocks are all zeros
+            set_compressible(True)
+        self.__show_progress()
+
+    def __show_progress(self):
+        _, bytes_total = self.estimated_total()
+        self.__compression_bar.label = "%d files " % self.__files_compressed
+        # Progress is shown in KiB, and the estimate can't be below the progress
+        kib_compressed = self.__bytes_compressed // 1024
+        self.__compression_bar.show(kib_compressed, count=max(bytes_total // 1024, kib_compressed, 1))
 
     def create_tarfile(self):
         """
         Create a tar file with the contents of the current directory
         """
         floyd_logger.info("Compressing data...")
-        # Show progress bar (file_compressed/file_to_compress)
-        self.__compression_bar = ProgressBar(expected_size=self.__files_to_compress, filled_char='=')
+        # Show progress bar (KiB compressed/estimated KiB to compress)
+        self.__compression_bar = ProgressBar(expected_size=1, filled_char='=')
 
         # Auxiliary functions
         def dfilter_file_counter(tarinfo):
             """
-            Dummy filter function used to track the progression at file levels.
+            Filter function leaving out the excluded paths and tracking the
+            progression at file levels.
             """
-            self.__compression_bar.show(self.__files_compressed)
+            if self.__excluded(tarinfo.name, tarinfo.isdir()):
+                return None
+            self.__show_progress()
             self.__files_compressed += 1
+            self.__bytes_compressed += tarinfo.size
             return tarinfo
 
         def warn_purge_exit(info_msg, filename, progress_bar, exit_msg):
@@ -201,14 +1450,22 @@ class DataCompressor(object):
             """
             progress_bar.done()
             floyd_logger.info(info_msg)
-            rmtree(os.path.dirname(filename))
+            if filename and self.keep_dir:
+                if os.path.exists(filename):
+                    os.remove(filename)
+            elif filename:
+                rmtree(os.path.dirname(filename))
             sys.exit(exit_msg)
 
         try:
             # Define the default signal handler for catching: Ctrl-C
             signal.signal(signal.SIGINT, signal.default_int_handler)
-            with tarfile.open(self.filename, "w:gz") as tar:
-                tar.add(self.source_dir, arcname=os.path.basename(self.source_dir), filter=dfilter_file_counter)
+            # Unlike "w|", "w" doesn't buffer the tar stream, so every file
+            # reaches the writer right after its set_compressible call
+            with self.__open_archive() as archive, \
+                    self.codec.writer(archive, self.compress_workers) as compressed, \
+                    tarfile.open(fileobj=compressed, mode="w") as tar:
+                self.__add_source(tar, dfilter_file_counter, compressed)
             self.__compression_bar.done()
         except (OSError, IOError) as e:
             # OSError: [Errno 13] Permission denied
@@ -1,16 +1,34 @@
 import json
+import os
 import sys
+import uuid
 from clint.textui.progress import Bar as ProgressBar
+import requests
 
 from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 
 from floyd.client.base import FloydHttpClient
-from floyd.client.files import get_files_in_current_directory, sizeof_fmt
-from floyd.exceptions import FloydException
+from floyd.client.files import (
+    get_files_in_current_directory, list_files_in_current_directory, iter_code_bundle,
+    build_file_manifest, unix_style_path, sizeof_fmt, CODE_BUNDLE_CODECS
+)
+from floyd.exceptions import (
+    AuthenticationException, FloydException, SizeLimitExceededException
+)
+from floyd.manager.code_manifest import CodeManifestManager
 from floyd.log import logger as floyd_logger
 from floyd.model.module import Module
 
 
+CODE_TOO_LARGE_MSG = ("Code size too large to sync, please keep it under %s.\n"
+                      "If you have data files in the current directory, please upload them "
+                      "separately using \"floyd data\" command and remove them from here.\n"
+                      "You may find the following documentation useful:\n\n"
+                      "\thttps://docs.floydhub.com/guides/create_and_upload_dataset/\n"
+                      "\thttps://docs.floydhub.com/guides/data/mounting_data/\n"
+                      "\thttps://docs.floydhub.com/guides/floyd_ignore/")
+
+
 def create_progress_callback(encoder):
     encoder_len = encoder.len
     bar = ProgressBar(expected_size=encoder_len, filled_char='=')
@@ -21,64 +39,195 @@ def create_progress_callback(encoder):
     return callback, bar
 
 
+class BundleBody(object):
+    """
+    Chunked multipart/form-data body made of text fields followed by a
+    compressed code bundle part streamed from bundle_chunks.
+
+    Raises SizeLimitExceededException while streaming if the bundle goes
+    over max_size bytes.
+    """
+    def __init__(self, fields, bundle_chunks, codec='gzip', max_size=None):
+        self.fields = fields
+        self.bundle_chunks = bundle_chunks
+        self.bundle_name, self.bundle_content_type = CODE_BUNDLE_CODECS[codec]
+        self.max_size = max_size
+        self.boundary = uuid.uuid4().hex
+        # Compressed bytes of the bundle sent so far
+        self.size = 0
+
+    @property
+    def content_type(self):
+        return "multipart/form-data; boundary=%s" % self.boundary
+
+    def __iter__(self):
+        for name, value in self.fields:
+            yield ("--%s\r\nContent-Disposition: form-data; name=\"%s\"\r\n\r\n%s\r\n" % (
+                self.boundary, name, value)).encode('utf-8')
+
+        yield ("--%s\r\nContent-Disposition: form-data; name=\"code_bundle\"; filename=\"%s\"\r\n"
+               "Content-Type: %s\r\n\r\n" % (
+                   self.boundary, self.bundle_name, self.bundle_content_type)).encode('utf-8')
+        for chunk in self.bundle_chunks:
+            self.size += len(chunk)
+            if self.max_size is not None and self.size > self.max_size:
+                raise SizeLimitExceededException()
+            yield chunk
+
+        yield ("\r\n--%s--\r\n" % self.boundary).encode('utf-8')
+
+
 class ModuleClient(FloydHttpClient):
     """
     Client to interact with modules api
     """
 
     MAX_UPLOAD_SIZE = 1024 * 1024 * 100
+    MAX_BUNDLE_SOURCE_SIZE = MAX_UPLOAD_SIZE * 10
 
     def __init__(self):
         self.url = "/modules/"
         super(ModuleClient, self).__init__()
 
-    def create(self, module, cli_default=None):
+    def create(self, module, cli_default=None, bundle=None):
+        """
+        Sync the code in the current directory and create the module.
+
+        With bundle set to a codec of CODE_BUNDLE_CODECS, the files are sent
+        as one compressed tarball instead of one part per file.
+        """
+        # The walk stops as soon as the code goes over the size limit. Bundles
+        # are checked on their compressed size, so only cut off their source
+        # when it is clearly too large to compress under the limit.
+        max_source_size = self.MAX_BUNDLE_SOURCE_SIZE if bundle else self.MAX_UPLOAD_SIZE
         try:
-            upload_files, total_file_size = get_files_in_current_directory(file_type='code')
-        except OSError:
-            sys.exit("Directory contains too many files to upload. If you have data files in the current directory, "
-                     "please upload them separately using \"floyd data\" command and remove them from here.\n"
-                     "See http://docs.floydhub.com/faqs/job/#i-get-too-many-open-files-error-when-i-run-my-project "
-                     "for more details on how to fix this.")
-
-        if total_file_size > self.MAX_UPLOAD_SIZE:
-            sys.exit(("Code size too large to sync, please keep it under %s.\n"
-                      "If you have data files in the current directory, please upload them "
-                      "separately using \"floyd data\" command and remove them from here.\n"
-                      "You may find the following documentation useful:\n\n"
-                      "\thttps://docs.floydhub.com/guides/create_and_upload_dataset/\n"
-                      "\thttps://docs.floydhub.com/guides/data/mounting_data/\n"
-                      "\thttps://docs.floydhub.com/guides/floyd_ignore/") % (sizeof_fmt(self.MAX_UPLOAD_SIZE)))
-
-        floyd_logger.info("Creating project run. Total upload size: %s",
-                          sizeof_fmt(total_file_size))
-        floyd_logger.debug("Creating module. Uploading: %s files",
-                           len(upload_files))
-        floyd_logger.info("Syncing code ...")
+            files = list_files_in_current_directory(max_size=max_source_size)
+        except SizeLimitExceededException:
+            sys.exit(CODE_TOO_LARGE_MSG % sizeof_fmt(self.MAX_UPLOAD_SIZE))
+
+        manifest_path = os.path.abspath(CodeManifestManager.CONFIG_FILE_PATH)
+        files = [(path, stat) for path, stat in files if os.path.abspath(path) != manifest_path]
+        manifest = build_file_manifest(files, CodeManifestManager.get_manifest())
+
+        # Only send the content the server doesn't already have. Servers
+        # without content-addressed storage get the full file set.
+        missing_hashes = self.get_missing_blobs(module.family_id,
+                                                set(entry['sha256'] for entry in manifest.values()))
+        if missing_hashes is None:
+            upload_files = files
+        else:
+            upload_files = []
+            for file_path, stat in files:
+                sha256 = manifest[unix_style_path(file_path)]['sha256']
+                if sha256 in missing_hashes:
+                    upload_files.append((file_path, stat))
+                    # Identical files only need to be uploaded once
+                    missing_hashes.discard(sha256)
+
+        floyd_logger.debug("Creating module. Uploading: %s files, %s unchanged",
+                           len(upload_files), len(files) - len(upload_files))
 
         # Add request data
+        fields = []
+        if missing_hashes is not None:
+            fields.append(("manifest", json.dumps(
+                {path: entry['sha256'] for path, entry in manifest.items()})))
         args_payload = module.to_dict()
         if cli_default:
             args_payload['cli_default'] = cli_default
-        upload_files.append(("json", json.dumps(args_payload)))
+        fields.append(("json", json.dumps(args_payload)))
+
+        if bundle:
+            response = self.upload_bundle([file_path for file_path, _ in upload_files], fields, codec=bundle)
+        else:
+            response = self.upload_files(upload_files, fields)
+
+        CodeManifestManager.set_manifest(manifest)
+        return response.json().get("id")
+
+    def upload_files(self, files, fields):
+        """
+        Upload each file, given as (path, stat_result), as its own multipart
+        part along with fields
+        """
+        # Files are opened one at a time while the request body streams
+        upload_files, upload_size = get_files_in_current_directory(file_type='code',
+                                                                   files=files)
+
+        floyd_logger.info("Creating project run. Total upload size: %s",
+                          sizeof_fmt(upload_size))
+        floyd_logger.info("Syncing code ...")
+
         multipart_encoder = MultipartEncoder(
-            fields=upload_files
+            fields=upload_files + fields
         )
 
         # Attach progress bar
         progress_callback, bar = create_progress_callback(multipart_encoder)
         multipart_encoder_monitor = MultipartEncoderMonitor(multipart_encoder, progress_callback)
 
+        try:
+            return self.request("POST",
+                                self.url,
+                                data=multipart_encoder_monitor,
+                                headers={"Content-Type": multipart_encoder.content_type},
+                                timeout=3600)
+        finally:
+            # always make sure we clear the console
+            bar.done()
+
+    def upload_bundle(self, file_paths, fields, codec='gzip'):
+        """
+        Upload the files as a single compressed tarball part along with
+        fields. The tarball is compressed while the request body streams, and
+        MAX_UPLOAD_SIZE applies to its compressed size.
+        """
+        floyd_logger.info("Creating project run. Compressing %s files with %s",
+                          len(file_paths), codec)
+        floyd_logger.info("Syncing code ...")
+
+        bar = ProgressBar(expected_size=max(len(file_paths), 1), filled_char='=')
+        bundle_body = BundleBody(fields,
+                                 iter_code_bundle(file_paths, codec=codec, progress_callback=bar.show),
+                                 codec=codec,
+                                 max_size=self.MAX_UPLOAD_SIZE)
         try:
             response = self.request("POST",
                                     self.url,
-                                    data=multipart_encoder_monitor,
-                                    headers={"Content-Type": multipart_encoder.content_type},
+                                    data=iter(bundle_body),
+                                    headers={"Content-Type": bundle_body.content_type},
                                     timeout=3600)
+        except SizeLimitExceededException:
+            sys.exit(CODE_TOO_LARGE_MSG % sizeof_fmt(self.MAX_UPLOAD_SIZE))
         finally:
             # always make sure we clear the console
             bar.done()
-        return response.json().get("id")
+
+        floyd_logger.info("Total upload size: %s", sizeof_fmt(bundle_body.size))
+        return response
+
+    def get_missing_blobs(self, family_id, hashes):
+        """
+        Returns the subset of content hashes the server doesn't store yet for
+        the project, or None if the server doesn't support incremental sync.
+        """
+        if not family_id:
+            return None
+
+        try:
+            response = self.request("POST",
+                                    "{}code_blobs/missing".format(self.url),
+                                    json={"family_id": family_id,
+                                          "hashes": sorted(hashes)},
+                                    timeout=60,
+                                    exit_on_connection_error=False)
+            return set(response.json()["missing"])
+        except AuthenticationException:
+            raise
+        except (FloydException, requests.exceptions.RequestException, KeyError, ValueError) as e:
+            # Any other answer falls back to a full upload
+            floyd_logger.debug("Incremental code sync unavailable: %s", e)
+            return None
 
     def delete(self, id):
         try:
@@ -1,46 +1,296 @@
 from __future__ import print_function
 import base64
+import hashlib
 from clint.textui.progress import Bar as ProgressBar
+from multiprocessing.pool import ThreadPool
 import os
+import random
 import requests
+import threading
+import time
 
 import floyd
-from floyd.exceptions import FloydException, LockedException
+from floyd.exceptions import (
+    FloydException, LockedException, AuthenticationException, AuthorizationException,
+    BadRequestException, NotFoundException
+)
 from floyd.client.base import FloydHttpClient
+from floyd.client.files import sizeof_fmt, IncrementalFileHash, ReadAheadReader
 from floyd.log import logger as floyd_logger
 
 
+class AdaptiveChunkSize(object):
+    """
+    Picks upload chunk sizes between min_size and max_size from the measured
+    throughput, aiming for chunks that take about target_seconds to send.
+    Every failure halves the size, so less data is resent on flaky links.
+    """
+    def __init__(self, size, min_size, max_size, target_seconds=2.0):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.size = self._clamp(size)
+        # Moving average of the measured throughput, in bytes per second
+        self.throughput = None
+
+    def _clamp(self, size):
+        return int(max(self.min_size, min(self.max_size, size)))
+
+    def _set(self, size, reason):
+        size = self._clamp(size)
+        if size != self.size:
+            floyd_logger.debug("Upload chunk size set to %s (%s)", sizeof_fmt(size), reason)
+        self.size = size
+
+    def record_success(self, size, seconds):
+        throughput = size / max(seconds, 1e-3)
+        if self.throughput is None:
+            self.throughput = throughput
+        else:
+            self.throughput = 0.8 * self.throughput + 0.2 * throughput
+        # Grow gradually so one fast chunk doesn't jump straight to max_size
+        self._set(min(throughput * self.target_seconds, self.size * 2),
+                  "%s/s measured" % sizeof_fmt(throughput))
+
+    def record_failure(self):
+        self._set(self.size // 2, "chunk failed")
+
+
+class RetryBudget(object):
+    """
+    Decides whether a failed upload request is retried, and waits before the
+    retry with exponential backoff and full jitter.
+
+    Up to max_retries consecutive failures are retried; reset() is called
+    after every successful request. A locked upload is being processed by
+    the server, so it is waited on for up to max_locked_wait seconds in
+    total without using up the retries. Errors retrying can't fix, like
+    expired credentials or a deleted upload, are never retried.
+    """
+    FATAL_ERRORS = (AuthenticationException, AuthorizationException,
+                    BadRequestException, NotFoundException)
+
+    def __init__(self, max_retries, base_delay=1, max_delay=60, max_locked_wait=600):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_locked_wait = max_locked_wait
+        self.retries = 0
+        # Number and total seconds of waits on a locked upload
+        self.locked_waits = 0
+        self.locked_wait = 0
+
+    def reset(self):
+        self.retries = 0
+
+    def backoff(self, error):
+        """
+        Wait before retrying after error. Returns False if it should not be
+        retried.
+        """
+        if isinstance(error, self.FATAL_ERRORS):
+            return False
+
+        if isinstance(error, LockedException):
+            delay = min(self.max_delay, self.base_delay * 2 ** min(self.locked_waits, 16))
+            if self.locked_wait + delay > self.max_locked_wait:
+                return False
+            self.locked_waits += 1
+            self.locked_wait += delay
+            floyd_logger.debug("Upload locked by the server, waiting %.1fs", delay)
+        else:
+            if self.retries >= self.max_retries:
+                return False
+            self.retries += 1
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** self.retries))
+            floyd_logger.debug("Upload request failed (%s), retry %s of %s in %.1fs",
+                               error, self.retries, self.max_retries, delay)
+
+        time.sleep(delay)
+        return True
+
+
+RETRIABLE_ERRORS = (FloydException, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
 class TusDataClient(FloydHttpClient):
     """
     Client to interact with Data api
     """
     DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024  # 5MB
+    # Bounds of the adaptive chunk size of resume_upload
+    MIN_CHUNK_SIZE = 1024 * 1024  # 1MB
+    MAX_CHUNK_SIZE = 64 * 1024 * 1024  # 64MB
     TUS_VERSION = '1.0.0'
+    # Upload-Checksum algorithm of every chunk (TUS checksum extension)
+    CHECKSUM_ALGORITHM = 'sha1'
+    # Consecutive failed requests retried before an upload gives up
+    MAX_RETRIES = 10
+    # (connect, read) timeouts of every request in seconds, so a stalled
+    # connection fails and is retried instead of hanging. The read timeout
+    # applies to every socket operation, not to the whole chunk.
+    TIMEOUT = (10, 60)
 
-    def __init__(self, chunk_size=None, base_url=None):
+    # Keep-alive connections kept open per upload server, enough for the
+    # workers of a parallel upload
+    POOL_MAXSIZE = 32
+
+    _session = None
+    _session_lock = threading.Lock()
+
+    def __init__(self, chunk_size=None, base_url=None, min_chunk_size=None, max_chunk_size=None,
+                 max_retries=None):
+        """
+        An explicit chunk_size is used as is unless min_chunk_size or
+        max_chunk_size are given too. Otherwise resume_upload adapts the
+        chunk size between MIN_CHUNK_SIZE and MAX_CHUNK_SIZE.
+        """
         super(TusDataClient, self).__init__()
         self.chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
         self.base_url = base_url or floyd.tus_server_endpoint
+        self.chunk_sizer = AdaptiveChunkSize(
+            self.chunk_size,
+            min_chunk_size or chunk_size or self.MIN_CHUNK_SIZE,
+            max_chunk_size or chunk_size or self.MAX_CHUNK_SIZE)
+        self.max_retries = self.MAX_RETRIES if max_retries is None else max_retries
+
+    @property
+    def session(self):
+        """
+        Session shared by all TUS clients of the process, so chunks and
+        resumed uploads reuse open connections instead of paying a TCP and
+        TLS handshake per request.
+        """
+        with TusDataClient._session_lock:
+            if TusDataClient._session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.POOL_MAXSIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                TusDataClient._session = session
+            return TusDataClient._session
 
     def initialize_upload(self,
-                          file_path,
+                          file_path=None,
                           base_url=None,
                           headers=None,
                           metadata=None,
-                          auth=None):
-        base_url = base_url or self.base_url
+                          auth=None,
+                          upload_length=None):
+        """
+        Create the upload and return its endpoint. Without a file_path or
+        upload_length the length is deferred until the last chunk of a
+        stream_upload.
+        """
         floyd_logger.info("Initializing upload...")
 
+        h = {"Tus-Resumable": self.TUS_VERSION}
+        if upload_length is None and file_path is not None:
+            upload_length = os.path.getsize(file_path)
+        if upload_length is None:
+            h["Upload-Defer-Length"] = "1"
+        else:
+            h["Upload-Length"] = str(upload_length)
+
+        if headers:
+            h.update(headers)
+
+        return self._create_upload(h, base_url=base_url, metadata=metadata, auth=auth)
+
+    def initialize_parallel_upload(self,
+                                   file_path,
+                                   parts,
+                                   base_url=None,
+                                   headers=None,
+                                   auth=None):
+        """
+        Split the file in up to parts partial uploads of whole chunks and
+        create them. Returns the list of parts to pass to parallel_upload, or
+        None if any of them could not be created.
+        """
         file_size = os.path.getsize(file_path)
+        chunks = max(-(-file_size // self.chunk_size), 1)
+        part_size = -(-chunks // parts) * self.chunk_size
+
+        h = {"Upload-Concat": "partial"}
+        if headers:
+            h.update(headers)
+
+        upload_parts = []
+        for start in range(0, max(file_size, 1), part_size):
+            length = min(part_size, file_size - start)
+            endpoint = self.initialize_upload(base_url=base_url, headers=h, auth=auth,
+                                              upload_length=length)
+            if not endpoint:
+                return None
+            upload_parts.append({"endpoint": endpoint, "start": start, "length": length, "offset": 0})
+        return upload_parts
+
+    def initialize_sharded_upload(self,
+                                  file_paths,
+                                  base_url=None,
+                                  headers=None,
+                                  metadata=None,
+                                  auth=None):
+        """
+        Create one upload per shard file, with its index and the number of
+        shards added to metadata. Returns the list of parts to pass to
+        parallel_upload, or None if any of them could not be created.
+        """
+        upload_parts = []
+        for index, file_path in enumerate(file_paths):
+            part = self.initialize_shard(file_path, index, len(file_paths), base_url=base_url,
+                                         headers=headers, metadata=metadata, auth=auth)
+            if not part:
+                return None
+            upload_parts.append(part)
+        return upload_parts
+
+    def initialize_shard(self,
+                         file_path,
+                         index,
+                         shards,
+                         base_url=None,
+                         headers=None,
+                         metadata=None,
+                         auth=None):
+        """
+        Create the upload of the shard file at index, out of shards. Returns
+        the part to pass to upload_part or parallel_upload, or None if it
+        could not be created.
+        """
+        shard_metadata = dict(metadata or {}, shard=str(index), shards=str(shards))
+        endpoint = self.initialize_upload(file_path, base_url=base_url, headers=headers,
+                                          metadata=shard_metadata, auth=auth)
+        if not endpoint:
+            return None
+        return {"endpoint": endpoint, "file_path": file_path, "start": 0,
+                "length": os.path.getsize(file_path), "offset": 0}
+
+    def concatenate_uploads(self,
+                            part_endpoints,
+                            base_url=None,
+                            headers=None,
+                            metadata=None,
+                            auth=None):
+        """
+        Create the final upload made of the completed partial uploads
+        """
+        floyd_logger.debug("Concatenating %s partial uploads", len(part_endpoints))
 
         h = {
             "Tus-Resumable": self.TUS_VERSION,
-            "Upload-Length": str(file_size),
+            "Upload-Concat": "final;" + " ".join(part_endpoints),
         }
 
         if headers:
             h.update(headers)
 
+        return self._create_upload(h, base_url=base_url, metadata=metadata, auth=auth)
+
+    def _create_upload(self, h, base_url=None, metadata=None, auth=None):
+        base_url = base_url or self.base_url
+
         if metadata:
             pairs = [
                 k + ' ' + base64.b64encode(v.encode('utf-8')).decode()
@@ -49,7 +299,7 @@ class TusDataClient(FloydHttpClient):
             h["Upload-Metadata"] = ','.join(pairs)
 
         try:
-            response = requests.post(base_url, headers=h, auth=auth)
+            response = self.session.post(base_url, headers=h, auth=auth, timeout=self.TIMEOUT)
             self.check_response_status(response)
 
             location = response.headers["Location"]
@@ -57,7 +307,7 @@ class TusDataClient(FloydHttpClient):
         except FloydException as e:
             floyd_logger.info("Data upload create: ERROR! %s", e.message)
             location = ""
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             floyd_logger.error(
                 "Cannot connect to the Floyd data upload server for upload url. "
                 "Check your internet connection.")
@@ -71,55 +321,230 @@ class TusDataClient(FloydHttpClient):
                       chunk_size=None,
                       headers=None,
                       auth=None,
-                      offset=None):
-        chunk_size = chunk_size or self.chunk_size
-
-        try:
-            offset = self._get_offset(file_endpoint, headers=headers, auth=auth)
-        except LockedException:
-            floyd_logger.error("Server busy handling last uploaded part, please wait and try again later.")
-            return False
-        except FloydException as e:
-            floyd_logger.error(
-                "Failed to fetch offset data from upload server! %s",
-                e.message)
-            return False
-        except requests.exceptions.ConnectionError:
-            floyd_logger.error(
-                "Cannot connect to the Floyd data upload server for offset. "
-                "Check your internet connection.")
-            return False
+                      offset=None,
+                      sha256=None):
+        """
+        Upload the file from the offset the server is at. With sha256, the
+        hex SHA-256 the file had when the upload started, the file is hashed
+        from the chunks read to upload it and the last chunk is only sent if
+        the file didn't change.
+        """
+        if chunk_size:
+            chunk_sizer = AdaptiveChunkSize(chunk_size, chunk_size, chunk_size)
+        else:
+            chunk_sizer = self.chunk_sizer
 
+        retry_budget = RetryBudget(self.max_retries)
         total_sent = 0
         file_size = os.path.getsize(file_path)
+        # Fetched from the server at start and after every failure
+        offset = None
+        file_hash = IncrementalFileHash(file_path) if sha256 else None
 
-        with open(file_path, 'rb') as f:
+        # The next block is read from disk while chunks of the current one
+        # are sent, in blocks of the largest chunk size so that every chunk
+        # size picked by chunk_sizer is served from them
+        with ReadAheadReader(file_path, block_size=chunk_sizer.max_size) as reader:
 
             pb = ProgressBar(filled_char="=", expected_size=file_size)
-            while offset < file_size:
-                pb.show(offset)
-                f.seek(offset)
-                data = f.read(chunk_size)
+            while offset is None or offset < file_size:
                 try:
+                    if offset is None:
+                        offset = self._get_offset(file_endpoint, headers=headers, auth=auth)
+                        continue
+
+                    pb.show(offset)
+                    data = reader.read(offset, chunk_sizer.size)
+                    if file_hash is not None:
+                        file_hash.update(offset, data)
+                        if offset + len(data) >= file_size and file_hash.hexdigest(file_size) != sha256:
+                            pb.done()
+                            floyd_logger.error("The compressed data changed since the upload started. "
+                                               "Please start a new upload.")
+                            return False
+                    start = time.time()
                     offset = self._upload_chunk(data, offset, file_endpoint, headers=headers, auth=auth)
+                    chunk_sizer.record_success(len(data), time.time() - start)
+                    retry_budget.reset()
                     total_sent += len(data)
                     floyd_logger.debug("%s bytes sent", total_sent)
-                except FloydException as e:
-                    floyd_logger.error(
-                        "Failed to fetch offset data from upload server! %s",
-                        e.message)
-                    return False
-                except requests.exceptions.ConnectionError:
-                    floyd_logger.error(
-                        "Cannot connect to the Floyd data upload server. "
-                        "Check your internet connection.")
-                    return False
+                except RETRIABLE_ERRORS as e:
+                    if offset is not None:
+                        chunk_sizer.record_failure()
+                    if not retry_budget.backoff(e):
+                        pb.done()
+                        self._log_upload_error(e)
+                        return False
+                    # Continue from wherever the server left off
+                    offset = None
 
             # Complete the progress bar with one more call to show()
             pb.show(offset)
             pb.done()
         return True
 
+    def _log_upload_error(self, error):
+        if isinstance(error, LockedException):
+            floyd_logger.error("Server busy handling last uploaded part, please wait and try again later.")
+        elif isinstance(error, FloydException):
+            floyd_logger.error("Failed to upload data to the upload server! %s", error.message)
+        else:
+            floyd_logger.error(
+                "Cannot connect to the Floyd data upload server. "
+                "Check your internet connection.")
+
+    def parallel_upload(self,
+                        file_path,
+                        upload_parts,
+                        chunk_size=None,
+                        headers=None,
+                        auth=None,
+                        on_progress=None,
+                        workers=None):
+        """
+        Upload the parts created by initialize_parallel_upload or
+        initialize_sharded_upload concurrently, on up to workers threads (one
+        per part by default). Parts with their own "file_path" are read from
+        it instead of file_path. Each part resumes from its own server
+        offset. on_progress(index, offset) is called after every chunk
+        confirmed by the server, so the offsets can be saved.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        lock = threading.Lock()
+        pb = ProgressBar(filled_char="=", expected_size=max(sum(part["length"] for part in upload_parts), 1))
+        sent = [part.get("offset", 0) for part in upload_parts]
+
+        def report(index, offset):
+            with lock:
+                sent[index] = offset
+                pb.show(sum(sent))
+                if on_progress:
+                    on_progress(index, offset)
+
+        def upload_part(index):
+            return self._upload_part(upload_parts[index].get("file_path", file_path),
+                                     upload_parts[index], index, chunk_size,
+                                     headers=headers, auth=auth, report=report)
+
+        pool = ThreadPool(min(workers or len(upload_parts), len(upload_parts)))
+        try:
+            results = pool.map(upload_part, range(len(upload_parts)))
+        finally:
+            pool.close()
+            pool.join()
+            pb.done()
+        return all(results)
+
+    def upload_part(self, part, index, chunk_size=None, headers=None, auth=None, on_progress=None):
+        """
+        Upload the part created by initialize_shard on its own, resuming
+        from its server offset. on_progress(index, offset) is called after
+        every chunk confirmed by the server.
+        """
+        return self._upload_part(part["file_path"], part, index, chunk_size or self.chunk_size,
+                                 headers=headers, auth=auth, report=on_progress or (lambda index, offset: None))
+
+    def _upload_part(self, file_path, part, index, chunk_size, headers=None, auth=None, report=None):
+        start, length, offset = part["start"], part["length"], part.get("offset", 0)
+        retry_budget = RetryBudget(self.max_retries)
+        # A part saved as complete doesn't need to be checked again
+        checked = offset >= length
+
+        with ReadAheadReader(file_path, block_size=chunk_size) as reader:
+            while not checked or offset < length:
+                try:
+                    if not checked:
+                        offset = self._get_offset(part["endpoint"], headers=headers, auth=auth)
+                        checked = True
+                        report(index, offset)
+                        continue
+
+                    data = reader.read(start + offset, min(chunk_size, length - offset))
+                    offset = self._upload_chunk(data, offset, part["endpoint"], headers=headers, auth=auth)
+                    retry_budget.reset()
+                    report(index, offset)
+                except RETRIABLE_ERRORS as e:
+                    if not retry_budget.backoff(e):
+                        floyd_logger.error("Part %s of the upload failed.", index)
+                        self._log_upload_error(e)
+                        return False
+                    checked = False
+        return True
+
+    def stream_upload(self,
+                      stream,
+                      file_endpoint,
+                      chunk_size=None,
+                      headers=None,
+                      auth=None,
+                      spill_size=None,
+                      max_size=None):
+        """
+        Upload everything read from stream to a deferred-length upload.
+
+        The last spill_size bytes (two chunks by default) the server has
+        confirmed are kept around, so when a chunk fails the upload is
+        retried from whatever offset the server reports within that window.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        spill_size = chunk_size * 2 if spill_size is None else spill_size
+        retry_budget = RetryBudget(self.max_retries)
+
+        # Bytes [window_start, window_start + len(window)) are still in memory
+        window = bytearray()
+        window_start = 0
+        offset = 0
+        chunk = stream.read(chunk_size)
+
+        while True:
+            # Read one chunk ahead to find out which chunk is the last one
+            next_chunk = stream.read(chunk_size) if chunk else b''
+            window += chunk
+            end = window_start + len(window)
+            if max_size is not None and end > max_size:
+                floyd_logger.error("Data size too large to upload, please keep it under %s bytes.",
+                                   max_size)
+                return False
+
+            chunk_headers = dict(headers or {})
+            if not next_chunk:
+                chunk_headers["Upload-Length"] = str(end)
+
+            # An empty stream still needs one request to declare its length
+            sent = False
+            checked = True
+            while not sent:
+                try:
+                    if not checked:
+                        offset = self._get_offset(file_endpoint, headers=headers, auth=auth)
+                        checked = True
+                        if not window_start <= offset <= end:
+                            floyd_logger.error(
+                                "Upload server is at offset %s, which is outside of the %s bytes "
+                                "kept for resuming. Please start a new upload.", offset, len(window))
+                            return False
+
+                    data = bytes(window[offset - window_start:])
+                    offset = self._upload_chunk(data, offset, file_endpoint,
+                                                headers=chunk_headers, auth=auth)
+                    retry_budget.reset()
+                    floyd_logger.debug("%s bytes sent", offset)
+                    sent = offset >= end
+                except RETRIABLE_ERRORS as e:
+                    if not retry_budget.backoff(e):
+                        self._log_upload_error(e)
+                        return False
+                    checked = False
+
+            if not next_chunk:
+                return True
+
+            if len(window) > spill_size:
+                trimmed = len(window) - spill_size
+                del window[:trimmed]
+                window_start += trimmed
+            chunk = next_chunk
+
     def _get_offset(self, file_endpoint, headers=None, auth=None):
         floyd_logger.debug("Getting offset")
 
@@ -128,7 +553,7 @@ class TusDataClient(FloydHttpClient):
         if headers:
             h.update(headers)
 
-        response = requests.head(file_endpoint, headers=h, auth=auth)
+        response = self.session.head(file_endpoint, headers=h, auth=auth, timeout=self.TIMEOUT)
         self.check_response_status(response)
 
         offset = int(response.headers["Upload-Offset"])
@@ -141,13 +566,15 @@ class TusDataClient(FloydHttpClient):
         h = {
             'Content-Type': 'application/offset+octet-stream',
             'Upload-Offset': str(offset),
+            'Upload-Checksum': "%s %s" % (self.CHECKSUM_ALGORITHM, base64.b64encode(
+                hashlib.new(self.CHECKSUM_ALGORITHM, data).digest()).decode()),
             'Tus-Resumable': self.TUS_VERSION,
         }
 
         if headers:
             h.update(headers)
 
-        response = requests.patch(file_endpoint, headers=h, data=data, auth=auth)
+        response = self.session.patch(file_endpoint, headers=h, data=data, auth=auth, timeout=self.TIMEOUT)
         self.check_response_status(response)
 
         return int(response.headers["Upload-Offset"])
@@ -73,3 +73,9 @@ class LockedException(FloydException):
 
     def __init__(self, message="Resource locked."):
         super(LockedException, self).__init__(message=message)
+
+
+class SizeLimitExceededException(FloydException):
+
+    def __init__(self, message="Size limit exceeded."):
+        super(SizeLimitExceededException, self).__init__(message=message)
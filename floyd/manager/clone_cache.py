@@ -0,0 +1,278 @@
+import errno
+import json
+import os
+import shutil
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from floyd.log import logger as floyd_logger
+
+
+# Linux ioctl sharing the blocks of a file with another one on copy on write
+# filesystems like btrfs and XFS
+FICLONE = 0x40049409
+
+
+def reflink(source, destination):
+    """
+    Copy source to destination without copying its data. Raises IOError or
+    OSError if the filesystem doesn't support it.
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform")
+    try:
+        with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+    except (IOError, OSError):
+        os.remove(destination)
+        raise
+    shutil.copystat(source, destination)
+
+
+def hardlink(source, destination):
+    if not hasattr(os, 'link'):
+        raise OSError(errno.EOPNOTSUPP, "Hardlinks are not supported on this platform")
+    os.link(source, destination)
+
+
+# Ways to materialize a cached file, from the cheapest
+LINK_METHODS = [('reflink', reflink), ('hardlink', hardlink), ('copy', shutil.copy2)]
+
+# Write permission bits of the user, group and others
+WRITE_BITS = 0o222
+
+
+def remove_read_only(function, path, excinfo):
+    """
+    shutil.rmtree error handler removing the read-only cached files, which
+    Windows refuses to delete. Other errors are ignored.
+    """
+    try:
+        os.chmod(path, os.stat(path).st_mode | 0o200)
+        function(path)
+    except OSError:
+        pass
+
+
+class CloneCacheManager(object):
+    """
+    Manages the cache of cloned datasets, job outputs and job code in
+    ~/.floyd/cache
+
+    Finished resources never change, so every entry holds the extracted
+    content of a resource in <resource_id>/ and a <resource_id>.json
+    manifest of its files, directories and symlinks. A cached clone is
+    materialized by reflinking, hardlinking or copying the files. Cached
+    files are read-only, so a hardlinked clone, which shares them, can't be
+    modified in place by mistake.
+
+    The mtime of a manifest is the last time its entry was used. Least
+    recently used entries are evicted once the cache is over its maximum
+    size, set in config.json.
+    """
+
+    CACHE_DIR = os.path.expanduser("~/.floyd/cache")
+    DEFAULT_MAX_SIZE = 10 * 1024 * 1024 * 1024
+
+    @classmethod
+    def _config_path(cls):
+        return os.path.join(cls.CACHE_DIR, "config.json")
+
+    @classmethod
+    def _entry_dir(cls, resource_id):
+        return os.path.join(cls.CACHE_DIR, resource_id)
+
+    @classmethod
+    def _manifest_path(cls, resource_id):
+        return os.path.join(cls.CACHE_DIR, "%s.json" % resource_id)
+
+    @classmethod
+    def _read_json(cls, path):
+        try:
+            with open(path, "r") as json_file:
+                return json.loads(json_file.read())
+        except (IOError, OSError, ValueError):
+            return None
+
+    @classmethod
+    def _write_json(cls, path, content):
+        if not os.path.isdir(cls.CACHE_DIR):
+            os.makedirs(cls.CACHE_DIR)
+        with open(path, "w") as json_file:
+            json_file.write(json.dumps(content))
+
+    @classmethod
+    def get_max_size(cls):
+        config = cls._read_json(cls._config_path()) or {}
+        return config.get("max_size", cls.DEFAULT_MAX_SIZE)
+
+    @classmethod
+    def set_max_size(cls, max_size):
+        floyd_logger.debug("Setting the clone cache max size to %s bytes", max_size)
+        cls._write_json(cls._config_path(), {"max_size": max_size})
+        cls.evict()
+
+    @classmethod
+    def entries(cls):
+        """
+        Returns the (resource id, size, last use) of the cached entries
+        """
+        entries = []
+        if not os.path.isdir(cls.CACHE_DIR):
+            return entries
+        for name in os.listdir(cls.CACHE_DIR):
+            resource_id, extension = os.path.splitext(name)
+            if extension != ".json" or name == "config.json":
+                continue
+            manifest = cls._read_json(cls._manifest_path(resource_id))
+            if manifest is None:
+                continue
+            entries.append((resource_id, manifest.get("size", 0),
+                            os.path.getmtime(cls._manifest_path(resource_id))))
+        return entries
+
+    @classmethod
+    def on_filesystem_of(cls, path):
+        """
+        Whether the cache is on the filesystem of path, so its files can be
+        hardlinked there
+        """
+        cache_dir = cls.CACHE_DIR
+        # The cache directory is only created once something is cached
+        while not os.path.exists(cache_dir) and os.path.dirname(cache_dir) != cache_dir:
+            cache_dir = os.path.dirname(cache_dir)
+        return os.stat(cache_dir).st_dev == os.stat(path).st_dev
+
+    @classmethod
+    def create_staging_dir(cls):
+        """
+        Returns a new directory to extract a resource in before it is added
+        """
+        staging_dir = os.path.join(cls.CACHE_DIR, ".staging-%s" % uuid.uuid4().hex)
+        os.makedirs(staging_dir)
+        return staging_dir
+
+    @classmethod
+    def add(cls, resource_id, staging_dir):
+        """
+        Make the content extracted in staging_dir the entry of resource_id
+        """
+        manifest = {"files": {}, "dirs": [], "links": {}, "size": 0}
+        for dir_path, dir_names, file_names in os.walk(staging_dir):
+            for name in dir_names + file_names:
+                path = os.path.join(dir_path, name)
+                relative_path = os.path.relpath(path, staging_dir)
+                if os.path.islink(path):
+                    manifest["links"][relative_path] = os.readlink(path)
+                elif os.path.isdir(path):
+                    manifest["dirs"].append(relative_path)
+                else:
+                    stat = os.stat(path)
+                    os.chmod(path, stat.st_mode & ~WRITE_BITS)
+                    manifest["files"][relative_path] = [stat.st_size, stat.st_mtime]
+                    manifest["size"] += stat.st_size
+
+        cls.remove(resource_id)
+        os.rename(staging_dir, cls._entry_dir(resource_id))
+        cls._write_json(cls._manifest_path(resource_id), manifest)
+        floyd_logger.debug("Cached %s files of %s", len(manifest["files"]), resource_id)
+
+    @classmethod
+    def materialize(cls, resource_id, destination_dir='.'):
+        """
+        Recreate the cached content of resource_id in destination_dir.
+        Returns False if the resource isn't cached.
+        """
+        manifest = cls._read_json(cls._manifest_path(resource_id))
+        if manifest is None:
+            return False
+
+        entry_dir = cls._entry_dir(resource_id)
+        files = manifest["files"]
+        # Hardlinked clones share the cached files, an entry modified
+        # through one of them is no longer valid
+        for relative_path, (size, mtime) in files.items():
+            try:
+                stat = os.lstat(os.path.join(entry_dir, relative_path))
+            except OSError:
+                stat = None
+            if stat is None or (stat.st_size, stat.st_mtime) != (size, mtime):
+                floyd_logger.debug("Cached %s was modified, removing it", resource_id)
+                cls.remove(resource_id)
+                return False
+
+        for relative_path in sorted(manifest["dirs"]):
+            path = os.path.join(destination_dir, relative_path)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        methods = list(LINK_METHODS)
+        for relative_path in files:
+            destination = os.path.join(destination_dir, relative_path)
+            if os.path.lexists(destination):
+                os.remove(destination)
+            while True:
+                name, link = methods[0]
+                try:
+                    link(os.path.join(entry_dir, relative_path), destination)
+                    if name != 'hardlink':
+                        # Copies don't share the cached file, and are
+                        # writable like a downloaded one
+                        os.chmod(destination, os.stat(destination).st_mode | 0o200)
+                    break
+                except (IOError, OSError) as e:
+                    if len(methods) == 1:
+                        raise
+                    # Unsupported by the filesystem, don't try it on every file
+                    floyd_logger.debug("Cannot %s cached files: %s", name, e)
+                    methods.pop(0)
+
+        for relative_path, target in manifest["links"].items():
+            destination = os.path.join(destination_dir, relative_path)
+            if os.path.lexists(destination):
+                os.remove(destination)
+            os.symlink(target, destination)
+
+        # Mark the entry as the most recently used
+        os.utime(cls._manifest_path(resource_id), None)
+        floyd_logger.debug("Materialized %s files of %s by %s", len(files), resource_id, methods[0][0])
+        return True
+
+    @classmethod
+    def remove(cls, resource_id):
+        try:
+            os.remove(cls._manifest_path(resource_id))
+        except OSError:
+            pass
+        if os.path.isdir(cls._entry_dir(resource_id)):
+            shutil.rmtree(cls._entry_dir(resource_id), onerror=remove_read_only)
+
+    @classmethod
+    def evict(cls):
+        """
+        Remove the least recently used entries until the cache fits in its
+        max size. Entries larger than the whole cache go first.
+        """
+        max_size = cls.get_max_size()
+        entries = sorted(cls.entries(), key=lambda entry: (entry[1] <= max_size, entry[2]))
+        total_size = sum(size for _, size, _ in entries)
+        for resource_id, size, _ in entries:
+            if total_size <= max_size:
+                break
+            floyd_logger.debug("Evicting %s from the clone cache", resource_id)
+            cls.remove(resource_id)
+            total_size -= size
+
+    @classmethod
+    def clear(cls):
+        for resource_id, _, _ in cls.entries():
+            cls.remove(resource_id)
+        # Leftovers of interrupted clones
+        if os.path.isdir(cls.CACHE_DIR):
+            for name in os.listdir(cls.CACHE_DIR):
+                if name.startswith(".staging-"):
+                    shutil.rmtree(os.path.join(cls.CACHE_DIR, name), ignore_errors=True)
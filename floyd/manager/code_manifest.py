@@ -0,0 +1,35 @@
+import json
+import os
+
+from floyd.log import logger as floyd_logger
+
+
+class CodeManifestManager(object):
+    """
+    Manages .floydmanifest file in the current directory
+
+    The manifest maps every synced file path to its size, mtime and content
+    hash, so unchanged files don't need to be hashed or uploaded again.
+    """
+
+    CONFIG_FILE_PATH = os.path.join(os.getcwd() + "/.floydmanifest")
+
+    @classmethod
+    def set_manifest(cls, manifest):
+        floyd_logger.debug("Setting manifest of %s files in the file %s",
+                           len(manifest), cls.CONFIG_FILE_PATH)
+        with open(cls.CONFIG_FILE_PATH, "w") as manifest_file:
+            manifest_file.write(json.dumps(manifest))
+
+    @classmethod
+    def get_manifest(cls):
+        if not os.path.isfile(cls.CONFIG_FILE_PATH):
+            return {}
+
+        try:
+            with open(cls.CONFIG_FILE_PATH, "r") as manifest_file:
+                return json.loads(manifest_file.read())
+        except ValueError:
+            # A corrupted manifest only costs a full re-hash, never a failure
+            floyd_logger.debug("Ignoring invalid manifest file %s", cls.CONFIG_FILE_PATH)
+            return {}
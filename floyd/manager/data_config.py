@@ -17,6 +17,13 @@ class DataConfigSchema(Schema):
     data_endpoint = fields.Str(allow_none=True)
     resource_id = fields.Str(allow_none=True)
     data_name = fields.Str(allow_none=True)
+    upload_parts = fields.List(fields.Dict(), allow_none=True)
+    tarball_sha256 = fields.Str(allow_none=True)
+    tarball_size = fields.Int(allow_none=True)
+    tarball_mtime = fields.Float(allow_none=True)
+    upload_bandwidth = fields.Float(allow_none=True)
+    upload_shards = fields.List(fields.Dict(), allow_none=True)
+    keep_tarball = fields.Boolean(allow_none=True)
 
     @post_load
     def make_access_token(self, data):
@@ -35,7 +42,14 @@ class DataConfig(BaseModel):
                  tarball_path=None,
                  data_endpoint=None,
                  resource_id=None,
-                 data_name=None):
+                 data_name=None,
+                 upload_parts=None,
+                 tarball_sha256=None,
+                 tarball_size=None,
+                 tarball_mtime=None,
+                 upload_bandwidth=None,
+                 upload_shards=None,
+                 keep_tarball=None):
         self.name = name
         self.namespace = namespace
         self.family_id = family_id
@@ -44,6 +58,19 @@ class DataConfig(BaseModel):
         self.data_endpoint = data_endpoint
         self.resource_id = resource_id
         self.data_name = data_name
+        # Partial uploads of a parallel upload, see TusDataClient.parallel_upload
+        self.upload_parts = upload_parts
+        # SHA-256 of the tarball, to check it didn't change before resuming
+        self.tarball_sha256 = tarball_sha256
+        # Size and modification time of the tarball, checked before resuming
+        self.tarball_size = tarball_size
+        self.tarball_mtime = tarball_mtime
+        # Throughput of the last upload in bytes per second, for --codec auto
+        self.upload_bandwidth = upload_bandwidth
+        # Uploads of the shards of a sharded upload, see sharded_upload
+        self.upload_shards = upload_shards
+        # The tarball is an archive of the user, never removed
+        self.keep_tarball = keep_tarball
 
     def set_data_id(self, data_id):
         self.data_id = data_id
@@ -60,6 +87,25 @@ class DataConfig(BaseModel):
     def set_data_name(self, data_name):
         self.data_name = data_name
 
+    def set_upload_parts(self, upload_parts):
+        self.upload_parts = upload_parts
+
+    def set_tarball_sha256(self, tarball_sha256):
+        self.tarball_sha256 = tarball_sha256
+
+    def set_tarball_stat(self, tarball_size, tarball_mtime):
+        self.tarball_size = tarball_size
+        self.tarball_mtime = tarball_mtime
+
+    def set_upload_bandwidth(self, upload_bandwidth):
+        self.upload_bandwidth = upload_bandwidth
+
+    def set_upload_shards(self, upload_shards):
+        self.upload_shards = upload_shards
+
+    def set_keep_tarball(self, keep_tarball):
+        self.keep_tarball = keep_tarball
+
 
 class DataConfigManager(object):
     """
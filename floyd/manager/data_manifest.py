@@ -0,0 +1,85 @@
+import json
+import os
+
+from floyd.log import logger as floyd_logger
+
+
+class DataManifestManager(object):
+    """
+    Manages the manifests of the last uploaded version of each dataset, in
+    ~/.floyd/data_manifests/<family_id>.json
+
+    A manifest maps every file path, relative to the data directory, to its
+    size, mtime and sha256 content hash. It is saved as pending when the
+    data is compressed, and committed with the resource id of the new
+    version once the server has unpacked it.
+    """
+
+    MANIFEST_DIR = os.path.expanduser("~/.floyd/data_manifests")
+
+    @classmethod
+    def _manifest_path(cls, family_id, pending=False):
+        return os.path.join(cls.MANIFEST_DIR,
+                            "%s%s.json" % (family_id, ".pending" if pending else ""))
+
+    @classmethod
+    def _read(cls, path):
+        if not os.path.isfile(path):
+            return {}
+        try:
+            with open(path, "r") as manifest_file:
+                return json.loads(manifest_file.read())
+        except ValueError:
+            # A corrupted manifest only costs a full upload, never a failure
+            floyd_logger.debug("Ignoring invalid manifest file %s", path)
+            return {}
+
+    @classmethod
+    def _write(cls, path, manifest):
+        if not os.path.isdir(cls.MANIFEST_DIR):
+            os.makedirs(cls.MANIFEST_DIR)
+        with open(path, "w") as manifest_file:
+            manifest_file.write(json.dumps(manifest))
+
+    @classmethod
+    def get_manifest(cls, family_id):
+        """
+        Returns the (resource id, files manifest) of the last uploaded
+        version of the dataset, or (None, {}) if it is unknown
+        """
+        if not family_id:
+            return None, {}
+        manifest = cls._read(cls._manifest_path(family_id))
+        return manifest.get("resource_id"), manifest.get("files") or {}
+
+    @classmethod
+    def set_pending_manifest(cls, family_id, files):
+        if not family_id:
+            return
+        floyd_logger.debug("Setting pending manifest of %s files for %s", len(files), family_id)
+        cls._write(cls._manifest_path(family_id, pending=True), {"files": files})
+
+    @classmethod
+    def discard_pending_manifest(cls, family_id):
+        if not family_id:
+            return
+        try:
+            os.remove(cls._manifest_path(family_id, pending=True))
+        except OSError:
+            pass
+
+    @classmethod
+    def commit_manifest(cls, family_id, resource_id):
+        """
+        Make the pending manifest the one of the last uploaded version,
+        whose resource id is resource_id
+        """
+        if not family_id:
+            return
+        pending = cls._read(cls._manifest_path(family_id, pending=True))
+        if "files" not in pending:
+            return
+        floyd_logger.debug("Committing manifest of %s for resource %s", family_id, resource_id)
+        cls._write(cls._manifest_path(family_id),
+                   {"resource_id": resource_id, "files": pending["files"]})
+        cls.discard_pending_manifest(family_id)
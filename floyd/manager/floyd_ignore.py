@@ -1,9 +1,141 @@
+import fnmatch
 import os
+import re
+
+from pathlib2 import PurePath
 
 from floyd.constants import DEFAULT_FLOYD_IGNORE_LIST
 from floyd.log import logger as floyd_logger
 
 
+# Whether paths compare case sensitively, as PurePath.match does
+CASE_SENSITIVE = os.path.normcase('A') == 'A'
+
+# Characters that make a glob part a pattern instead of a literal name
+GLOB_MAGIC_CHARS = re.compile(r'[*?[]')
+
+
+def _translate_glob_part(part):
+    """
+    Translate a glob part that contains only '*' and '?' wildcards into a
+    regex that never matches across a '/'
+    """
+    return ''.join('[^/]*' if c == '*' else '[^/]' if c == '?' else re.escape(c)
+                   for c in part)
+
+
+class GlobSet(object):
+    """
+    A list of glob patterns compiled for fast matching.
+
+    A path matches when its last components match all the components of any
+    of the patterns, which is the behavior of pathlib's PurePath.match used
+    for .floydignore. Patterns are grouped by their number of components:
+    literal single component patterns (e.g. ".git") become a set lookup and
+    the others become one regex per group, applied to the matching number
+    of trailing path components.
+    """
+
+    def __init__(self, globs):
+        self.globs = list(globs)
+        self.names = set()
+        # {number of components: [regex, ...]}
+        regexes = {}
+        # Patterns using [] character classes are matched component by
+        # component with fnmatch to keep its exact semantics
+        self.bracket_patterns = []
+
+        for glob in self.globs:
+            try:
+                pure_path = PurePath(glob)
+            except TypeError:
+                continue
+            # Rooted patterns never match the relative paths we check, and
+            # empty patterns match nothing
+            if pure_path.drive or pure_path.root or not pure_path.parts:
+                continue
+
+            parts = pure_path.parts if CASE_SENSITIVE else tuple(p.lower() for p in pure_path.parts)
+            if any('[' in part for part in parts):
+                self.bracket_patterns.append(
+                    [re.compile(fnmatch.translate(part)) for part in parts])
+            elif len(parts) == 1 and not GLOB_MAGIC_CHARS.search(parts[0]):
+                self.names.add(parts[0])
+            else:
+                regexes.setdefault(len(parts), []).append(
+                    '/'.join(_translate_glob_part(part) for part in parts))
+
+        self.regexes = [(depth, re.compile('(?:%s)\\Z' % '|'.join(patterns)))
+                        for depth, patterns in sorted(regexes.items())]
+
+    def __bool__(self):
+        return bool(self.names or self.regexes or self.bracket_patterns)
+
+    __nonzero__ = __bool__
+
+    def match_parts(self, parts):
+        """
+        Returns True if the path components in parts match any glob
+        """
+        if not parts:
+            return False
+        if parts[-1] in self.names:
+            return True
+
+        for depth, regex in self.regexes:
+            if depth > len(parts):
+                break
+            if regex.match('/'.join(parts[-depth:])):
+                return True
+
+        for part_regexes in self.bracket_patterns:
+            if len(part_regexes) <= len(parts) and all(
+                    regex.match(part) for part, regex in zip(reversed(parts), reversed(part_regexes))):
+                return True
+        return False
+
+
+class FloydIgnoreMatcher(tuple):
+    """
+    Compiled .floydignore rules.
+
+    Unpacks as (ignore_list, whitelist) like the plain lists it replaces.
+    """
+
+    def __new__(cls, ignore_list=None, whitelist=None):
+        return super(FloydIgnoreMatcher, cls).__new__(cls, (list(ignore_list or []), list(whitelist or [])))
+
+    def __init__(self, ignore_list=None, whitelist=None):
+        self.ignore_set = GlobSet(self.ignore_list)
+        self.white_set = GlobSet(self.whitelist)
+
+    @property
+    def ignore_list(self):
+        return self[0]
+
+    @property
+    def whitelist(self):
+        return self[1]
+
+    @staticmethod
+    def split_path(path):
+        if os.path.sep != '/':
+            path = path.replace(os.path.sep, '/')
+        if not CASE_SENSITIVE:
+            path = path.lower()
+        return [part for part in path.split('/') if part and part != '.']
+
+    def ignores(self, path):
+        """
+        Returns a boolean indicating if a path is ignored: it matches a glob
+        of the ignore list and none of the whitelist.
+        """
+        if not self.ignore_set:
+            return False
+        parts = self.split_path(path)
+        return self.ignore_set.match_parts(parts) and not self.white_set.match_parts(parts)
+
+
 class FloydIgnoreManager(object):
     """
     Manages .floydignore file in the current directory
@@ -38,7 +170,7 @@ class FloydIgnoreManager(object):
         config_file_path = config_file_path or cls.CONFIG_FILE_PATH
 
         if not os.path.isfile(config_file_path):
-            return ([], [])
+            return FloydIgnoreMatcher()
 
         ignore_list = []
         whitelist = []
@@ -60,4 +192,4 @@ class FloydIgnoreManager(object):
 
                 ignore_list.append(trim_slash_prefix(line))
 
-        return (ignore_list, whitelist)
+        return FloydIgnoreMatcher(ignore_list, whitelist)
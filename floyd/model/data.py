@@ -79,6 +79,8 @@ class DataRequestSchema(Schema):
     data_type = fields.Str()
     version = fields.Integer(allow_none=True)
     family_id = fields.Str(allow_none=True)
+    base_resource_id = fields.Str(allow_none=True)
+    deleted_paths = fields.List(fields.Str(), allow_none=True)
 
     @post_load
     def make_data(self, data):
@@ -94,10 +96,16 @@ class DataRequest(BaseModel):
                  module_type="data",
                  data_type="dir",
                  family_id=None,
-                 version=None):
+                 version=None,
+                 base_resource_id=None,
+                 deleted_paths=None):
         self.name = name
         self.description = description
         self.module_type = module_type
         self.data_type = data_type
         self.family_id = family_id
         self.version = version
+        # For a delta upload, the version is the one of base_resource_id
+        # without deleted_paths, updated with the files of the archive
+        self.base_resource_id = base_resource_id
+        self.deleted_paths = deleted_paths
@@ -33,6 +33,10 @@ setup(
         "raven",
         "scandir;python_version<'3.5'",
     ],
+    extras_require={
+        "zstd": ["zstandard"],
+        "lz4": ["lz4"],
+    },
     setup_requires=[],
     dependency_links=[],
     entry_points={
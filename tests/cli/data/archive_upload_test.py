@@ -0,0 +1,88 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from mock import Mock, patch
+
+from floyd.cli.data_upload_utils import (
+    complete_upload, get_archive_file_codec, initialize_new_upload, remove_tarball, stream_archive_upload,
+    tarball_changed
+)
+from floyd.manager.data_config import DataConfig
+from tests.client.tus_stand_in import TusStandIn
+
+
+class TestArchiveUpload(unittest.TestCase):
+    """
+    Tests uploading existing archives without compressing them again
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.archive_path = os.path.join(self.temp_dir, 'dataset.tar.gz')
+        with tarfile.open(self.archive_path, 'w:gz') as tar:
+            tarinfo = tarfile.TarInfo('dataset/file.bin')
+            tarinfo.size = 3000
+            tar.addfile(tarinfo, io.BytesIO(os.urandom(3000)))
+        with open(self.archive_path, 'rb') as f:
+            self.archive = f.read()
+        self.data_config = DataConfig(name='dataset', family_id='family')
+
+        for target in ['floyd.client.base.AuthConfigManager.get_auth_header',
+                       'floyd.cli.data_upload_utils.DataConfigManager.set_config']:
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_archive_codec_comes_from_its_header(self):
+        self.assertEqual(get_archive_file_codec(self.archive_path).data_type, 'gzip')
+
+        not_archive_path = os.path.join(self.temp_dir, 'notes.txt')
+        with open(not_archive_path, 'w') as f:
+            f.write('not an archive')
+        with self.assertRaises(SystemExit):
+            get_archive_file_codec(not_archive_path)
+
+    def test_archive_of_the_user_is_not_removed(self):
+        self.data_config.set_tarball_path(self.archive_path)
+        self.data_config.set_keep_tarball(True)
+
+        remove_tarball(self.data_config)
+
+        self.assertTrue(os.path.isfile(self.archive_path))
+
+    @patch('floyd.cli.data_upload_utils.DataClient')
+    def test_stdin_archive_is_streamed_as_is(self, data_client):
+        data_client.return_value.create.return_value = {'id': 'data_id', 'name': 'user/datasets/dataset/1'}
+        data_client.return_value.new_tus_credentials.return_value = ('upload_id', 'token')
+
+        with TusStandIn() as tus_stand_in:
+            with patch('floyd.tus_server_endpoint', tus_stand_in.url + '/files/'):
+                stream_archive_upload(self.data_config, 'user/dataset', 'description',
+                                      io.BytesIO(self.archive))
+
+        upload, = tus_stand_in.uploads.values()
+        self.assertEqual(bytes(upload.data), self.archive)
+        self.assertEqual(data_client.return_value.create.call_args[0][0].data_type, 'gzip')
+        self.assertEqual(self.data_config.data_id, 'data_id')
+
+    @patch('floyd.cli.data_upload_utils.DataClient')
+    def test_changed_archive_is_not_resumed(self, data_client):
+        data_client.return_value.create.return_value = {'id': 'data_id', 'name': 'user/datasets/dataset/1'}
+        data_client.return_value.new_tus_credentials.return_value = ('upload_id', 'token')
+        access_token = Mock(username='user')
+
+        with TusStandIn() as tus_stand_in:
+            with patch('floyd.tus_server_endpoint', tus_stand_in.url + '/files/'):
+                initialize_new_upload(self.data_config, access_token, archive=self.archive_path)
+                self.assertFalse(tarball_changed(self.data_config))
+
+                with open(self.archive_path, 'ab') as f:
+                    f.write(b'\0' * 512)
+                self.assertTrue(tarball_changed(self.data_config))
+                complete_upload(self.data_config)
+
+        self.assertEqual([r.method for r in tus_stand_in.requests], ['POST'])
+        self.assertIsNone(self.data_config.resource_id)
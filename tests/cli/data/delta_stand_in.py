@@ -0,0 +1,33 @@
+import itertools
+import tarfile
+
+
+class DeltaDataStandIn(object):
+    """
+    Stand-in for the server side of delta uploads: builds dataset versions,
+    kept as {relative path: content}, from the uploaded archives.
+    """
+
+    def __init__(self):
+        self.versions = {}
+        self._ids = itertools.count(1)
+
+    def create_version(self, tarball_path, base_resource_id=None, deleted_paths=None):
+        """
+        Returns the resource id of the version made of base_resource_id
+        without deleted_paths, updated with the files of the archive
+        """
+        files = dict(self.versions[base_resource_id]) if base_resource_id else {}
+        for path in deleted_paths or []:
+            del files[path]
+
+        with tarfile.open(tarball_path) as tar:
+            for member in tar:
+                if member.isreg():
+                    # Drop the root directory of the archive
+                    path = member.name.split('/', 1)[1]
+                    files[path] = tar.extractfile(member).read()
+
+        resource_id = 'resource_%s' % next(self._ids)
+        self.versions[resource_id] = files
+        return resource_id
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from mock import patch
+
+from floyd.cli.data_upload_utils import prepare_delta
+from floyd.client.files import DataCompressor
+from floyd.manager.data_config import DataConfig
+from floyd.manager.data_manifest import DataManifestManager
+from tests.cli.data.delta_stand_in import DeltaDataStandIn
+
+
+class TestDeltaUpload(unittest.TestCase):
+    """
+    Tests delta uploads rebuild the data directory on the server stand-in
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        patcher = patch.object(DataManifestManager, 'MANIFEST_DIR', os.path.join(self.temp_dir, 'manifests'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.source_dir = os.path.join(self.temp_dir, 'dataset')
+        self.write('a.txt', b'a' * 100)
+        self.write('sub/b.txt', b'b' * 100)
+        self.write('sub/c.txt', b'c' * 100)
+        self.tarball_path = os.path.join(self.temp_dir, 'data.tar.gz')
+        self.data_config = DataConfig(name='dataset', family_id='family')
+        self.server = DeltaDataStandIn()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, content):
+        path = os.path.join(self.source_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def source_files(self):
+        files = {}
+        for root, _, file_names in os.walk(self.source_dir):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, self.source_dir).replace(os.sep, '/')] = f.read()
+        return files
+
+    def upload(self):
+        """
+        Returns the resource id of the new version and the names in its archive
+        """
+        compressor = DataCompressor(source_dir=self.source_dir, filename=self.tarball_path)
+        base_resource_id, deleted_paths = prepare_delta(self.data_config, compressor)
+        compressor.create_tarfile()
+
+        resource_id = self.server.create_version(self.tarball_path, base_resource_id, deleted_paths)
+        DataManifestManager.commit_manifest(self.data_config.family_id, resource_id)
+        with tarfile.open(self.tarball_path) as tar:
+            return resource_id, set(member.name for member in tar if member.isreg())
+
+    def test_first_upload_sends_all_files(self):
+        resource_id, names = self.upload()
+
+        self.assertEqual(names, {'dataset/a.txt', 'dataset/sub/b.txt', 'dataset/sub/c.txt'})
+        self.assertEqual(self.server.versions[resource_id], self.source_files())
+
+    def test_delta_upload_sends_changed_files_only(self):
+        first_resource_id, _ = self.upload()
+
+        self.write('sub/b.txt', b'B' * 100)
+        self.write('sub/new/d.txt', b'd')
+        os.remove(os.path.join(self.source_dir, 'sub/c.txt'))
+        resource_id, names = self.upload()
+
+        self.assertEqual(names, {'dataset/sub/b.txt', 'dataset/sub/new/d.txt'})
+        self.assertEqual(self.server.versions[resource_id], self.source_files())
+        # The previous version is unchanged
+        self.assertIn('sub/c.txt', self.server.versions[first_resource_id])
+
+    def test_unchanged_data_sends_no_files(self):
+        self.upload()
+
+        resource_id, names = self.upload()
+
+        self.assertEqual(names, set())
+        self.assertEqual(self.server.versions[resource_id], self.source_files())
+
+    def test_unfinished_upload_is_not_a_base(self):
+        self.upload()
+        self.write('a.txt', b'A')
+        compressor = DataCompressor(source_dir=self.source_dir, filename=self.tarball_path)
+        prepare_delta(self.data_config, compressor)
+        # The upload is aborted before the server unpacks it
+        DataManifestManager.discard_pending_manifest(self.data_config.family_id)
+
+        resource_id, names = self.upload()
+
+        self.assertEqual(names, {'dataset/a.txt'})
+        self.assertEqual(self.server.versions[resource_id], self.source_files())
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from mock import patch
+
+from floyd.cli import data_upload_utils
+from floyd.cli.data_upload_utils import compress_and_upload_shards, compress_new_upload, upload_is_resumable
+from floyd.client.files import ARCHIVE_CODECS, DataCompressor
+from floyd.manager.data_config import DataConfig
+from floyd.manager.floyd_ignore import FloydIgnoreMatcher
+
+
+CREDS = ('upload_id', 'token')
+
+
+class TestCompressAndUploadShards(unittest.TestCase):
+    """
+    Tests the shards of a sharded upload start uploading as they are compressed
+    """
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source_dir)
+        for name in ['a.bin', 'b.bin']:
+            with open(os.path.join(self.source_dir, name), 'wb') as f:
+                f.write(os.urandom(1000))
+        self.data_config = DataConfig(name='dataset', family_id='family')
+
+        for patcher in [patch('floyd.cli.data_upload_utils.DataConfigManager.set_config'),
+                        patch('floyd.cli.data_upload_utils.TusDataClient')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tus_client = data_upload_utils.TusDataClient.return_value
+        self.tus_client.initialize_shard.side_effect = lambda file_path, index, shards, **kwargs: {
+            "endpoint": "endpoint_%s" % index, "file_path": file_path, "start": 0,
+            "length": os.path.getsize(file_path), "offset": 0}
+        self.uploaded = []
+
+        def upload_part(shard, index, auth=None, on_progress=None):
+            self.uploaded.append(index)
+            on_progress(index, shard["length"])
+            return True
+        self.tus_client.upload_part.side_effect = upload_part
+
+    def plan(self):
+        tarball_path, upload_shards, _, _ = compress_new_upload(
+            self.data_config, self.source_dir, 1, ARCHIVE_CODECS['gzip'], FloydIgnoreMatcher(), None, shards=2)
+        self.addCleanup(shutil.rmtree, os.path.dirname(tarball_path), ignore_errors=True)
+        self.data_config.set_tarball_path(tarball_path)
+        self.data_config.set_upload_shards(upload_shards)
+        return upload_shards
+
+    def test_first_shard_uploads_while_the_next_one_is_compressed(self):
+        upload_shards = self.plan()
+        self.assertEqual(len(upload_shards), 2)
+        self.assertFalse(os.path.exists(upload_shards[0]["file_path"]))
+
+        first_shard_uploading = threading.Event()
+        upload_part = self.tus_client.upload_part.side_effect
+
+        def signaling_upload_part(shard, index, **kwargs):
+            if index == 0:
+                first_shard_uploading.set()
+            return upload_part(shard, index, **kwargs)
+        self.tus_client.upload_part.side_effect = signaling_upload_part
+
+        create_tarfile = DataCompressor.create_tarfile
+
+        def create_shard_tarfile(compressor):
+            if compressor.filename == upload_shards[1]["file_path"]:
+                self.assertTrue(first_shard_uploading.wait(5))
+            create_tarfile(compressor)
+
+        with patch.object(DataCompressor, 'create_tarfile', autospec=True, side_effect=create_shard_tarfile):
+            compress_and_upload_shards(self.data_config, CREDS)
+
+        shards = self.data_config.upload_shards
+        self.assertEqual([shard["endpoint"] for shard in shards], ["endpoint_0", "endpoint_1"])
+        self.assertEqual([shard["offset"] for shard in shards], [shard["length"] for shard in shards])
+        self.assertTrue(all(len(shard["sha256"]) == 64 for shard in shards))
+
+    def test_interrupted_upload_resumes_from_the_shard_being_compressed(self):
+        upload_shards = self.plan()
+        add_source = DataCompressor._DataCompressor__add_source
+
+        def interrupted_add_source(compressor, *args):
+            if compressor.filename == upload_shards[1]["file_path"]:
+                raise KeyboardInterrupt()
+            add_source(compressor, *args)
+
+        # Ctrl-C while the second shard is compressed
+        with patch.object(DataCompressor, '_DataCompressor__add_source', autospec=True,
+                          side_effect=interrupted_add_source):
+            self.assertRaises(SystemExit, compress_and_upload_shards, self.data_config, CREDS)
+        self.assertFalse(os.path.exists(upload_shards[1]["file_path"]))
+
+        # The first shard is saved as soon as its upload is created
+        self.assertEqual(self.data_config.upload_shards[0]["endpoint"], "endpoint_0")
+        self.assertNotIn("endpoint", self.data_config.upload_shards[1])
+        self.assertTrue(upload_is_resumable(self.data_config))
+
+        compress_and_upload_shards(self.data_config, CREDS)
+
+        self.assertEqual(self.uploaded, [0, 1])
+        self.assertEqual(self.tus_client.initialize_shard.call_count, 2)
+        self.assertEqual(self.data_config.upload_shards[1]["endpoint"], "endpoint_1")
@@ -119,3 +119,12 @@ class TestCliUtil(unittest.TestCase):
                  "\n Note: Argument can only contain alphanumeric, hyphen-minus '-' , underscore '_' and dot '.' characters."
                  )
         self.assertEqual(cm.exception.code, error)
+
+    def test_parse_size(self):
+        from floyd.cli.utils import parse_size
+        assert parse_size('1234') == 1234
+        assert parse_size('12 MB') == 12 * 1000 * 1000
+        assert parse_size('1.5GiB') == 1536 * 1024 * 1024
+        assert parse_size('3 kb') == 3000
+        assert parse_size(None) is None
+        assert parse_size('unknown') is None
@@ -0,0 +1,78 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.base import FloydHttpClient
+from tests.client.stand_in_server import StandInServer
+
+
+def make_tar(mode, files):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode=mode) as tar:
+        for name, content in sorted(files.items()):
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.size = len(content)
+            tar.addfile(tarinfo, io.BytesIO(content))
+    return buf.getvalue()
+
+
+class ArchiveStandIn(StandInServer):
+    def __init__(self, archive):
+        super(ArchiveStandIn, self).__init__()
+        self.archive = archive
+
+    def handle(self, request):
+        return 200, {'Content-Type': 'application/octet-stream'}, self.archive
+
+
+class TestFloydHttpClientDownloadTar(unittest.TestCase):
+    """
+    Tests FloydHttpClient.download_tar extracts the archive while it downloads
+    """
+    def setUp(self):
+        patcher = patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        self.addCleanup(os.chdir, cwd)
+
+        self.files = {
+            'data/a.bin': os.urandom(300 * 1024),
+            'data/sub/b.txt': b'hello' * 1000,
+        }
+
+    def assert_extracted(self):
+        for name, content in self.files.items():
+            with open(os.path.join(self.temp_dir, name), 'rb') as f:
+                self.assertEqual(f.read(), content)
+        # The archive itself never touches the disk
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['data'])
+
+    def test_streamed_untar(self):
+        for mode in ['w', 'w:gz']:
+            with ArchiveStandIn(make_tar(mode, self.files)) as stand_in:
+                self.assertTrue(FloydHttpClient().download_tar(stand_in.url + '/download', delete_after_untar=True))
+
+            self.assert_extracted()
+            shutil.rmtree(os.path.join(self.temp_dir, 'data'))
+
+    def test_invalid_archive(self):
+        archive = make_tar('w:gz', self.files)
+        with ArchiveStandIn(archive[:len(archive) // 2]) as stand_in:
+            self.assertFalse(FloydHttpClient().download_tar(stand_in.url + '/download', delete_after_untar=True))
+
+    def test_kept_tar_file(self):
+        archive = make_tar('w', self.files)
+        with ArchiveStandIn(archive) as stand_in:
+            self.assertEqual(FloydHttpClient().download_tar(stand_in.url + '/download'), 'output.tar')
+
+        with open('output.tar', 'rb') as f:
+            self.assertEqual(f.read(), archive)
@@ -0,0 +1,68 @@
+import io
+import os
+import unittest
+from mock import Mock
+
+import requests
+from requests.packages.urllib3.exceptions import ProtocolError
+
+from floyd.client.download import BufferedFileWriter, ProgressTimer, iter_response
+
+
+class TestIterResponse(unittest.TestCase):
+    """
+    Tests the adaptive chunks read from streamed responses
+    """
+    def response(self, content):
+        response = Mock()
+        raw = io.BytesIO(content)
+        response.raw.read.side_effect = lambda size, decode_content: raw.read(size)
+        return response
+
+    def test_chunks_grow_while_they_are_filled(self):
+        content = os.urandom(1000)
+        chunks = list(iter_response(self.response(content), min_chunk_size=100, max_chunk_size=400))
+
+        self.assertEqual(b''.join(chunks), content)
+        self.assertEqual([len(chunk) for chunk in chunks], [100, 200, 400, 300])
+
+    def test_protocol_errors_are_requests_errors(self):
+        response = Mock()
+        response.raw.read.side_effect = ProtocolError('Connection broken')
+
+        self.assertRaises(requests.exceptions.ChunkedEncodingError, list, iter_response(response))
+
+
+class TestBufferedFileWriter(unittest.TestCase):
+    """
+    Tests writes batched through the reusable buffer
+    """
+    def test_small_chunks_are_written_in_buffer_sized_blocks(self):
+        f = io.BytesIO()
+        f.write = Mock(side_effect=f.write)
+        writer = BufferedFileWriter(f, buffer_size=10)
+        for chunk in [b'abcd', b'efgh', b'ijkl', b'0123456789abc', b'mn']:
+            writer.write(chunk)
+        self.assertEqual(writer.flushed, 8 + 4 + 13)
+        writer.flush()
+
+        self.assertEqual(f.getvalue(), b'abcdefghijkl0123456789abcmn')
+        self.assertEqual([len(call[0][0]) for call in f.write.call_args_list], [8, 4, 13, 2])
+        self.assertEqual(writer.flushed, len(f.getvalue()))
+
+
+class TestProgressTimer(unittest.TestCase):
+    """
+    Tests progress shown from the timer thread
+    """
+    def test_final_progress_is_shown(self):
+        bar = Mock()
+        with ProgressTimer(bar, interval=60) as progress_timer:
+            progress_timer.done = 4096
+
+        bar.show.assert_called_once_with(4)
+        bar.done.assert_called_once_with()
+
+    def test_without_bar(self):
+        with ProgressTimer(None, interval=0.001) as progress_timer:
+            progress_timer.done = 4096
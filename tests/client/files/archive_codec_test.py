@@ -0,0 +1,80 @@
+import gzip
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.files import (
+    ARCHIVE_CODECS, DataCompressor, choose_archive_codec, get_archive_codec
+)
+from floyd.exceptions import FloydException
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+def decompress(codec_name, data):
+    if codec_name == 'gzip':
+        return gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+    if codec_name == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    if codec_name == 'lz4':
+        return lz4.frame.decompress(data)
+    return data
+
+
+class TestFilesClientArchiveCodec(unittest.TestCase):
+    """
+    Tests FileClient archive codecs
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.temp_dir, 'dataset')
+        os.makedirs(os.path.join(self.source_dir, 'text'))
+        for i in range(10):
+            with open(os.path.join(self.source_dir, 'text', 'file_%d.csv' % i), 'wb') as f:
+                f.write(b'1,2,3,4,5\n' * 10000)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_codecs_round_trip(self):
+        for codec in ARCHIVE_CODECS.values():
+            if not codec.available():
+                continue
+            for workers in (1, 2):
+                tarball_path = os.path.join(self.temp_dir, 'data' + codec.extension)
+                DataCompressor(self.source_dir, filename=tarball_path,
+                               compress_workers=workers, codec=codec).create_tarfile()
+                with open(tarball_path, 'rb') as f:
+                    data = decompress(codec.name, f.read())
+                with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+                    self.assertEqual(len(tar.getnames()), 12, codec.name)
+                    self.assertEqual(tar.extractfile('dataset/text/file_3.csv').read(),
+                                     b'1,2,3,4,5\n' * 10000)
+
+    def test_unknown_and_missing_codecs(self):
+        self.assertRaises(FloydException, get_archive_codec, 'bzip2')
+        with patch('floyd.client.files.zstandard', None):
+            self.assertRaises(FloydException, get_archive_codec, 'zstd')
+        self.assertEqual(get_archive_codec('store').data_type, 'tar')
+
+    def test_auto_compresses_compressible_data_on_slow_links(self):
+        codec = choose_archive_codec(self.source_dir, bandwidth=1024 * 1024)
+        self.assertNotEqual(codec.name, 'store')
+
+    def test_auto_stores_incompressible_data(self):
+        shutil.rmtree(os.path.join(self.source_dir, 'text'))
+        with open(os.path.join(self.source_dir, 'photo.jpg'), 'wb') as f:
+            f.write(os.urandom(1024 * 1024))
+        codec = choose_archive_codec(self.source_dir, bandwidth=1024 * 1024)
+        self.assertEqual(codec.name, 'store')
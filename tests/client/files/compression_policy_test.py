@@ -0,0 +1,74 @@
+import gzip
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from floyd.client.files import (
+    DataCompressor, ParallelGzipWriter, byte_entropy, is_incompressible
+)
+
+
+class TestFilesClientCompressionPolicy(unittest.TestCase):
+    """
+    Tests FileClient storing of incompressible files
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.temp_dir, 'images')
+        os.makedirs(self.source_dir)
+        self.files = {
+            'photo.jpg': os.urandom(200 * 1024),
+            'noise.bin': os.urandom(200 * 1024),
+            'labels.csv': b'image,label\n' * 20000,
+            'small.jpg': os.urandom(100),
+        }
+        for name, content in self.files.items():
+            with open(os.path.join(self.source_dir, name), 'wb') as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, name):
+        return os.path.join(self.source_dir, name)
+
+    def test_byte_entropy(self):
+        self.assertEqual(byte_entropy(b'aaaa'), 0)
+        self.assertEqual(byte_entropy(bytearray(range(256))), 8)
+
+    def test_is_incompressible(self):
+        self.assertTrue(is_incompressible(self.path('photo.jpg')))
+        self.assertTrue(is_incompressible(self.path('noise.bin')))
+        self.assertFalse(is_incompressible(self.path('labels.csv')))
+        self.assertFalse(is_incompressible(self.path('small.jpg')))
+        self.assertFalse(is_incompressible(self.source_dir))
+
+    def test_stored_blocks(self):
+        output = io.BytesIO()
+        with ParallelGzipWriter(output, workers=2, block_size=64 * 1024) as writer:
+            writer.write(self.files['labels.csv'])
+            writer.set_compressible(False)
+            writer.write(self.files['noise.bin'])
+            writer.set_compressible(True)
+            writer.write(self.files['labels.csv'])
+
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(output.getvalue())).read(),
+                         self.files['labels.csv'] + self.files['noise.bin'] + self.files['labels.csv'])
+        # Stored data only costs the block headers
+        self.assertLess(len(output.getvalue()), len(self.files['noise.bin']) * 1.01)
+
+    def test_archive_is_as_small_as_compressing_everything(self):
+        sizes = []
+        for store_incompressible in (True, False):
+            tarball_path = os.path.join(self.temp_dir, 'data_%s.tar.gz' % store_incompressible)
+            DataCompressor(self.source_dir, filename=tarball_path, compress_workers=1,
+                           store_incompressible=store_incompressible).create_tarfile()
+            with tarfile.open(tarball_path) as tar:
+                self.assertEqual(tar.extractfile('images/photo.jpg').read(), self.files['photo.jpg'])
+                self.assertEqual(tar.extractfile('images/labels.csv').read(), self.files['labels.csv'])
+            sizes.append(os.path.getsize(tarball_path))
+
+        self.assertLess(sizes[0], sizes[1] * 1.005)
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.files import DataCompressor, is_incompressible
+from floyd.manager.floyd_ignore import FloydIgnoreMatcher
+from tests.client.mocks import tree
+
+
+class TestDataCompressorIgnore(unittest.TestCase):
+    """
+    Tests DataCompressor leaves out ignored and non included paths
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.temp_dir, 'dataset')
+        for root, (dirs, files) in tree.items():
+            root = os.path.join(self.source_dir, root)
+            if not os.path.isdir(root):
+                os.makedirs(root)
+            for file_name in files:
+                with open(os.path.join(root, file_name), 'w') as f:
+                    f.write('x' * 100)
+        self.tarball_path = os.path.join(self.temp_dir, 'data.tar.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def archive_names(self, source_dir=None, **kwargs):
+        compressor = DataCompressor(source_dir=source_dir or self.source_dir, filename=self.tarball_path, **kwargs)
+        compressor.create_tarfile()
+        with tarfile.open(self.tarball_path) as tar:
+            return set(tar.getnames())
+
+    def test_ignored_directories_are_not_walked(self):
+        names = self.archive_names(ignore_matcher=FloydIgnoreMatcher(['bar_dir']))
+
+        self.assertFalse([name for name in names if name.startswith('dataset/bar_dir')])
+        self.assertIn('dataset/foo_dir/foo_file.py', names)
+
+    def test_ignored_files_and_whitelist(self):
+        names = self.archive_names(ignore_matcher=FloydIgnoreMatcher(['*.py', '*.md'], ['README.md']))
+
+        self.assertNotIn('dataset/hello_world.py', names)
+        self.assertNotIn('dataset/bar_dir/bar_dir_2/bar_file.py', names)
+        self.assertNotIn('dataset/baz_dir/baz_dir_2/baz_file.md', names)
+        self.assertIn('dataset/README.md', names)
+        self.assertIn('dataset/baz_dir/baz_dir_2/baz_file.txt', names)
+
+    def test_include_keeps_directories_and_matching_files(self):
+        names = self.archive_names(include=['*.h5'])
+
+        self.assertEqual(set(name for name in names if '.' in name), {
+            'dataset/bar_dir/bar_data.h5',
+            'dataset/bar_dir/bar_dir_2/bar_dir_3/bar_data.h5',
+        })
+        self.assertIn('dataset/baz_dir/baz_dir_2/baz_dir_3', names)
+
+    def test_exclude_wins_over_include(self):
+        names = self.archive_names(ignore_matcher=FloydIgnoreMatcher(['bar_dir_3']), include=['*.h5'])
+
+        self.assertEqual(set(name for name in names if '.' in name), {'dataset/bar_dir/bar_data.h5'})
+
+    def test_root_is_never_excluded(self):
+        names = self.archive_names(ignore_matcher=FloydIgnoreMatcher(['dataset']))
+
+        self.assertIn('dataset', names)
+        self.assertIn('dataset/README.md', names)
+
+    def test_relative_paths_of_current_directory(self):
+        cwd = os.getcwd()
+        os.chdir(self.source_dir)
+        try:
+            names = self.archive_names(source_dir='.',
+                                       ignore_matcher=FloydIgnoreMatcher(['foo_dir', 'bar_dir/bar_dir_2/*.py']),
+                                       include=['*.py', '*.h5'])
+        finally:
+            os.chdir(cwd)
+
+        self.assertFalse([name for name in names if name.startswith('./foo_dir')])
+        self.assertEqual(set(name for name in names if name.endswith(('.py', '.h5'))), {
+            './hello_world.py',
+            './bar_dir/bar_data.h5',
+            './bar_dir/bar_dir_2/bar_dir_3/bar_data.h5',
+        })
+
+    def test_left_out_files_are_never_probed(self):
+        with patch('floyd.client.files.is_incompressible', side_effect=is_incompressible) as probe:
+            names = self.archive_names(ignore_matcher=FloydIgnoreMatcher(['baz_dir']),
+                                       only_files={'README.md', 'bar_dir/bar_data.h5', 'baz_dir/baz_dir_2/baz_file.md'})
+
+        self.assertEqual(set(name for name in names if '.' in name), {
+            'dataset/README.md',
+            'dataset/bar_dir/bar_data.h5',
+        })
+        self.assertEqual(sorted(call[0][0] for call in probe.call_args_list), [
+            os.path.join(self.source_dir, 'README.md'),
+            os.path.join(self.source_dir, 'bar_dir', 'bar_data.h5'),
+        ])
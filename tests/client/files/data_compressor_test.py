@@ -0,0 +1,56 @@
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from floyd.client.files import DataCompressor
+from tests.client.mocks import tree
+
+
+class TestFilesClientDataCompressor(unittest.TestCase):
+    """
+    Tests FileClient DataCompressor on the tree of mock_fs1
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.temp_dir, 'dataset')
+        for root, (dirs, files) in tree.items():
+            root = os.path.join(self.source_dir, root)
+            if not os.path.isdir(root):
+                os.makedirs(root)
+            for file_name in files:
+                with open(os.path.join(root, file_name), 'w') as f:
+                    f.write('x' * 100)
+        self.tarball_path = os.path.join(self.temp_dir, 'out', 'data.tar.gz')
+        os.makedirs(os.path.dirname(self.tarball_path))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_archive_matches_recursive_tarfile_add(self):
+        compressor = DataCompressor(source_dir=self.source_dir, filename=self.tarball_path)
+        compressor.create_tarfile()
+
+        reference_path = os.path.join(self.temp_dir, 'reference.tar')
+        with tarfile.open(reference_path, 'w') as tar:
+            tar.add(self.source_dir, arcname='dataset')
+
+        with tarfile.open(self.tarball_path) as tar, tarfile.open(reference_path) as reference:
+            self.assertEqual(sorted(tar.getnames()), sorted(reference.getnames()))
+            self.assertEqual(tar.extractfile('dataset/bar_dir/bar_data.h5').read(), b'x' * 100)
+
+    def test_estimate_is_exact_once_done(self):
+        compressor = DataCompressor(source_dir=self.source_dir, filename=self.tarball_path)
+        compressor.create_tarfile()
+
+        # 1 root + 7 directories + 8 files of 100 bytes
+        self.assertEqual(compressor.estimated_total(), (16, 800))
+
+    def test_archive_is_hashed_while_written(self):
+        compressor = DataCompressor(source_dir=self.source_dir, filename=self.tarball_path)
+        compressor.create_tarfile()
+
+        with open(self.tarball_path, 'rb') as f:
+            self.assertEqual(compressor.sha256, hashlib.sha256(f.read()).hexdigest())
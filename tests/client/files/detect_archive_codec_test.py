@@ -0,0 +1,59 @@
+import io
+import tarfile
+import unittest
+
+from floyd.client.files import (
+    ARCHIVE_CODECS, ARCHIVE_HEADER_SIZE, PrefixedReader, detect_archive_codec
+)
+from floyd.exceptions import FloydException
+
+
+def make_tar(size=4096):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        tarinfo = tarfile.TarInfo('data/file.bin')
+        tarinfo.size = size
+        tar.addfile(tarinfo, io.BytesIO(b'x' * size))
+    return buf.getvalue()
+
+
+def compress(codec, data):
+    compressobj = codec.compressobj()
+    if compressobj is None:
+        return data
+    return compressobj.compress(data) + compressobj.flush()
+
+
+class TestDetectArchiveCodec(unittest.TestCase):
+    def test_codec_is_detected_from_header(self):
+        tar = make_tar(size=1024 * 1024)
+        for codec in ARCHIVE_CODECS.values():
+            if not codec.available():
+                continue
+            header = compress(codec, tar)[:ARCHIVE_HEADER_SIZE]
+            self.assertIs(detect_archive_codec(header), codec)
+
+    def test_non_tar_archives_are_rejected(self):
+        gzip_codec = ARCHIVE_CODECS['gzip']
+        for header in [b'', b'hello world\n' * 100, compress(gzip_codec, b'hello world\n' * 100),
+                       b'\x1f\x8b' + b'\x01' * 100]:
+            with self.assertRaises(FloydException):
+                detect_archive_codec(header)
+
+    def test_empty_tar_is_rejected(self):
+        with self.assertRaises(FloydException) as context:
+            detect_archive_codec(b'\x00' * 10240)
+        self.assertIn('empty', context.exception.message)
+
+
+class TestPrefixedReader(unittest.TestCase):
+    def test_prefix_is_read_first(self):
+        reader = PrefixedReader(b'abc', io.BytesIO(b'defgh'))
+
+        self.assertEqual(reader.read(2), b'ab')
+        self.assertEqual(reader.read(3), b'cde')
+        self.assertEqual(reader.read(10), b'fgh')
+        self.assertEqual(reader.read(10), b'')
+
+    def test_read_all(self):
+        self.assertEqual(PrefixedReader(b'abc', io.BytesIO(b'def')).read(), b'abcdef')
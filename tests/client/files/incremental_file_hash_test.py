@@ -0,0 +1,46 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from floyd.client.files import HashingWriter, IncrementalFileHash
+
+
+class TestFilesClientIncrementalFileHash(unittest.TestCase):
+    """
+    Tests FileClient IncrementalFileHash and HashingWriter
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data = os.urandom(10000)
+        self.path = os.path.join(self.temp_dir, 'floydhub_data.tar.gz')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_chunks_in_order(self):
+        file_hash = IncrementalFileHash(self.path)
+        for offset in range(0, len(self.data), 3000):
+            file_hash.update(offset, self.data[offset:offset + 3000])
+        self.assertEqual(file_hash.offset, len(self.data))
+        self.assertEqual(file_hash.hexdigest(len(self.data)), hashlib.sha256(self.data).hexdigest())
+
+    def test_resent_and_skipped_chunks(self):
+        file_hash = IncrementalFileHash(self.path)
+        # Resumed at 2000, then a failed chunk resent from 2500
+        file_hash.update(2000, self.data[2000:3000])
+        file_hash.update(2500, self.data[2500:4000])
+        file_hash.update(4000, self.data[4000:5000])
+        self.assertEqual(file_hash.hexdigest(len(self.data)), hashlib.sha256(self.data).hexdigest())
+
+    def test_hashing_writer(self):
+        fileobj = io.BytesIO()
+        writer = HashingWriter(fileobj)
+        writer.write(self.data[:10])
+        writer.write(self.data[10:])
+        self.assertEqual(fileobj.getvalue(), self.data)
+        self.assertEqual(writer.hexdigest(), hashlib.sha256(self.data).hexdigest())
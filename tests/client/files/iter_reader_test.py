@@ -0,0 +1,41 @@
+import os
+import unittest
+
+from floyd.client.files import IterReader
+
+
+class TestIterReader(unittest.TestCase):
+    """
+    Tests reading an iterator of chunks as a file
+    """
+    def test_reads_across_chunks(self):
+        content = os.urandom(1000)
+        reader = IterReader([content[:10], b'', content[10:700], content[700:]])
+
+        data = [reader.read(size) for size in [5, 10, 1, 600, 300, 100]]
+
+        self.assertEqual([len(d) for d in data], [5, 10, 1, 600, 300, 84])
+        self.assertEqual(b''.join(data), content)
+        self.assertEqual(reader.read(10), b'')
+
+    def test_read_all_returns_the_rest(self):
+        reader = IterReader([b'abc', b'def', b'ghi'])
+
+        self.assertEqual(reader.read(4), b'abcd')
+        self.assertEqual(reader.read(), b'efghi')
+        self.assertEqual(reader.read(), b'')
+
+    def test_small_reads_of_a_large_chunk_only_copy_what_they_return(self):
+        class Chunk(bytes):
+            sliced = []
+
+            def __getitem__(self, index):
+                data = bytes.__getitem__(self, index)
+                Chunk.sliced.append(len(data))
+                return data
+
+        reader = IterReader([Chunk(b'x' * 8 * 1024 * 1024)])
+        for _ in range(1024):
+            self.assertEqual(len(reader.read(512)), 512)
+
+        self.assertEqual(Chunk.sliced, [512] * 1024)
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from requests_toolbelt import MultipartEncoder
+
+from floyd.client.files import LazyFile, get_files_in_current_directory
+from floyd.exceptions import FloydException
+
+
+class TestFilesClientLazyFile(unittest.TestCase):
+    """
+    Tests FileClient LazyFile
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(50):
+            path = os.path.join(self.temp_dir, 'file_%d.py' % i)
+            with open(path, 'wb') as f:
+                f.write(('print(%d)\n' % i).encode('utf-8') * (i + 1))
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_files_are_only_open_while_read(self):
+        lazy_files = [LazyFile(path) for path in self.paths]
+        encoder = MultipartEncoder(fields=[('code', (os.path.basename(f.path), f, 'text/plain'))
+                                           for f in lazy_files])
+
+        # Content-Length is known before any file is opened
+        expected_size = sum(os.path.getsize(path) for path in self.paths)
+        self.assertGreater(encoder.len, expected_size)
+        self.assertTrue(all(f._file is None for f in lazy_files))
+
+        body = encoder.read()
+        self.assertEqual(len(body), encoder.len)
+        self.assertIn(b'print(49)\n' * 50, body)
+        self.assertTrue(all(f._file is None and f.len == 0 for f in lazy_files))
+
+    def test_raises_if_file_shrinks(self):
+        lazy_file = LazyFile(self.paths[10])
+        with open(self.paths[10], 'wb') as f:
+            f.write(b'x')
+
+        self.assertEqual(lazy_file.read(1), b'x')
+        self.assertRaises(FloydException, lazy_file.read)
+        self.assertIsNone(lazy_file._file)
+
+    def test_sizes_come_from_the_walker_stat(self):
+        files = [(path, os.stat(path)) for path in self.paths]
+        with patch('floyd.client.files.os.path.getsize') as getsize:
+            upload_files, total_size = get_files_in_current_directory('code', files=files)
+
+        getsize.assert_not_called()
+        self.assertEqual(total_size, sum(stat.st_size for _, stat in files))
+        self.assertEqual([upload_file[1][1].size for upload_file in upload_files],
+                         [stat.st_size for _, stat in files])
@@ -0,0 +1,38 @@
+import gzip
+import io
+import os
+import unittest
+import zlib
+
+from floyd.client.files import ParallelGzipWriter
+
+
+class TestFilesClientParallelGzipWriter(unittest.TestCase):
+    """
+    Tests FileClient ParallelGzipWriter
+    """
+    def compress(self, chunks, **kwargs):
+        output = io.BytesIO()
+        with ParallelGzipWriter(output, **kwargs) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+        return output.getvalue()
+
+    def test_output_is_standard_multi_member_gzip(self):
+        data = os.urandom(100 * 1024) + b'floyd' * 50000
+        chunks = [data[i:i + 7000] for i in range(0, len(data), 7000)]
+        compressed = self.compress(chunks, workers=4, block_size=16 * 1024)
+
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(compressed)).read(), data)
+        # One gzip member per block
+        members = 0
+        while compressed:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            decompressor.decompress(compressed)
+            compressed = decompressor.unused_data
+            members += 1
+        self.assertEqual(members, len(data) // (16 * 1024) + 1)
+
+    def test_empty_input(self):
+        compressed = self.compress([], workers=2)
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(compressed)).read(), b'')
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from mock import patch
+
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+from floyd.client.files import DataCompressor
+
+
+class TestDataCompressorPlanShards(unittest.TestCase):
+    """
+    Tests DataCompressor.plan_shards splits the files in size-balanced shards
+    """
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.sizes = {'a.bin': 900, 'b.bin': 500, 'sub/c.bin': 400, 'sub/d.bin': 300, 'sub/e.bin': 100}
+        os.makedirs(os.path.join(self.source_dir, 'sub', 'empty'))
+        for path, size in self.sizes.items():
+            with open(os.path.join(self.source_dir, path), 'wb') as f:
+                f.write(b'x' * size)
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def shard_sizes(self, shards):
+        return sorted(sum(self.sizes[path] for path in shard) for shard in shards)
+
+    def test_shards_are_balanced(self):
+        shards = DataCompressor(source_dir=self.source_dir).plan_shards(2)
+
+        self.assertEqual(self.shard_sizes(shards), [1000, 1200])
+        self.assertEqual(set.union(*shards), set(self.sizes))
+
+    def test_shards_only_hold_files_to_compress(self):
+        compressor = DataCompressor(source_dir=self.source_dir, only_files={'a.bin', 'sub/e.bin'})
+
+        self.assertEqual(sorted(sorted(shard) for shard in compressor.plan_shards(2)), [['a.bin'], ['sub/e.bin']])
+
+    def test_no_empty_shards(self):
+        self.assertEqual(len(DataCompressor(source_dir=self.source_dir).plan_shards(10)), 5)
+        self.assertEqual(DataCompressor(source_dir=self.source_dir, only_files=set()).plan_shards(3), [set()])
+
+    def test_shards_are_compressed_from_their_files(self):
+        os.symlink('c.bin', os.path.join(self.source_dir, 'sub', 'link'))
+        tarball_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tarball_dir)
+        compressor = DataCompressor(source_dir=self.source_dir)
+        with patch('floyd.client.files.scandir', side_effect=scandir) as listed_dirs:
+            shards = compressor.plan_shards(2)
+            shards[0] = shards[0] | set(compressor.list_dirs()) | set(compressor.list_other_entries())
+            self.assertEqual(listed_dirs.call_count, 3)
+
+            names = []
+            for index, files in enumerate(shards):
+                tarball_path = os.path.join(tarball_dir, 'shard_%s.tar.gz' % index)
+                DataCompressor(source_dir=self.source_dir, filename=tarball_path, files=files).create_tarfile()
+                with tarfile.open(tarball_path) as tar:
+                    names.extend(tar.getnames())
+            # The shard compressors don't walk the source again
+            self.assertEqual(listed_dirs.call_count, 3)
+
+        # The shards hold everything the single archive holds
+        tarball_path = os.path.join(tarball_dir, 'single.tar.gz')
+        DataCompressor(source_dir=self.source_dir, filename=tarball_path).create_tarfile()
+        with tarfile.open(tarball_path) as tar:
+            single_names = tar.getnames()
+        self.assertEqual(sorted(set(names)), sorted(single_names))
+
+        root = os.path.basename(self.source_dir)
+        self.assertEqual(set(names) - {root}, set(os.path.join(root, path) for path in
+                                                  list(self.sizes) + ['sub', 'sub/empty', 'sub/link']))
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from floyd.client.files import ReadAheadReader
+
+
+class TestFilesClientReadAheadReader(unittest.TestCase):
+    """
+    Tests FileClient ReadAheadReader
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data = os.urandom(10000)
+        self.path = os.path.join(self.temp_dir, 'floydhub_data.tar.gz')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_sequential_reads_reuse_two_buffers(self):
+        chunks = []
+        buffers = set()
+        with ReadAheadReader(self.path, block_size=3000) as reader:
+            offset = 0
+            while offset < len(self.data):
+                view = reader.read(offset, 3000)
+                buffers.add(id(view.obj))
+                chunks.append(view.tobytes())
+                offset += len(view)
+            self.assertEqual(len(reader.read(offset, 3000)), 0)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [3000, 3000, 3000, 1000])
+        self.assertEqual(b''.join(chunks), self.data)
+        self.assertEqual(len(buffers), 2)
+
+    def test_reads_at_other_offsets_and_sizes(self):
+        with ReadAheadReader(self.path) as reader:
+            self.assertEqual(reader.read(0, 1000).tobytes(), self.data[:1000])
+            # Smaller than the chunk read ahead
+            self.assertEqual(reader.read(1000, 500).tobytes(), self.data[1000:1500])
+            # Larger than the chunk read ahead
+            self.assertEqual(reader.read(1500, 2000).tobytes(), self.data[1500:3500])
+            # Back to an earlier offset, as after a failed chunk
+            self.assertEqual(reader.read(200, 2000).tobytes(), self.data[200:2200])
+            self.assertEqual(reader.read(9000, 5000).tobytes(), self.data[9000:])
+
+    def test_growing_chunks_while_views_are_held(self):
+        with ReadAheadReader(self.path) as reader:
+            offset = 0
+            size = 100
+            while offset < len(self.data):
+                # The caller still holds the previous view, as resume_upload does
+                view = reader.read(offset, size)
+                self.assertEqual(view.tobytes(), self.data[offset:offset + size])
+                offset += len(view)
+                size *= 2
+
+    def test_changing_chunk_sizes_are_served_from_the_blocks_read_ahead(self):
+        with ReadAheadReader(self.path, block_size=4096) as reader:
+            read_into = reader._read_into
+            block_reads = []
+
+            def recorded_read_into(index, offset):
+                block_reads.append(offset)
+                return read_into(index, offset)
+            reader._read_into = recorded_read_into
+
+            offset = 0
+            for size in [1000, 3000, 500, 5000, 400, 100]:
+                view = reader.read(offset, size)
+                self.assertEqual(view.tobytes(), self.data[offset:offset + size])
+                offset += len(view)
+
+        self.assertEqual(offset, len(self.data))
+        # Every block is read once, whatever the chunk sizes
+        self.assertEqual(block_reads, [0, 4096, 8192])
@@ -0,0 +1,48 @@
+import os
+import threading
+import unittest
+
+from floyd.client.files import RingBuffer
+from floyd.exceptions import FloydException
+
+
+class TestFilesClientRingBuffer(unittest.TestCase):
+    """
+    Tests FileClient RingBuffer
+    """
+    def test_bytes_pass_through_in_order(self):
+        data = os.urandom(100000)
+        ring_buffer = RingBuffer(1000)
+
+        def produce():
+            for start in range(0, len(data), 777):
+                ring_buffer.write(data[start:start + 777])
+            ring_buffer.close()
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        received = []
+        for block in iter(lambda: ring_buffer.read(300), b''):
+            self.assertTrue(len(block) == 300 or len(received) == len(data) // 300)
+            received.append(block)
+        producer.join()
+        self.assertEqual(b''.join(received), data)
+
+    def test_abort_unblocks_writer(self):
+        ring_buffer = RingBuffer(10)
+        errors = []
+
+        def produce():
+            try:
+                ring_buffer.write(b'x' * 100)
+            except FloydException as e:
+                errors.append(e)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        self.assertEqual(ring_buffer.read(5), b'x' * 5)
+        ring_buffer.abort(FloydException('Upload failed'))
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertRaises(FloydException, ring_buffer.read, 1)
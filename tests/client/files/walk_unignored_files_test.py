@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from floyd.client.files import get_unignored_file_paths, walk_unignored_files
+from floyd.exceptions import SizeLimitExceededException
+from floyd.manager.floyd_ignore import FloydIgnoreMatcher
+from tests.client.mocks import tree
+
+
+class TestFilesClientWalkUnignoredFiles(unittest.TestCase):
+    """
+    Tests FileClient walk_unignored_files() on the tree of mock_fs1
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.temp_dir = tempfile.mkdtemp()
+        os.chdir(self.temp_dir)
+        for root, (dirs, files) in tree.items():
+            if not os.path.isdir(root):
+                os.makedirs(root)
+            for file_name in files:
+                with open(os.path.join(root, file_name), 'w') as f:
+                    f.write('x' * 10)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def test_matches_serial_walk(self):
+        for ignore_list, white_list in [([], []),
+                                        (['*.py', '*.h5', 'baz_dir_3'], ['bar_file.py']),
+                                        (['*'], ['*.md']),
+                                        (['bar_dir/bar_dir_2', 'baz_dir_2/'], [])]:
+            matcher = FloydIgnoreMatcher(ignore_list, white_list)
+            result = [path for path, _ in walk_unignored_files(matcher, workers=3)]
+            self.assertEqual(result, sorted(get_unignored_file_paths(ignore_list, white_list)))
+
+    def test_returns_stat_data(self):
+        result = walk_unignored_files(FloydIgnoreMatcher())
+        self.assertEqual(len(result), 8)
+        self.assertTrue(all(stat.st_size == 10 for _, stat in result))
+
+    def test_aborts_over_max_size(self):
+        self.assertRaises(SizeLimitExceededException,
+                          walk_unignored_files, FloydIgnoreMatcher(), max_size=75)
+        self.assertEqual(len(walk_unignored_files(FloydIgnoreMatcher(), max_size=80)), 8)
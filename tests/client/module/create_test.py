@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from mock import patch
+
+import requests
+
+from requests_toolbelt.multipart.decoder import MultipartDecoder
+
+from floyd.client import files as files_client
+from floyd.client.module import ModuleClient
+from floyd.exceptions import AuthenticationException
+from floyd.model.module import Module
+from tests.client.stand_in_server import StandInServer
+
+
+class ModuleApiStandIn(StandInServer):
+    """
+    Stand-in for the modules API with content-addressed code storage
+    """
+    def __init__(self, incremental=True, probe_status=None):
+        super(ModuleApiStandIn, self).__init__()
+        self.incremental = incremental
+        # Status answered to the missing blobs probe instead of the blobs
+        self.probe_status = probe_status
+        self.blobs = {}
+        self.uploads = []
+        self.bundle_sizes = []
+
+    def unpack_bundle(self, part):
+        content = part.content
+        if part.headers[b'Content-Type'] == b'application/zstd':
+            content = files_client.zstandard.ZstdDecompressor().stream_reader(io.BytesIO(content)).read()
+        else:
+            content = gzip.GzipFile(fileobj=io.BytesIO(content)).read()
+        with tarfile.open(fileobj=io.BytesIO(content)) as tar:
+            return {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+
+    def handle(self, request):
+        if request.path == '/api/v1/modules/code_blobs/missing':
+            if not self.incremental:
+                return 404, {}, b''
+            if self.probe_status:
+                return self.probe_status, {}, b''
+            hashes = json.loads(request.body.decode('utf-8'))['hashes']
+            missing = [h for h in hashes if h not in self.blobs]
+            return 200, {}, json.dumps({'missing': missing}).encode('utf-8')
+
+        if request.path == '/api/v1/modules/':
+            decoder = MultipartDecoder(request.body, request.headers['Content-Type'])
+            files = {}
+            for part in decoder.parts:
+                disposition = part.headers[b'Content-Disposition'].decode('utf-8')
+                if 'name="code_bundle"' in disposition:
+                    self.bundle_sizes.append(len(part.content))
+                    files.update(self.unpack_bundle(part))
+                elif 'filename=' in disposition:
+                    filename = disposition.split('filename="')[1].rstrip('"')
+                    files[filename] = part.content
+            for content in files.values():
+                self.blobs[hashlib.sha256(content).hexdigest()] = content
+            self.uploads.append(files)
+            return 200, {}, json.dumps({'id': 'module_id'}).encode('utf-8')
+
+        return 404, {}, b''
+
+
+class TestModuleClientCreate(unittest.TestCase):
+    """
+    Tests ModuleClient.create() code sync against a local modules API
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.project_dir = tempfile.mkdtemp()
+        os.chdir(self.project_dir)
+        for name, content in [('main.py', 'print(1)'), ('utils.py', 'x = 1'), ('copy.py', 'x = 1')]:
+            with open(name, 'w') as f:
+                f.write(content)
+
+        patchers = [
+            patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'),
+            patch('floyd.client.module.CodeManifestManager.CONFIG_FILE_PATH',
+                  os.path.join(self.project_dir, '.floydmanifest')),
+            patch('floyd.client.files.FloydIgnoreManager.CONFIG_FILE_PATH',
+                  os.path.join(self.project_dir, '.floydignore')),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.module = Module(name='foo/bar', description='', command='ls', family_id='family_id')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.project_dir)
+
+    def create_module(self, server, bundle=None):
+        with patch('floyd.floyd_host', server.url):
+            return ModuleClient().create(self.module, bundle=bundle)
+
+    def test_only_changed_files_are_uploaded(self):
+        with ModuleApiStandIn() as server:
+            self.assertEqual(self.create_module(server), 'module_id')
+            # Identical content is only sent once
+            self.assertEqual(len(server.uploads[0]), 2)
+            self.assertTrue(os.path.isfile('.floydmanifest'))
+
+            with open('main.py', 'w') as f:
+                f.write('print(2)')
+            self.create_module(server)
+
+        self.assertEqual(list(server.uploads[1].keys()), ['./main.py'])
+        manifest_body = server.requests[-1].body.decode('utf-8')
+        self.assertIn('"./utils.py": "%s"' % hashlib.sha256(b'x = 1').hexdigest(), manifest_body)
+
+    def test_full_upload_without_incremental_support(self):
+        with ModuleApiStandIn(incremental=False) as server:
+            self.create_module(server)
+            self.create_module(server)
+
+        self.assertEqual(len(server.uploads[0]), 3)
+        self.assertEqual(len(server.uploads[1]), 3)
+
+    def test_full_upload_when_the_probe_fails(self):
+        for status in [403, 405, 503]:
+            with ModuleApiStandIn(probe_status=status) as server:
+                self.assertEqual(self.create_module(server), 'module_id')
+
+            self.assertEqual(len(server.uploads[0]), 3)
+
+    def test_full_upload_when_the_probe_cannot_connect(self):
+        request = requests.request
+
+        def request_without_probe(method, url, **kwargs):
+            if url.endswith('/code_blobs/missing'):
+                raise requests.exceptions.ConnectionError('Connection refused')
+            return request(method, url, **kwargs)
+
+        with ModuleApiStandIn() as server, \
+                patch('floyd.client.base.requests.request', side_effect=request_without_probe):
+            self.assertEqual(self.create_module(server), 'module_id')
+
+        self.assertEqual(len(server.uploads[0]), 3)
+
+    def test_authentication_errors_are_raised(self):
+        with ModuleApiStandIn(probe_status=401) as server:
+            self.assertRaises(AuthenticationException, self.create_module, server)
+
+    def test_unreadable_file_exits(self):
+        with patch('floyd.client.files.hash_file', side_effect=IOError(13, 'Permission denied')):
+            with ModuleApiStandIn() as server:
+                with self.assertRaises(SystemExit) as cm:
+                    self.create_module(server)
+
+        self.assertIn('Permission denied', str(cm.exception.code))
+
+    def test_gzip_bundle_is_smaller_than_raw_files(self):
+        with open('model.py', 'w') as f:
+            f.write('layer = Dense(128)\n' * 5000)
+
+        with ModuleApiStandIn() as server:
+            self.assertEqual(self.create_module(server, bundle='gzip'), 'module_id')
+
+        self.assertEqual(sorted(server.uploads[0].keys()), ['copy.py', 'main.py', 'model.py'])
+        self.assertEqual(server.uploads[0]['model.py'], b'layer = Dense(128)\n' * 5000)
+        self.assertLess(server.bundle_sizes[0] * 5, os.path.getsize('model.py'))
+
+    @unittest.skipIf(files_client.zstandard is None, "zstandard is not installed")
+    def test_zstd_bundle(self):
+        with ModuleApiStandIn() as server:
+            self.create_module(server, bundle='zstd')
+
+        self.assertEqual(server.uploads[0]['main.py'], b'print(1)')
+
+    def test_bundle_over_max_size_exits(self):
+        with open('random.bin', 'wb') as f:
+            f.write(os.urandom(4096))
+
+        with ModuleApiStandIn(incremental=False) as server:
+            with patch.object(ModuleClient, 'MAX_UPLOAD_SIZE', 1024):
+                self.assertRaises(SystemExit, self.create_module, server, 'gzip')
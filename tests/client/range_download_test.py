@@ -0,0 +1,87 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.base import FloydHttpClient
+from tests.client.range_stand_in import RangeStandIn
+
+
+SEGMENT_SIZE = 64 * 1024
+
+
+class TestFloydHttpClientRangeDownload(unittest.TestCase):
+    """
+    Tests downloads fetched as parallel byte ranges from a local server
+    """
+    def setUp(self):
+        for patcher in [patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'),
+                        patch('floyd.client.download.time.sleep'),
+                        patch.object(FloydHttpClient, 'SEGMENTED_DOWNLOAD_MIN_SIZE', SEGMENT_SIZE),
+                        patch.object(FloydHttpClient, 'DOWNLOAD_SEGMENT_SIZE', SEGMENT_SIZE)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.filename = os.path.join(self.temp_dir, 'file.bin')
+        self.content = os.urandom(SEGMENT_SIZE * 5 + 123)
+
+    def download(self, stand_in):
+        return FloydHttpClient().download(stand_in.url + '/file', filename=self.filename)
+
+    def downloaded(self):
+        with open(self.filename, 'rb') as f:
+            return f.read()
+
+    def test_segments_are_fetched_in_parallel(self):
+        with RangeStandIn(self.content) as stand_in:
+            self.assertEqual(self.download(stand_in), self.filename)
+
+        self.assertEqual(self.downloaded(), self.content)
+        self.assertEqual(sorted(r.headers['Range'] for r in stand_in.range_requests()),
+                         sorted('bytes=%s-%s' % (start, min(start + SEGMENT_SIZE, len(self.content)) - 1)
+                                for start in range(0, len(self.content), SEGMENT_SIZE)))
+        self.assertTrue(all(r.headers['Authorization'] == 'Bearer token' for r in stand_in.range_requests()))
+
+    def test_failed_segments_are_retried(self):
+        with RangeStandIn(self.content, fail_ranges=[SEGMENT_SIZE, SEGMENT_SIZE * 3]) as stand_in:
+            self.download(stand_in)
+
+        self.assertEqual(self.downloaded(), self.content)
+        self.assertEqual(len(stand_in.range_requests()), 6 + 2)
+
+    def test_single_stream_without_range_support(self):
+        with RangeStandIn(self.content, accept_ranges=False) as stand_in:
+            self.download(stand_in)
+
+        self.assertEqual(self.downloaded(), self.content)
+        self.assertEqual(len(stand_in.requests), 1)
+
+    def test_small_files_use_a_single_stream(self):
+        self.content = self.content[:SEGMENT_SIZE - 1]
+        with RangeStandIn(self.content) as stand_in:
+            self.download(stand_in)
+
+        self.assertEqual(self.downloaded(), self.content)
+        self.assertFalse(stand_in.range_requests())
+
+    def test_segments_are_untarred_in_order(self):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            for index in range(4):
+                tarinfo = tarfile.TarInfo('data/%s.bin' % index)
+                tarinfo.size = SEGMENT_SIZE + index
+                tar.addfile(tarinfo, io.BytesIO(self.content[:tarinfo.size]))
+
+        with RangeStandIn(buf.getvalue()) as stand_in:
+            self.assertTrue(FloydHttpClient().download_untar(stand_in.url + '/data.tar',
+                                                             destination_dir=self.temp_dir))
+
+        self.assertTrue(len(stand_in.range_requests()) > 1)
+        for index in range(4):
+            with open(os.path.join(self.temp_dir, 'data', '%s.bin' % index), 'rb') as f:
+                self.assertEqual(f.read(), self.content[:SEGMENT_SIZE + index])
@@ -0,0 +1,43 @@
+import re
+import threading
+
+from tests.client.stand_in_server import StandInServer
+
+
+class RangeStandIn(StandInServer):
+    """
+    Local download server sending content, with byte ranges if
+    accept_ranges. The first range requests listed in fail_ranges by their
+    start offset fail once with a 500.
+    """
+
+    def __init__(self, content, accept_ranges=True, fail_ranges=(), etag=None):
+        super(RangeStandIn, self).__init__()
+        self.content = content
+        self.accept_ranges = accept_ranges
+        self.etag = etag
+        self.fail_ranges = set(fail_ranges)
+        self._fail_lock = threading.Lock()
+
+    def range_requests(self):
+        return [r for r in self.requests if r.headers.get('Range')]
+
+    def handle(self, request):
+        headers = {'Accept-Ranges': 'bytes'} if self.accept_ranges else {}
+        if self.etag:
+            headers['ETag'] = self.etag
+        match = re.match(r'bytes=(\d+)-(\d*)$', request.headers.get('Range') or '')
+        if not self.accept_ranges or not match:
+            return 200, headers, self.content
+
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else len(self.content)
+        end = min(end, len(self.content))
+        with self._fail_lock:
+            if start in self.fail_ranges:
+                self.fail_ranges.discard(start)
+                return 500, {}, b''
+        if start >= len(self.content):
+            return 416, {'Content-Range': 'bytes */%s' % len(self.content)}, b''
+        headers['Content-Range'] = 'bytes %s-%s/%s' % (start, end - 1, len(self.content))
+        return 206, headers, self.content[start:end]
@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.base import FloydHttpClient
+from floyd.client.download import DownloadState, RangeDownloader
+from floyd.exceptions import FloydException
+from tests.client.range_stand_in import RangeStandIn
+
+
+SEGMENT_SIZE = 64 * 1024
+
+
+class TestFloydHttpClientResumableDownload(unittest.TestCase):
+    """
+    Tests downloads interrupted and resumed from their on-disk state
+    """
+    def setUp(self):
+        for patcher in [patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'),
+                        patch('floyd.client.download.time.sleep'),
+                        patch.object(FloydHttpClient, 'SEGMENTED_DOWNLOAD_MIN_SIZE', SEGMENT_SIZE),
+                        patch.object(FloydHttpClient, 'DOWNLOAD_SEGMENT_SIZE', SEGMENT_SIZE),
+                        patch.object(FloydHttpClient, 'DOWNLOAD_STATE_INTERVAL', SEGMENT_SIZE)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.filename = os.path.join(self.temp_dir, 'file.bin')
+        self.content = os.urandom(SEGMENT_SIZE * 5 + 123)
+
+    def download(self, stand_in):
+        return FloydHttpClient().download(stand_in.url + '/file', filename=self.filename)
+
+    def downloaded(self):
+        with open(self.filename, 'rb') as f:
+            return f.read()
+
+    def interrupt(self, stand_in, failed_range):
+        stand_in.fail_ranges.add(failed_range)
+        with patch.object(RangeDownloader, 'MAX_RETRIES', 0):
+            self.assertRaises(FloydException, self.download, stand_in)
+
+    def test_interrupted_download_resumes_missing_ranges(self):
+        with RangeStandIn(self.content, etag='"v1"') as stand_in:
+            self.interrupt(stand_in, SEGMENT_SIZE * 2)
+            self.assertFalse(os.path.exists(self.filename))
+            self.assertTrue(os.path.exists(self.filename + '.part.json'))
+
+            del stand_in.requests[:]
+            self.assertEqual(self.download(stand_in), self.filename)
+
+        self.assertEqual(self.downloaded(), self.content)
+        self.assertEqual([r.headers['Range'] for r in stand_in.range_requests()],
+                         ['bytes=%s-%s' % (SEGMENT_SIZE * 2, SEGMENT_SIZE * 3 - 1)])
+        self.assertEqual(stand_in.range_requests()[0].headers['If-Range'], '"v1"')
+        self.assertFalse(os.path.exists(self.filename + '.part'))
+        self.assertFalse(os.path.exists(self.filename + '.part.json'))
+
+    def test_changed_content_restarts_the_download(self):
+        with RangeStandIn(self.content, etag='"v1"') as stand_in:
+            self.interrupt(stand_in, SEGMENT_SIZE * 2)
+
+        self.content = os.urandom(len(self.content))
+        with RangeStandIn(self.content, etag='"v2"') as stand_in:
+            self.download(stand_in)
+
+        self.assertEqual(self.downloaded(), self.content)
+        self.assertEqual(len(stand_in.range_requests()), 6)
+
+    def test_download_without_etag_is_not_resumed(self):
+        with RangeStandIn(self.content) as stand_in:
+            self.interrupt(stand_in, SEGMENT_SIZE * 2)
+
+            del stand_in.requests[:]
+            self.download(stand_in)
+
+        self.assertEqual(self.downloaded(), self.content)
+        self.assertEqual(len(stand_in.range_requests()), 6)
+
+    def test_streamed_download_resumes_from_its_saved_state(self):
+        self.content = self.content[:SEGMENT_SIZE * 3]
+        state = DownloadState(self.filename, 'unused', '"v1"', len(self.content))
+        with open(state.part_path, 'wb') as f:
+            f.write(self.content[:SEGMENT_SIZE] + b'\0' * SEGMENT_SIZE)
+        state.add(0, SEGMENT_SIZE)
+
+        with patch.object(FloydHttpClient, 'SEGMENTED_DOWNLOAD_MIN_SIZE', len(self.content) + 1), \
+                RangeStandIn(self.content, etag='"v1"') as stand_in:
+            state.url = stand_in.url + '/file'
+            state.save()
+            self.download(stand_in)
+
+        self.assertEqual(self.downloaded(), self.content)
+        self.assertEqual(sorted(r.headers['Range'] for r in stand_in.range_requests()),
+                         sorted('bytes=%s-%s' % (start, start + SEGMENT_SIZE - 1)
+                                for start in [SEGMENT_SIZE, SEGMENT_SIZE * 2]))
+
+    def test_interrupted_clone_resumes(self):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            tarinfo = tarfile.TarInfo('data/file.bin')
+            tarinfo.size = len(self.content)
+            tar.addfile(tarinfo, io.BytesIO(self.content))
+        destination_dir = os.path.join(self.temp_dir, 'clone')
+
+        def clone(stand_in):
+            return FloydHttpClient().download_tar(stand_in.url + '/data.tar', delete_after_untar=True,
+                                                  destination_dir=destination_dir, filename=self.filename)
+
+        with RangeStandIn(buf.getvalue(), etag='"v1"') as stand_in:
+            stand_in.fail_ranges.add(SEGMENT_SIZE * 2)
+            with patch.object(RangeDownloader, 'MAX_RETRIES', 0):
+                self.assertFalse(clone(stand_in))
+            self.assertFalse(os.path.exists(destination_dir))
+
+            del stand_in.requests[:]
+            self.assertTrue(clone(stand_in))
+
+        self.assertEqual([r.headers['Range'] for r in stand_in.range_requests()],
+                         ['bytes=%s-%s' % (SEGMENT_SIZE * 2, SEGMENT_SIZE * 3 - 1)])
+        with open(os.path.join(destination_dir, 'data', 'file.bin'), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(os.listdir(self.temp_dir), ['clone'])
+
+    def test_checksum_mismatch_discards_the_download(self):
+        digest = base64.b64encode(hashlib.sha256(b'other content').digest()).decode('ascii')
+        with RangeStandIn(self.content) as stand_in, \
+                patch.object(RangeStandIn, 'handle', side_effect=self.with_digest(stand_in, digest)):
+            self.assertRaises(FloydException, self.download, stand_in)
+
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertFalse(os.path.exists(self.filename + '.part'))
+        self.assertFalse(os.path.exists(self.filename + '.part.json'))
+
+    def test_checksum_is_verified(self):
+        digest = base64.b64encode(hashlib.sha256(self.content).digest()).decode('ascii')
+        with RangeStandIn(self.content) as stand_in, \
+                patch.object(RangeStandIn, 'handle', side_effect=self.with_digest(stand_in, digest)):
+            self.download(stand_in)
+
+        self.assertEqual(self.downloaded(), self.content)
+
+    def with_digest(self, stand_in, digest):
+        handle = stand_in.handle
+
+        def handle_with_digest(request):
+            status, headers, body = handle(request)
+            headers['Digest'] = 'sha-256=%s' % digest
+            return status, headers, body
+        return handle_with_digest
+
+
+class TestDownloadState(unittest.TestCase):
+    """
+    Tests the byte ranges tracked by DownloadState
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.filename = os.path.join(self.temp_dir, 'file.bin')
+
+    def test_ranges_are_merged_and_saved(self):
+        state = DownloadState(self.filename, 'http://host/file', '"v1"', 100)
+        for start, end in [(20, 30), (0, 10), (10, 20), (50, 60)]:
+            state.add(start, end)
+
+        self.assertEqual(state.done, [(0, 30), (50, 60)])
+        self.assertEqual(state.missing(), [(30, 50), (60, 100)])
+        with open(self.filename + '.part.json') as state_file:
+            self.assertEqual(json.loads(state_file.read())['done'], [[0, 30], [50, 60]])
+        self.assertEqual(DownloadState.load(self.filename).missing(), [(30, 50), (60, 100)])
+
+    def test_invalid_state_is_ignored(self):
+        with open(self.filename + '.part.json', 'w') as state_file:
+            state_file.write('{"done": ')
+
+        self.assertIsNone(DownloadState.load(self.filename))
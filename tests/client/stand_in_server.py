@@ -0,0 +1,108 @@
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class StandInRequest(object):
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandInServer(object):
+    """
+    Minimal local HTTP server used in place of the FloydHub APIs.
+
+    Subclasses implement handle(request) and return a tuple of
+    (status_code, headers_dict, body_bytes). Requests are recorded in
+    self.requests so tests can assert on what the client sent.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%s" % self._server.server_address[1]
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    def __enter__(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with stand_in._lock:
+                    stand_in.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _read_body(self):
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().strip().split(b';')[0], 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            return b''.join(chunks)
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def _dispatch(self):
+                try:
+                    body = self._read_body()
+                except (ValueError, IOError):
+                    # The client aborted the request mid-body
+                    self.close_connection = True
+                    return
+                request = StandInRequest(self.command, self.path, self.headers, body)
+                with stand_in._lock:
+                    stand_in.requests.append(request)
+                status, headers, body = stand_in.handle(request)
+                body = body or b''
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if not hasattr(body, 'read'):
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command == 'HEAD':
+                    return
+                if hasattr(body, 'read'):
+                    for block in iter(lambda: body.read(64 * 1024), b''):
+                        self.wfile.write(block)
+                else:
+                    self.wfile.write(body)
+
+            do_GET = do_POST = do_PATCH = do_HEAD = do_DELETE = _dispatch
+
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
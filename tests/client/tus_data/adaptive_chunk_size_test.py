@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.tus_data import AdaptiveChunkSize, TusDataClient
+from tests.client.tus_stand_in import TusStandIn
+
+
+class TestTusDataClientAdaptiveChunkSize(unittest.TestCase):
+    """
+    Tests TusDataClient AdaptiveChunkSize
+    """
+    def test_grows_with_throughput_up_to_max(self):
+        chunk_sizer = AdaptiveChunkSize(1000, 500, 8000, target_seconds=1)
+        chunk_sizer.record_success(1000, 0.01)
+        # At most doubles per chunk
+        self.assertEqual(chunk_sizer.size, 2000)
+        for _ in range(5):
+            chunk_sizer.record_success(chunk_sizer.size, 0.01)
+        self.assertEqual(chunk_sizer.size, 8000)
+
+    def test_shrinks_to_throughput_and_on_failures(self):
+        chunk_sizer = AdaptiveChunkSize(4000, 500, 8000, target_seconds=1)
+        chunk_sizer.record_success(4000, 4)
+        self.assertEqual(chunk_sizer.size, 1000)
+        chunk_sizer.record_failure()
+        self.assertEqual(chunk_sizer.size, 500)
+        chunk_sizer.record_failure()
+        self.assertEqual(chunk_sizer.size, 500)
+
+    def test_sizes_are_reported(self):
+        chunk_sizer = AdaptiveChunkSize(1024, 1024, 4096)
+        with patch('floyd.client.tus_data.floyd_logger') as logger:
+            chunk_sizer.record_success(1024, 0.001)
+        logger.debug.assert_called_once_with("Upload chunk size set to %s (%s)", "2.0KiB", "1000.0KiB/s measured")
+
+    @patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token')
+    def test_explicit_chunk_size_is_fixed(self, _):
+        chunk_sizer = TusDataClient(chunk_size=1024).chunk_sizer
+        chunk_sizer.record_success(1024, 0.001)
+        self.assertEqual(chunk_sizer.size, 1024)
+
+    def test_resume_upload_adapts_chunks(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        data = os.urandom(1024 * 1024)
+        file_path = os.path.join(temp_dir, 'floydhub_data.tar.gz')
+        with open(file_path, 'wb') as f:
+            f.write(data)
+
+        with patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'), \
+                TusStandIn() as tus_stand_in:
+            client = TusDataClient(chunk_size=4096, base_url=tus_stand_in.url + '/files/',
+                                   min_chunk_size=4096, max_chunk_size=256 * 1024)
+            endpoint = client.initialize_upload(file_path)
+            self.assertTrue(client.resume_upload(file_path, endpoint))
+            upload = tus_stand_in.uploads[endpoint.rsplit('/', 1)[-1]]
+
+        self.assertEqual(bytes(upload.data), data)
+        sizes = [len(r.body) for r in tus_stand_in.requests if r.method == 'PATCH']
+        self.assertEqual(sizes[:2], [4096, 8192])
+        self.assertLessEqual(max(sizes), 256 * 1024)
+        self.assertLess(len(sizes), 1024 * 1024 // 4096)
@@ -0,0 +1,82 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.tus_data import TusDataClient
+from tests.client.tus_stand_in import TusStandIn
+
+
+CHUNK_SIZE = 1024
+
+
+class TestTusDataClientChecksums(unittest.TestCase):
+    """
+    Tests TusDataClient checksums against a local TUS server
+    """
+    def setUp(self):
+        for patcher in [patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'),
+                        patch('floyd.client.tus_data.time.sleep')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.data = os.urandom(CHUNK_SIZE * 10)
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        self.file_path = os.path.join(temp_dir, 'floydhub_data.tar.gz')
+        with open(self.file_path, 'wb') as f:
+            f.write(self.data)
+
+    def upload(self, tus_stand_in, **kwargs):
+        client = TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/')
+        endpoint = client.initialize_upload(self.file_path)
+        result = client.resume_upload(self.file_path, endpoint, **kwargs)
+        return result, tus_stand_in.uploads[endpoint.rsplit('/', 1)[-1]]
+
+    def test_every_chunk_has_a_checksum(self):
+        with TusStandIn() as tus_stand_in:
+            result, upload = self.upload(tus_stand_in, sha256=self.sha256)
+
+        self.assertTrue(result)
+        patches = [r for r in tus_stand_in.requests if r.method == 'PATCH']
+        self.assertEqual(len(patches), 10)
+        for request in patches:
+            self.assertEqual(request.headers['Upload-Checksum'],
+                             'sha1 ' + base64.b64encode(hashlib.sha1(request.body).digest()).decode())
+
+    def test_corrupted_chunk_is_resent(self):
+        with TusStandIn(corrupt_patches=[3]) as tus_stand_in:
+            result, upload = self.upload(tus_stand_in)
+
+        self.assertTrue(result)
+        self.assertEqual(bytes(upload.data), self.data)
+
+    def test_resume_checks_the_tarball_did_not_change(self):
+        with TusStandIn(fail_patches=[4]) as tus_stand_in:
+            client = TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/', max_retries=0)
+            endpoint = client.initialize_upload(self.file_path)
+            self.assertFalse(client.resume_upload(self.file_path, endpoint, sha256=self.sha256))
+
+            # The tarball changed before the upload was resumed
+            with open(self.file_path, 'r+b') as f:
+                f.seek(CHUNK_SIZE)
+                f.write(b'changed')
+            self.assertFalse(client.resume_upload(self.file_path, endpoint, sha256=self.sha256))
+            upload = tus_stand_in.uploads[endpoint.rsplit('/', 1)[-1]]
+
+        # The last chunk was never sent, so the upload is not complete
+        self.assertLess(len(upload.data), len(self.data))
+
+    def test_resume_of_unchanged_tarball(self):
+        with TusStandIn(fail_patches=[4]) as tus_stand_in:
+            client = TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/', max_retries=0)
+            endpoint = client.initialize_upload(self.file_path)
+            self.assertFalse(client.resume_upload(self.file_path, endpoint, sha256=self.sha256))
+            self.assertTrue(client.resume_upload(self.file_path, endpoint, sha256=self.sha256))
+            upload = tus_stand_in.uploads[endpoint.rsplit('/', 1)[-1]]
+
+        self.assertEqual(bytes(upload.data), self.data)
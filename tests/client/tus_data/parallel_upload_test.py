@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.tus_data import TusDataClient
+from tests.client.tus_stand_in import TusStandIn
+
+
+CHUNK_SIZE = 1024
+
+
+class TestTusDataClientParallelUpload(unittest.TestCase):
+    """
+    Tests TusDataClient.parallel_upload against a local TUS server
+    """
+    def setUp(self):
+        patcher = patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.data = os.urandom(CHUNK_SIZE * 10 + 100)
+        self.file_path = os.path.join(temp_dir, 'floydhub_data.tar.gz')
+        with open(self.file_path, 'wb') as f:
+            f.write(self.data)
+
+    def client(self, tus_stand_in):
+        return TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/')
+
+    def final_upload(self, tus_stand_in, client, upload_parts):
+        endpoint = client.concatenate_uploads([part['endpoint'] for part in upload_parts])
+        self.assertTrue(endpoint)
+        return tus_stand_in.uploads[endpoint.rsplit('/', 1)[-1]]
+
+    def test_parts_are_split_on_chunks(self):
+        with TusStandIn() as tus_stand_in:
+            upload_parts = self.client(tus_stand_in).initialize_parallel_upload(self.file_path, 4)
+
+        self.assertEqual([(part['start'], part['length']) for part in upload_parts],
+                         [(0, 3072), (3072, 3072), (6144, 3072), (9216, 1124)])
+        self.assertEqual([r.headers['Upload-Concat'] for r in tus_stand_in.requests], ['partial'] * 4)
+
+    def test_small_file_uses_fewer_parts(self):
+        with open(self.file_path, 'wb') as f:
+            f.write(b'x' * 10)
+
+        with TusStandIn() as tus_stand_in:
+            upload_parts = self.client(tus_stand_in).initialize_parallel_upload(self.file_path, 4)
+
+        self.assertEqual([(part['start'], part['length']) for part in upload_parts], [(0, 10)])
+
+    def test_parts_are_concatenated(self):
+        with TusStandIn() as tus_stand_in:
+            client = self.client(tus_stand_in)
+            upload_parts = client.initialize_parallel_upload(self.file_path, 3)
+            self.assertTrue(client.parallel_upload(self.file_path, upload_parts))
+            upload = self.final_upload(tus_stand_in, client, upload_parts)
+
+        self.assertEqual(bytes(upload.data), self.data)
+
+    def test_resume_only_sends_unfinished_parts(self):
+        offsets = {}
+
+        def save_offset(index, offset):
+            offsets[index] = offset
+
+        with TusStandIn(fail_patches=[2]) as tus_stand_in:
+            # Without retries the failed chunk interrupts the upload
+            client = self.client(tus_stand_in)
+            client.max_retries = 0
+            upload_parts = client.initialize_parallel_upload(self.file_path, 2)
+            self.assertFalse(client.parallel_upload(self.file_path, upload_parts, on_progress=save_offset))
+            self.assertEqual(client.concatenate_uploads([part['endpoint'] for part in upload_parts]), "")
+
+            # Resume from the offsets saved in .floyddata
+            for index, part in enumerate(upload_parts):
+                part['offset'] = offsets[index]
+            finished = [part['endpoint'] for part in upload_parts if part['offset'] == part['length']]
+            self.assertEqual(len(finished), 1)
+            del tus_stand_in.requests[:]
+
+            self.assertTrue(client.parallel_upload(self.file_path, upload_parts, on_progress=save_offset))
+            upload = self.final_upload(tus_stand_in, client, upload_parts)
+
+        self.assertFalse([r for r in tus_stand_in.requests if r.path == '/files/' + finished[0].rsplit('/', 1)[-1]])
+        self.assertEqual(bytes(upload.data), self.data)
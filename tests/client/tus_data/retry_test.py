@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import threading
+import timeit
+import unittest
+from mock import patch
+import requests
+
+from floyd.client.tus_data import RetryBudget, TusDataClient
+from floyd.exceptions import (
+    AuthenticationException, LockedException, ServerException
+)
+from tests.client.tus_stand_in import TusStandIn
+
+
+CHUNK_SIZE = 1024
+STALL_SECONDS = 5
+
+
+class StallingTusStandIn(TusStandIn):
+    """
+    Leaves the first PATCH request hanging without storing any of its body
+    """
+    def __init__(self):
+        super(StallingTusStandIn, self).__init__()
+        self.stalled = threading.Event()
+
+    def handle(self, request):
+        if request.method == 'PATCH' and not self.stalled.is_set():
+            self.stalled.set()
+            # time.sleep is patched by the tests
+            threading.Event().wait(STALL_SECONDS)
+            return 500, {}, b''
+        return super(StallingTusStandIn, self).handle(request)
+
+
+@patch('floyd.client.tus_data.time.sleep')
+class TestTusDataClientRetryBudget(unittest.TestCase):
+    """
+    Tests TusDataClient RetryBudget
+    """
+    def test_backoff_is_exponential_with_jitter(self, sleep):
+        retry_budget = RetryBudget(5, base_delay=1, max_delay=10)
+        for _ in range(5):
+            self.assertTrue(retry_budget.backoff(ServerException()))
+        self.assertFalse(retry_budget.backoff(ServerException()))
+
+        delays = [call[0][0] for call in sleep.call_args_list]
+        for retry, delay in enumerate(delays, 1):
+            self.assertTrue(0 <= delay <= min(10, 2 ** retry))
+
+    def test_reset_restores_the_budget(self, sleep):
+        retry_budget = RetryBudget(1)
+        self.assertTrue(retry_budget.backoff(requests.exceptions.ConnectionError()))
+        retry_budget.reset()
+        self.assertTrue(retry_budget.backoff(requests.exceptions.ConnectionError()))
+        self.assertFalse(retry_budget.backoff(requests.exceptions.ConnectionError()))
+
+    def test_fatal_errors_are_not_retried(self, sleep):
+        self.assertFalse(RetryBudget(5).backoff(AuthenticationException()))
+        sleep.assert_not_called()
+
+    def test_locked_waits_without_using_retries(self, sleep):
+        retry_budget = RetryBudget(0, base_delay=1, max_delay=60, max_locked_wait=7)
+        for _ in range(3):
+            self.assertTrue(retry_budget.backoff(LockedException()))
+        self.assertFalse(retry_budget.backoff(LockedException()))
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2, 4])
+        self.assertEqual(retry_budget.retries, 0)
+
+
+class TestTusDataClientResumeUploadRetries(unittest.TestCase):
+    """
+    Tests TusDataClient.resume_upload retries against a local TUS server
+    """
+    def setUp(self):
+        for patcher in [patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'),
+                        patch('floyd.client.tus_data.time.sleep')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.data = os.urandom(CHUNK_SIZE * 10)
+        self.file_path = os.path.join(temp_dir, 'floydhub_data.tar.gz')
+        with open(self.file_path, 'wb') as f:
+            f.write(self.data)
+
+    def upload(self, tus_stand_in, **kwargs):
+        client = TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/', **kwargs)
+        endpoint = client.initialize_upload(self.file_path)
+        result = client.resume_upload(self.file_path, endpoint)
+        return result, tus_stand_in.uploads[endpoint.rsplit('/', 1)[-1]]
+
+    def test_continues_from_server_offset_after_failures(self):
+        with TusStandIn(fail_patches=[2, 3, 7]) as tus_stand_in:
+            result, upload = self.upload(tus_stand_in, max_retries=2)
+
+        self.assertTrue(result)
+        self.assertEqual(bytes(upload.data), self.data)
+        # The offset is fetched again after every failure
+        self.assertEqual(len([r for r in tus_stand_in.requests if r.method == 'HEAD']), 4)
+
+    def test_gives_up_when_retries_run_out(self):
+        with TusStandIn(fail_patches=[2, 3, 4]) as tus_stand_in:
+            result, _ = self.upload(tus_stand_in, max_retries=2)
+
+        self.assertFalse(result)
+
+    def test_waits_on_locked_upload(self):
+        with TusStandIn(locked_heads=3) as tus_stand_in:
+            result, upload = self.upload(tus_stand_in, max_retries=0)
+
+        self.assertTrue(result)
+        self.assertEqual(bytes(upload.data), self.data)
+
+    @patch('floyd.client.tus_data.TusDataClient.TIMEOUT', (5, 0.2))
+    def test_retries_stalled_request_after_timeout(self):
+        started = timeit.default_timer()
+        with StallingTusStandIn() as tus_stand_in:
+            result, upload = self.upload(tus_stand_in, max_retries=1)
+        self.assertLess(timeit.default_timer() - started, STALL_SECONDS)
+
+        self.assertTrue(tus_stand_in.stalled.is_set())
+        self.assertTrue(result)
+        self.assertEqual(bytes(upload.data), self.data)
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.tus_data import TusDataClient
+from tests.client.tus_stand_in import TusStandIn
+
+
+CHUNK_SIZE = 1024
+
+
+class TestTusDataClientSession(unittest.TestCase):
+    """
+    Tests TusDataClient connection reuse against a local TUS server
+    """
+    def setUp(self):
+        patcher = patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.file_path = os.path.join(temp_dir, 'floydhub_data.tar.gz')
+        with open(self.file_path, 'wb') as f:
+            f.write(os.urandom(CHUNK_SIZE * 20))
+
+    def test_upload_reuses_one_connection(self):
+        with TusStandIn() as tus_stand_in:
+            client = TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/')
+            endpoint = client.initialize_upload(self.file_path)
+            self.assertTrue(client.resume_upload(self.file_path, endpoint))
+
+        # Create, offset and 20 chunks
+        self.assertEqual(len(tus_stand_in.requests), 22)
+        self.assertEqual(tus_stand_in.connections, 1)
+
+    def test_clients_share_the_session(self):
+        with TusStandIn() as tus_stand_in:
+            base_url = tus_stand_in.url + '/files/'
+            endpoint = TusDataClient(chunk_size=CHUNK_SIZE, base_url=base_url).initialize_upload(self.file_path)
+            # A resume in the same process uses a new client
+            client = TusDataClient(chunk_size=CHUNK_SIZE, base_url=base_url)
+            self.assertTrue(client.resume_upload(self.file_path, endpoint))
+
+        self.assertIs(client.session, TusDataClient(base_url=base_url).session)
+        self.assertEqual(tus_stand_in.connections, 1)
@@ -0,0 +1,78 @@
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from floyd.client.tus_data import TusDataClient
+from tests.client.tus_stand_in import TusStandIn
+
+
+CHUNK_SIZE = 1024
+
+
+class TestTusDataClientShardedUpload(unittest.TestCase):
+    """
+    Tests sharded uploads, one TUS upload per shard, against a local TUS server
+    """
+    def setUp(self):
+        patcher = patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.shards = []
+        for index, size in enumerate([CHUNK_SIZE * 3 + 10, CHUNK_SIZE * 2, 10]):
+            file_path = os.path.join(temp_dir, 'floydhub_data_%s.tar.gz' % index)
+            data = os.urandom(size)
+            with open(file_path, 'wb') as f:
+                f.write(data)
+            self.shards.append((file_path, data))
+
+    def client(self, tus_stand_in):
+        return TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/')
+
+    def uploaded_data(self, tus_stand_in, upload_parts):
+        return [bytes(tus_stand_in.uploads[part['endpoint'].rsplit('/', 1)[-1]].data) for part in upload_parts]
+
+    def test_shards_are_uploaded_with_their_index(self):
+        with TusStandIn() as tus_stand_in:
+            client = self.client(tus_stand_in)
+            upload_parts = client.initialize_sharded_upload([path for path, _ in self.shards],
+                                                            metadata={'filename': 'data_id'})
+            self.assertTrue(client.parallel_upload(None, upload_parts, workers=2))
+
+        self.assertEqual(self.uploaded_data(tus_stand_in, upload_parts), [data for _, data in self.shards])
+        creations = [r for r in tus_stand_in.requests if r.method == 'POST']
+        self.assertEqual(len(creations), 3)
+        metadata = dict(pair.split(' ') for pair in creations[1].headers['Upload-Metadata'].split(','))
+        self.assertEqual(base64.b64decode(metadata['shard']), b'1')
+        self.assertEqual(base64.b64decode(metadata['shards']), b'3')
+        self.assertEqual(base64.b64decode(metadata['filename']), b'data_id')
+
+    def test_resume_only_sends_unfinished_shards(self):
+        offsets = {}
+
+        def save_offset(index, offset):
+            offsets[index] = offset
+
+        with TusStandIn(fail_patches=[5]) as tus_stand_in:
+            # Without retries the failed chunk interrupts the upload
+            client = self.client(tus_stand_in)
+            client.max_retries = 0
+            upload_parts = client.initialize_sharded_upload([path for path, _ in self.shards])
+            self.assertFalse(client.parallel_upload(None, upload_parts, on_progress=save_offset, workers=1))
+
+            # Resume from the offsets saved in .floyddata
+            for index, part in enumerate(upload_parts):
+                part['offset'] = offsets.get(index, 0)
+            del tus_stand_in.requests[:]
+
+            self.assertTrue(client.parallel_upload(None, upload_parts, on_progress=save_offset, workers=1))
+
+        self.assertEqual(self.uploaded_data(tus_stand_in, upload_parts), [data for _, data in self.shards])
+        # The first shard, 4 chunks, was sent entirely before the failure
+        first_endpoint = '/files/' + upload_parts[0]['endpoint'].rsplit('/', 1)[-1]
+        self.assertFalse([r for r in tus_stand_in.requests if r.path == first_endpoint])
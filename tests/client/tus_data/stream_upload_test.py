@@ -0,0 +1,110 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import unittest
+from mock import patch
+
+from floyd.client.files import DataCompressor, RingBuffer
+from floyd.client.tus_data import TusDataClient
+from tests.client.tus_stand_in import TusStandIn
+
+
+CHUNK_SIZE = 1024
+
+
+class TestTusDataClientStreamUpload(unittest.TestCase):
+    """
+    Tests TusDataClient.stream_upload against a local TUS server
+    """
+    def setUp(self):
+        for patcher in [patch('floyd.client.base.AuthConfigManager.get_auth_header', return_value='Bearer token'),
+                        patch('floyd.client.tus_data.time.sleep')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.data = os.urandom(CHUNK_SIZE * 5 + 100)
+
+    def upload(self, tus_stand_in, data, **kwargs):
+        client = TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/')
+        endpoint = client.initialize_upload()
+        result = client.stream_upload(io.BytesIO(data), endpoint, **kwargs)
+        return result, tus_stand_in.uploads[endpoint.rsplit('/', 1)[-1]]
+
+    def test_deferred_length_upload(self):
+        with TusStandIn() as tus_stand_in:
+            result, upload = self.upload(tus_stand_in, self.data)
+
+        self.assertTrue(result)
+        self.assertEqual(bytes(upload.data), self.data)
+        self.assertEqual(upload.length, len(self.data))
+        self.assertEqual(tus_stand_in.requests[0].headers['Upload-Defer-Length'], '1')
+        self.assertEqual(tus_stand_in.patches, 6)
+        # Only the last chunk declares the length
+        self.assertEqual(['Upload-Length' in r.headers for r in tus_stand_in.requests[1:]],
+                         [False] * 5 + [True])
+
+    def test_empty_stream(self):
+        with TusStandIn() as tus_stand_in:
+            result, upload = self.upload(tus_stand_in, b'')
+
+        self.assertTrue(result)
+        self.assertEqual(upload.length, 0)
+
+    def test_failed_chunk_is_resent_from_server_offset(self):
+        with TusStandIn(fail_patches=[3, 6]) as tus_stand_in:
+            result, upload = self.upload(tus_stand_in, self.data)
+
+        self.assertTrue(result)
+        self.assertEqual(bytes(upload.data), self.data)
+        self.assertEqual(upload.length, len(self.data))
+
+    def test_gives_up_when_server_offset_is_outside_spill_window(self):
+        with TusStandIn(fail_patches=[4]) as tus_stand_in:
+            client = TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/')
+            endpoint = client.initialize_upload()
+            upload = tus_stand_in.uploads[endpoint.rsplit('/', 1)[-1]]
+            original_get_offset = client._get_offset
+
+            def rewound_offset(*args, **kwargs):
+                # The server lost everything but the first chunk
+                del upload.data[CHUNK_SIZE:]
+                return original_get_offset(*args, **kwargs)
+
+            client._get_offset = rewound_offset
+            result = client.stream_upload(io.BytesIO(self.data), endpoint, spill_size=CHUNK_SIZE)
+
+        self.assertFalse(result)
+
+    def test_max_size(self):
+        with TusStandIn() as tus_stand_in:
+            result, _ = self.upload(tus_stand_in, self.data, max_size=CHUNK_SIZE * 2)
+
+        self.assertFalse(result)
+
+    def test_compressor_streams_through_ring_buffer(self):
+        source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_dir)
+        for i in range(20):
+            with open(os.path.join(source_dir, 'file_%d' % i), 'wb') as f:
+                f.write(os.urandom(CHUNK_SIZE))
+
+        with TusStandIn(fail_patches=[5]) as tus_stand_in:
+            client = TusDataClient(chunk_size=CHUNK_SIZE, base_url=tus_stand_in.url + '/files/')
+            endpoint = client.initialize_upload()
+            ring_buffer = RingBuffer(CHUNK_SIZE * 2)
+            result = []
+            uploader = threading.Thread(
+                target=lambda: result.append(client.stream_upload(ring_buffer, endpoint)))
+            uploader.start()
+            DataCompressor(source_dir, fileobj=ring_buffer, compress_workers=1).create_tarfile()
+            ring_buffer.close()
+            uploader.join()
+            upload = tus_stand_in.uploads[endpoint.rsplit('/', 1)[-1]]
+
+        self.assertEqual(result, [True])
+        self.assertEqual(upload.length, len(upload.data))
+        with tarfile.open(fileobj=io.BytesIO(bytes(upload.data)), mode='r:gz') as tar:
+            names = [name for name in tar.getnames() if '/' in name]
+        self.assertEqual(len(names), 20)
@@ -0,0 +1,88 @@
+import base64
+import hashlib
+import threading
+import uuid
+
+from tests.client.stand_in_server import StandInServer
+
+
+class TusUpload(object):
+    def __init__(self, length=None, partial=False):
+        self.length = length
+        self.partial = partial
+        self.data = bytearray()
+
+
+class TusStandIn(StandInServer):
+    """
+    Local TUS 1.0.0 server supporting the creation, deferred-length,
+    concatenation and checksum extensions. fail_patches lists the numbers of
+    PATCH requests (starting at 1) that store only half of their body and
+    then fail, corrupt_patches the ones whose body is corrupted in transit,
+    and the first locked_heads HEAD requests answer that the upload is
+    locked.
+    """
+
+    def __init__(self, fail_patches=(), locked_heads=0, corrupt_patches=()):
+        super(TusStandIn, self).__init__()
+        self.uploads = {}
+        self.fail_patches = set(fail_patches)
+        self.corrupt_patches = set(corrupt_patches)
+        self.locked_heads = locked_heads
+        self.patches = 0
+        self._uploads_lock = threading.Lock()
+
+    def handle(self, request):
+        if request.method == 'POST' and request.path == '/files/':
+            concat = request.headers.get('Upload-Concat', '')
+            if concat.startswith('final;'):
+                upload = TusUpload()
+                for url in concat[len('final;'):].split():
+                    part = self.uploads.get(url.rsplit('/', 1)[-1])
+                    if part is None or not part.partial or len(part.data) != part.length:
+                        return 400, {}, b'{"message": "Partial upload is not complete"}'
+                    upload.data += part.data
+                upload.length = len(upload.data)
+            elif request.headers.get('Upload-Defer-Length') == '1':
+                upload = TusUpload()
+            else:
+                upload = TusUpload(int(request.headers['Upload-Length']), partial=concat == 'partial')
+            upload_id = uuid.uuid4().hex
+            with self._uploads_lock:
+                self.uploads[upload_id] = upload
+            return 201, {'Location': '%s/files/%s' % (self.url, upload_id)}, b''
+
+        upload = self.uploads.get(request.path.rsplit('/', 1)[-1])
+        if upload is None:
+            return 404, {}, b''
+
+        if request.method == 'HEAD':
+            with self._uploads_lock:
+                self.locked_heads -= 1
+                if self.locked_heads >= 0:
+                    return 423, {}, b''
+            return 200, {'Upload-Offset': str(len(upload.data))}, b''
+
+        if request.method == 'PATCH':
+            with self._uploads_lock:
+                self.patches += 1
+                patch_number = self.patches
+            if int(request.headers['Upload-Offset']) != len(upload.data):
+                return 409, {}, b''
+            body = request.body
+            if patch_number in self.corrupt_patches:
+                body = b'x' + body[1:]
+            if 'Upload-Checksum' in request.headers:
+                algorithm, checksum = request.headers['Upload-Checksum'].split(' ')
+                if base64.b64encode(hashlib.new(algorithm, body).digest()).decode() != checksum:
+                    # Checksum Mismatch
+                    return 460, {}, b''
+            if 'Upload-Length' in request.headers:
+                upload.length = int(request.headers['Upload-Length'])
+            if patch_number in self.fail_patches:
+                upload.data += body[:len(body) // 2]
+                return 500, {}, b''
+            upload.data += body
+            return 204, {'Upload-Offset': str(len(upload.data))}, b''
+
+        return 405, {}, b''
@@ -0,0 +1,190 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from floyd.cli.utils import clone_resource
+from floyd.manager import clone_cache
+from floyd.manager.clone_cache import CloneCacheManager
+
+
+def write(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class TestCloneCacheManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.clone_dir = os.path.join(self.temp_dir, 'clone')
+        os.makedirs(self.clone_dir)
+        patcher = patch.object(CloneCacheManager, 'CACHE_DIR', self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cache(self, resource_id, files):
+        staging_dir = CloneCacheManager.create_staging_dir()
+        for path, content in files.items():
+            write(os.path.join(staging_dir, path), content)
+        CloneCacheManager.add(resource_id, staging_dir)
+
+    def test_cached_resource_is_materialized(self):
+        staging_dir = CloneCacheManager.create_staging_dir()
+        write(os.path.join(staging_dir, 'a.txt'), b'a')
+        write(os.path.join(staging_dir, 'dir', 'sub', 'b.txt'), b'bb')
+        os.makedirs(os.path.join(staging_dir, 'empty'))
+        os.symlink('a.txt', os.path.join(staging_dir, 'link'))
+        CloneCacheManager.add('resource', staging_dir)
+        write(os.path.join(self.clone_dir, 'a.txt'), b'replaced')
+
+        self.assertTrue(CloneCacheManager.materialize('resource', self.clone_dir))
+
+        self.assertEqual(read(os.path.join(self.clone_dir, 'a.txt')), b'a')
+        self.assertEqual(read(os.path.join(self.clone_dir, 'dir', 'sub', 'b.txt')), b'bb')
+        self.assertTrue(os.path.isdir(os.path.join(self.clone_dir, 'empty')))
+        self.assertEqual(os.readlink(os.path.join(self.clone_dir, 'link')), 'a.txt')
+
+    def test_cached_files_are_read_only(self):
+        self.cache('resource', {'a.txt': b'a', 'b.txt': b'b'})
+        with patch.object(clone_cache, 'LINK_METHODS', [('hardlink', clone_cache.hardlink)]):
+            self.assertTrue(CloneCacheManager.materialize('resource', self.clone_dir))
+
+        for path in [os.path.join(self.cache_dir, 'resource', 'a.txt'), os.path.join(self.clone_dir, 'a.txt')]:
+            self.assertEqual(os.stat(path).st_mode & 0o222, 0)
+        # Still valid, and removable
+        self.assertTrue(CloneCacheManager.materialize('resource', self.clone_dir))
+        CloneCacheManager.clear()
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'resource')))
+
+    def test_copied_files_are_writable(self):
+        self.cache('resource', {'a.txt': b'a'})
+        with patch.object(clone_cache, 'LINK_METHODS', [('copy', shutil.copy2)]):
+            self.assertTrue(CloneCacheManager.materialize('resource', self.clone_dir))
+
+        self.assertTrue(os.stat(os.path.join(self.clone_dir, 'a.txt')).st_mode & 0o200)
+        self.assertEqual(os.stat(os.path.join(self.cache_dir, 'resource', 'a.txt')).st_mode & 0o222, 0)
+
+    def test_unknown_resource(self):
+        self.assertFalse(CloneCacheManager.materialize('resource', self.clone_dir))
+
+    def test_unsupported_link_methods_fall_back_to_copy(self):
+        self.cache('resource', {'a.txt': b'a', 'b.txt': b'b'})
+        reflink = Mock(side_effect=OSError('unsupported'))
+        hardlink = Mock(side_effect=OSError('cross-device'))
+        with patch.object(clone_cache, 'LINK_METHODS',
+                          [('reflink', reflink), ('hardlink', hardlink), ('copy', shutil.copy2)]):
+            self.assertTrue(CloneCacheManager.materialize('resource', self.clone_dir))
+
+        self.assertEqual(read(os.path.join(self.clone_dir, 'b.txt')), b'b')
+        # Each method is only tried until it first fails
+        self.assertEqual(reflink.call_count, 1)
+        self.assertEqual(hardlink.call_count, 1)
+
+    def test_modified_entry_is_removed(self):
+        self.cache('resource', {'a.txt': b'a'})
+        # An in place write to a hardlinked clone made writable
+        os.chmod(os.path.join(self.cache_dir, 'resource', 'a.txt'), 0o644)
+        write(os.path.join(self.cache_dir, 'resource', 'a.txt'), b'changed')
+
+        self.assertFalse(CloneCacheManager.materialize('resource', self.clone_dir))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'resource')))
+        self.assertEqual(CloneCacheManager.entries(), [])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        CloneCacheManager.set_max_size(10)
+        for index, resource_id in enumerate(['first', 'second', 'third']):
+            self.cache(resource_id, {'data': b'1234'})
+            os.utime(os.path.join(self.cache_dir, resource_id + '.json'), (index, index))
+        CloneCacheManager.materialize('first', self.clone_dir)
+
+        CloneCacheManager.evict()
+
+        self.assertEqual(sorted(entry[0] for entry in CloneCacheManager.entries()), ['first', 'third'])
+
+    def test_entries_larger_than_the_cache_are_evicted_first(self):
+        CloneCacheManager.set_max_size(10)
+        self.cache('small', {'data': b'1234'})
+        self.cache('large', {'data': b'12345678901'})
+        os.utime(os.path.join(self.cache_dir, 'large.json'), (0, 0))
+
+        CloneCacheManager.evict()
+
+        self.assertEqual([entry[0] for entry in CloneCacheManager.entries()], ['small'])
+
+    def test_clone_resource_downloads_once(self):
+        client = Mock()
+
+        def download_tar(url, untar, delete_after_untar, destination_dir='.', filename=None):
+            write(os.path.join(destination_dir, 'data', 'a.txt'), b'a')
+            return True
+        client.download_tar.side_effect = download_tar
+
+        cwd = os.getcwd()
+        os.chdir(self.clone_dir)
+        try:
+            self.assertTrue(clone_resource(client, 'resource', 'http://host/resource'))
+            shutil.rmtree('data')
+            self.assertTrue(clone_resource(client, 'resource', 'http://host/resource'))
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(client.download_tar.call_count, 1)
+        self.assertEqual(read(os.path.join(self.clone_dir, 'data', 'a.txt')), b'a')
+        self.assertEqual([name for name in os.listdir(self.cache_dir) if name.startswith('.staging-')], [])
+
+    def test_cache_on_the_same_filesystem(self):
+        # Even before the cache directory exists
+        self.assertTrue(CloneCacheManager.on_filesystem_of(self.clone_dir))
+
+    def clone_uncached(self, filename=None, **kwargs):
+        client = Mock()
+        client.download_tar.return_value = True
+
+        self.assertTrue(clone_resource(client, 'resource', 'http://host/resource', **kwargs))
+
+        client.download_tar.assert_called_once_with(url='http://host/resource', untar=True, delete_after_untar=True,
+                                                    filename=filename)
+        self.assertEqual(CloneCacheManager.entries(), [])
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_resources_larger_than_the_cache_are_not_cached(self):
+        with patch.object(CloneCacheManager, 'get_max_size', return_value=10):
+            self.clone_uncached(size=11)
+
+    def test_cache_on_another_filesystem_is_not_used(self):
+        with patch.object(CloneCacheManager, 'on_filesystem_of', return_value=False):
+            self.clone_uncached(size=1)
+
+    def test_resumable_clone_downloads_to_disk(self):
+        with patch.object(CloneCacheManager, 'on_filesystem_of', return_value=False):
+            self.clone_uncached(filename='.floyd_clone_resource.tar', size=1, resumable=True)
+
+    def test_interrupted_clone_resumes_from_disk(self):
+        cwd = os.getcwd()
+        os.chdir(self.clone_dir)
+        try:
+            write(os.path.join(self.clone_dir, '.floyd_clone_resource.tar.part.json'),
+                  b'{"url": "http://host/resource"}')
+            with patch.object(CloneCacheManager, 'on_filesystem_of', return_value=False):
+                self.clone_uncached(filename='.floyd_clone_resource.tar', size=1)
+        finally:
+            os.chdir(cwd)
+
+    def test_failed_download_is_not_cached(self):
+        client = Mock()
+        client.download_tar.return_value = False
+
+        self.assertFalse(clone_resource(client, 'resource', 'http://host/resource'))
+        self.assertEqual(CloneCacheManager.entries(), [])
+        self.assertEqual(os.listdir(self.cache_dir), [])
@@ -0,0 +1,46 @@
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from floyd.manager.data_manifest import DataManifestManager
+
+
+class TestDataManifestManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        patcher = patch.object(DataManifestManager, 'MANIFEST_DIR', self.temp_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_unknown_dataset(self):
+        self.assertEqual(DataManifestManager.get_manifest('family'), (None, {}))
+
+    def test_pending_manifest_is_used_once_committed(self):
+        files = {'a.txt': {'size': 1, 'mtime': 2.0, 'sha256': 'abc'}}
+        DataManifestManager.set_pending_manifest('family', files)
+        self.assertEqual(DataManifestManager.get_manifest('family'), (None, {}))
+
+        DataManifestManager.commit_manifest('family', 'resource')
+        self.assertEqual(DataManifestManager.get_manifest('family'), ('resource', files))
+
+        # Committing again without a new pending manifest changes nothing
+        DataManifestManager.commit_manifest('family', 'other_resource')
+        self.assertEqual(DataManifestManager.get_manifest('family'), ('resource', files))
+
+    def test_discarded_pending_manifest_is_not_committed(self):
+        DataManifestManager.set_pending_manifest('family', {})
+        DataManifestManager.discard_pending_manifest('family')
+        DataManifestManager.commit_manifest('family', 'resource')
+
+        self.assertEqual(DataManifestManager.get_manifest('family'), (None, {}))
+
+    def test_datasets_without_family_id_are_not_tracked(self):
+        DataManifestManager.set_pending_manifest(None, {'a.txt': {}})
+        DataManifestManager.commit_manifest(None, 'resource')
+
+        self.assertEqual(DataManifestManager.get_manifest(None), (None, {}))
@@ -0,0 +1,60 @@
+import itertools
+import unittest
+
+from pathlib2 import PurePath
+
+from floyd.manager.floyd_ignore import FloydIgnoreMatcher
+
+PATHS = [
+    '.',
+    './README.md',
+    './hello.py',
+    './bar_dir',
+    './bar_dir/bar_data.h5',
+    './bar_dir/bar_dir_2/bar_file.py',
+    './bar_dir/bar_dir_2/bar_dir_3/bar_data.h5',
+    './baz_dir/baz_dir_2/baz_file.txt',
+    './.git/objects/ab/cdef',
+    './data/[weird].py',
+    './a.b/c?d',
+]
+
+GLOBS = [
+    '*', '*.py', '*.h5', 'bar_dir', 'bar_dir/', 'bar_dir/bar_dir_2', 'bar_dir/*',
+    '*/bar_file.py', 'baz_dir_?', '.git', '.git/objects', 'bar_dir/**/bar_data.h5',
+    '*.[ph][y5]', '[!b]*', '[b-c]ar_dir', '[weird].py', '[[]weird].py', 'a.b',
+    'c?d', '/hello.py', '', '.',
+]
+
+
+def reference_matches(path, globs):
+    for glob in globs:
+        try:
+            if PurePath(path).match(glob):
+                return True
+        except (TypeError, ValueError):
+            pass
+    return False
+
+
+class TestFloydIgnoreMatcher(unittest.TestCase):
+    """
+    Tests FloydIgnoreMatcher gives the same results as PurePath.match
+    """
+    def test_single_globs_match_like_pure_path(self):
+        for glob, path in itertools.product(GLOBS, PATHS):
+            matcher = FloydIgnoreMatcher([glob])
+            self.assertEqual(matcher.ignores(path), reference_matches(path, [glob]),
+                             "glob %r, path %r" % (glob, path))
+
+    def test_whitelist_overrides_ignore_list(self):
+        matcher = FloydIgnoreMatcher(GLOBS[:12], ['bar_file.py', '*.txt'])
+        for path in PATHS:
+            expected = reference_matches(path, GLOBS[:12]) and not reference_matches(path, ['bar_file.py', '*.txt'])
+            self.assertEqual(matcher.ignores(path), expected, path)
+
+    def test_unpacks_as_lists(self):
+        ignore_list, whitelist = FloydIgnoreMatcher(['*.py'], ['hello.py'])
+        self.assertEqual(ignore_list, ['*.py'])
+        self.assertEqual(whitelist, ['hello.py'])
+        self.assertFalse(FloydIgnoreMatcher().ignores('./hello.py'))